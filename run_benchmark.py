@@ -0,0 +1,45 @@
+# run_benchmark.py
+
+import argparse
+import json
+import sys
+from src.benchmark import run_benchmarks, write_results, format_results
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the CSV Ingestion Engine on generated data.")
+    parser.add_argument("--config", type=str, help="Path to config.json", default="config/config.json")
+    parser.add_argument("--sizes", type=str, help="Comma-separated row counts", default="10000,100000")
+    parser.add_argument("--db", type=str, choices=["stub", "postgres"], help="In-process stand-in or the configured database", default="stub")
+    parser.add_argument("--table", type=str, help="Table to write to in postgres mode (default: db_config table)", default=None)
+    parser.add_argument("--repeat", type=int, help="Runs per size; the fastest is reported", default=1)
+    parser.add_argument("--rows-per-group", type=int, help="Mean rows per sort_key group", default=3)
+    parser.add_argument("--error-rate", type=str, help="Error rate for every rule, or a JSON object of rates by rule", default="0.02")
+    parser.add_argument("--extra-cols", type=int, help="Columns not in the schema", default=1)
+    parser.add_argument("--null-ratio", type=float, help="Share of null cells in optional columns", default=0.05)
+    parser.add_argument("--seed", type=int, help="Random seed for the generated data", default=0)
+    parser.add_argument("--trace-allocations", action="store_true", help="Add a tracemalloc run per size")
+    parser.add_argument("--output", type=str, help="Results file (default: logs/BENCHMARK_<time>.json)", default=None)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    try:
+        args = parse_args()
+        try:
+            error_rate = float(args.error_rate)
+        except ValueError:
+            error_rate = json.loads(args.error_rate)
+        results = run_benchmarks(
+            config_path=args.config,
+            sizes=[int(size) for size in args.sizes.split(",")],
+            db_mode=args.db,
+            table=args.table,
+            repeat=args.repeat,
+            trace_allocations=args.trace_allocations,
+            generator_options={"rows_per_group": args.rows_per_group, "error_rate": error_rate,
+                               "extra_cols": args.extra_cols, "null_ratio": args.null_ratio, "seed": args.seed}
+        )
+        print(format_results(results))
+        print(f"Benchmark results written to {write_results(results, args.output)}")
+    except Exception as e:
+        print(f"Critical error: {e}")
+        sys.exit(1)
@@ -1,20 +1,35 @@
 # run_ingestor.py
 
 import argparse
+import os
 import sys
 from src.main import main, initialize_config
+from src.db_pool import close_pool
+from src.batch import run_batch, BATCH_FAILED_STATUSES
+from src.daemon import run_daemon
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Run the CSV Ingestion Engine.")
-    parser.add_argument("--csv", type=str, help="Path to CSV file", default="")
+    parser.add_argument("--csv", type=str, nargs="+", help="Path to CSV file, or several files, directories and glob patterns for batch mode", default=[""])
     parser.add_argument("--config", type=str, help="Path to config.json", default="config/config.json")
+    parser.add_argument("--watch", type=str, help="Daemon mode: ingest files as they land in this inbox directory until stopped", default=None)
+    parser.add_argument("--workers", type=int, help="Batch and daemon modes: worker processes (default: runtime_config batch_workers / watch_workers)", default=None)
+    parser.add_argument("--pattern", type=str, help="Batch and daemon modes: files to take from directories (default: runtime_config batch_pattern)", default=None)
     return parser.parse_args()
 
 if __name__ == "__main__":
     try:
         args = parse_args()
-        configs = initialize_config(config_path=args.config)
-        main(csv_path=args.csv, runtime_context=configs)
+        if args.watch is not None:
+            run_daemon(args.config, args.watch, args.workers, args.pattern)
+        elif len(args.csv) == 1 and args.workers is None and not os.path.isdir(args.csv[0]) and not any(c in args.csv[0] for c in "*?["):
+            configs = initialize_config(config_path=args.config)
+            main(csv_path=args.csv[0], runtime_context=configs)
+            close_pool(configs["db_pool"])
+        else:
+            summary = run_batch(args.config, args.csv, args.workers, args.pattern)
+            if any(status in BATCH_FAILED_STATUSES for status in summary["statuses"]):
+                sys.exit(1)
     except Exception as e:
         print(f"Critical error: {e}")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
@@ -0,0 +1,141 @@
+# batch.py
+
+import os
+import glob
+import json
+import time
+import uuid
+import multiprocessing.util
+from datetime import datetime
+from concurrent.futures import as_completed
+from src.main import main, initialize_config, initialize_schema
+from src.metrics import build_metrics_record
+from src.db_pool import close_pool
+from src.process_pool import open_process_pool
+
+# statuses of a file that did not go into the database
+BATCH_FAILED_STATUSES = ("crashed", "aborted", "failed")
+
+def collect_inputs(paths, pattern="*.csv*"):
+    """
+    Expand files, directories and glob patterns into (path, size) pairs, largest first.
+    """
+    found = {}
+    for path in paths:
+        if os.path.isdir(path):
+            matches = glob.glob(os.path.join(path, pattern))
+        elif os.path.isfile(path):
+            matches = [path]
+        else:
+            matches = glob.glob(path, recursive=True)
+            if not matches:
+                print(f"No files match {path}")
+        for match in matches:
+            if os.path.isfile(match):
+                found.setdefault(os.path.abspath(match), os.path.getsize(match))
+    if not found:
+        raise ValueError(f"no input files found in {', '.join(paths)}")
+    return sorted(found.items(), key=lambda item: (-item[1], item[0]))
+
+def run_batch(config_path, paths, workers=None, pattern=None):
+    """
+    Ingest every input file as its own session across worker processes; returns the batch summary.
+    """
+    with open(config_path, "r") as f:
+        config = json.load(f)
+    runtime_config = config["runtime_config"]
+    workers = workers or runtime_config.get("batch_workers", 1)
+    inputs = collect_inputs(paths, pattern or runtime_config.get("batch_pattern", "*.csv*"))
+    batch = {"batch_id": str(uuid.uuid4()), "started": datetime.now().isoformat(),
+             "started_wall": time.perf_counter(), "workers": workers, "results": {}}
+    print(f"Batch {batch['batch_id']}: {len(inputs)} files, {sum(size for _, size in inputs)} bytes, {workers} workers")
+
+    if workers == 1:
+        _start_worker(config_path)
+        try:
+            for csv_path, size in inputs:
+                _record_result(batch, _ingest_file(csv_path, size))
+        finally:
+            close_pool(_worker_context["runtime_context"]["db_pool"])
+    else:
+        with open_process_pool(workers, initializer=_start_pool_worker, initargs=(config_path,)) as pool:
+            futures = {pool.submit(_ingest_file, csv_path, size): (csv_path, size) for csv_path, size in inputs}
+            for future in as_completed(futures):
+                csv_path, size = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = failed_result(csv_path, size, e)
+                _record_result(batch, result)
+
+    summary = build_batch_summary(batch, [csv_path for csv_path, _ in inputs])
+    summary_path = runtime_config["log_config"].get("batch_summary_filename", "logs/{batch_id}_BATCH.json").format(batch_id=batch["batch_id"])
+    with open(summary_path, mode="w") as f:
+        json.dump(summary, f, indent=4)
+    print(f"Batch complete: {json.dumps(summary['statuses'])}, {summary['rows_out']} of {summary['rows_in']} rows written "
+          f"in {summary['wall_seconds']:.1f}s\nBatch Summary Written: {summary_path}")
+    return summary
+
+def build_batch_summary(batch, input_order):
+    """
+    Status counts, totals and per-file results of the batch, in hand-out order.
+    """
+    results = [batch["results"][csv_path] for csv_path in input_order]
+    statuses = {}
+    for result in results:
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    wall_seconds = time.perf_counter() - batch["started_wall"]
+    rows_in = sum(result["rows_in"] for result in results)
+    return {
+        "batch_id": batch["batch_id"],
+        "started": batch["started"],
+        "finished": datetime.now().isoformat(),
+        "wall_seconds": round(wall_seconds, 4),
+        "workers": batch["workers"],
+        "files": len(results),
+        "bytes": sum(result["bytes"] for result in results),
+        "statuses": statuses,
+        "rows_in": rows_in,
+        "rows_out": sum(result["rows_out"] for result in results),
+        "rows_per_sec": round(rows_in / wall_seconds) if wall_seconds else 0,
+        "file_results": results
+    }
+
+def failed_result(csv_path, size, error):
+    # the result of a file whose worker could not start (no database) or died
+    return {"csv_path": csv_path, "bytes": size, "session_id": None, "status": "failed",
+            "wall_seconds": 0.0, "rows_in": 0, "rows_out": 0, "worker": None, "error": str(error)}
+
+def _record_result(batch, result):
+    batch["results"][result["csv_path"]] = result
+    print(f"[{len(batch['results'])}] {result['status']}: {result['csv_path']} ({result['rows_out']} of {result['rows_in']} rows, "
+          f"{result['wall_seconds']:.2f}s)")
+
+# per worker process: the runtime context every file of the worker runs with
+_worker_context = {}
+
+def _start_worker(config_path):
+    runtime_context = initialize_config(config_path)
+    initialize_schema(runtime_context["schema_path"])
+    _worker_context["runtime_context"] = runtime_context
+
+def _start_pool_worker(config_path):
+    # a worker process has no finally around its files: its database pool is closed as the process exits
+    _start_worker(config_path)
+    multiprocessing.util.Finalize(None, close_pool, args=(_worker_context["runtime_context"]["db_pool"],), exitpriority=10)
+
+def _ingest_file(csv_path, size):
+    runtime_context = _worker_context["runtime_context"]
+    main(csv_path, runtime_context)
+    metrics_record = build_metrics_record(runtime_context["runtime_config"])
+    return {
+        "csv_path": csv_path,
+        "bytes": size,
+        "session_id": metrics_record["session_id"],
+        "status": metrics_record["status"],
+        "wall_seconds": metrics_record["wall_seconds"],
+        "rows_in": metrics_record["rows_in"],
+        "rows_out": metrics_record["rows_out"],
+        "worker": os.getpid(),
+        "error": None
+    }
@@ -0,0 +1,247 @@
+# benchmark.py
+
+import os
+import io
+import sys
+import json
+import copy
+import time
+import uuid
+import shutil
+import platform
+import tempfile
+import threading
+import tracemalloc
+import contextlib
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from psycopg2.extensions import adapt
+import src.main as pipeline
+from src.data_generator import write_data
+from src.file_loader import load_csv
+from src.validator import validate_data
+from src.db_writer import write_to_db
+from src.db_pool import close_pool
+from src.row_index import open_row_indexes
+from src.logger import write_to_logs, build_log_profile, open_log_sinks, log_library
+from src.validation_stats import new_validation_stats
+from src.metrics import peak_rss_kb, reset_peak_rss, build_metrics_record
+
+# stages timed for every size, in pipeline order; "pipeline" is a full main.main() run
+BENCHMARK_STAGES = ["load_csv", "validate_data", "write_to_db", "write_to_logs", "pipeline"]
+
+def run_benchmarks(config_path="config/config.json", sizes=(10000, 100000), db_mode="stub", table=None,
+                   repeat=1, trace_allocations=False, generator_options=None):
+    """
+    Generate a CSV per size, time every stage on it and return the results document.
+    """
+    with open(config_path, "r") as f:
+        config = json.load(f)
+    with open(config["schema_path"], "r") as f:
+        schema = json.load(f)
+    generator_options = generator_options or {}
+    started = datetime.now().isoformat()
+    work_dir = tempfile.mkdtemp(prefix="ingestion_benchmark_")
+    if db_mode == "postgres":
+        runtime_context = pipeline.initialize_config(config_path)
+    else:
+        runtime_context = {"runtime_config": config["runtime_config"], "db_config": config["db_config"],
+                           "schema_path": config["schema_path"], "db_pool": open_stub_pool()}
+    if table:
+        runtime_context["db_config"]["table"] = table
+    log_config = runtime_context["runtime_config"]["log_config"]
+    log_config["log_filename"] = os.path.join(work_dir, "{session_id}_{log_type}_LOG.csv")
+    log_config["stats_filename"] = os.path.join(work_dir, "{session_id}_STATS.{file_type}")
+    log_config["metrics_filename"] = os.path.join(work_dir, "{session_id}_METRICS.{file_type}")
+    if log_config.get("quarantine_filename", "logs/{session_id}_QUARANTINE.{file_type}"):
+        log_config["quarantine_filename"] = os.path.join(work_dir, "{session_id}_QUARANTINE.{file_type}")
+
+    results = []
+    try:
+        for rows in sizes:
+            csv_path = os.path.join(work_dir, f"benchmark_{rows}.csv")
+            write_data(csv_path, schema, rows, **generator_options)
+            stage_records = {}
+            for run_number in range(repeat + (1 if trace_allocations else 0)):
+                traced = trace_allocations and run_number == repeat
+                for stage, record in benchmark_run(runtime_context, csv_path, traced).items():
+                    best = stage_records.get(stage)
+                    if traced:
+                        best["traced_peak_mb"] = record["traced_peak_mb"]
+                    elif best is None or record["seconds"] < best["seconds"]:
+                        stage_records[stage] = record
+            results.append({"rows": rows, "stages": stage_records})
+    finally:
+        if db_mode == "postgres":
+            close_pool(runtime_context["db_pool"])
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "started": started,
+        "config_path": config_path,
+        "db_mode": db_mode,
+        "repeat": repeat,
+        "generator": {"rows_per_group": 3, "error_rate": 0.0, "extra_cols": 0, "null_ratio": 0.0, "seed": 0, **generator_options},
+        "runtime_config": {key: value for key, value in runtime_context["runtime_config"].items() if key != "log_config"},
+        "environment": {"python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+                        "platform": platform.platform(), "cpu_count": os.cpu_count()},
+        "results": results
+    }
+
+def benchmark_run(runtime_context, csv_path, trace_allocations=False):
+    """
+    Time each stage, then the whole pipeline, over csv_path; returns {stage: measurement}.
+    """
+    runtime_config = copy.deepcopy(runtime_context["runtime_config"])
+    runtime_config["session_id"] = str(uuid.uuid4())
+    runtime_config["csv_path"] = csv_path
+    runtime_config["log_config"]["log_profile"] = build_log_profile(runtime_config["log_config"])
+    schema = pipeline.initialize_schema(runtime_context["schema_path"])
+    runtime_config["log_sinks"] = open_log_sinks(runtime_config)
+    runtime_config["validation_stats"] = new_validation_stats(schema, runtime_config.get("stats_sample_size", 10))
+    db_config, db_pool = runtime_context["db_config"], runtime_context["db_pool"]
+    runtime_config["row_indexes"] = open_row_indexes(runtime_config, schema, db_config, db_pool)
+    records = {}
+
+    raw_data, records["load_csv"] = measure_stage(
+        lambda: load_csv(runtime_config, schema), None, _frame_rows, trace_allocations)
+    rows_loaded = _frame_rows(raw_data)
+    cleaned_data, records["validate_data"] = measure_stage(
+        lambda: validate_data(runtime_config, schema, raw_data), rows_loaded, _frame_rows, trace_allocations)
+    _, records["write_to_db"] = measure_stage(
+        lambda: write_to_db(runtime_config, db_config, cleaned_data, db_pool), len(cleaned_data),
+        lambda written: len(cleaned_data) if written else 0, trace_allocations)
+    # the final flush; rows here are the session's log entries
+    log_sinks = runtime_config["log_sinks"]
+    _, records["write_to_logs"] = measure_stage(
+        lambda: write_to_logs(runtime_config), None,
+        lambda _: sum(log_sinks["counts"][log_type] for log_type in log_library), trace_allocations)
+    records["write_to_logs"]["rows_in"] = records["write_to_logs"]["rows_out"]
+
+    pipeline_context = dict(runtime_context, runtime_config=copy.deepcopy(runtime_context["runtime_config"]))
+    _, records["pipeline"] = measure_stage(
+        lambda: pipeline.main(csv_path, pipeline_context), rows_loaded,
+        lambda _: pipeline_context["runtime_config"]["validation_stats"]["rows"]["accepted"], trace_allocations)
+    records["load_csv"]["rows_in"] = records["pipeline"]["rows_in"] = rows_loaded
+    # where the full run spent its time, from the session's own metrics
+    records["pipeline"]["stages"] = build_metrics_record(pipeline_context["runtime_config"])["stages"]
+    for record in records.values():
+        record["rows_per_sec"] = round(record["rows_in"] / record["seconds"]) if record["seconds"] else None
+    return records
+
+def measure_stage(run_stage, rows_in, count_rows_out, trace_allocations=False):
+    """
+    Run run_stage() silently; returns its result and the wall, CPU, RSS and allocation measurement.
+    """
+    reset_peak_rss()
+    blocks_before = sys.getallocatedblocks()
+    if trace_allocations:
+        tracemalloc.start()
+    wall_started, cpu_started = time.perf_counter(), time.process_time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run_stage()
+    record = {"seconds": round(time.perf_counter() - wall_started, 4),
+              "cpu_seconds": round(time.process_time() - cpu_started, 4)}
+    if trace_allocations:
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        record["traced_peak_mb"] = round(traced_peak / 2**20, 1)
+    record.update(rows_in=rows_in, rows_out=count_rows_out(result),
+                  peak_rss_mb=round(peak_rss_kb() / 1024, 1),
+                  net_allocated_blocks=sys.getallocatedblocks() - blocks_before)
+    return result, record
+
+def _frame_rows(frame):
+    return len(frame) if frame is not None else 0
+
+def write_results(results, output_path=None):
+    output_path = output_path or f"logs/BENCHMARK_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output_path, mode="w") as f:
+        json.dump(results, f, indent=4)
+    return output_path
+
+def format_results(results):
+    lines = [f"{'rows':>10}  {'stage':<14}{'seconds':>9}{'rows/sec':>12}{'peak MB':>9}"]
+    for size_result in results["results"]:
+        for stage in BENCHMARK_STAGES:
+            record = size_result["stages"][stage]
+            lines.append(f"{size_result['rows']:>10}  {stage:<14}{record['seconds']:>9.3f}"
+                         f"{record['rows_per_sec'] or 0:>12}{record['peak_rss_mb']:>9.1f}")
+    return "\n".join(lines)
+
+# In-process stand-in for the database, used by db_mode "stub". It is a db_pool dict (see
+# db_pool.py) whose connections accept COPY and INSERT statements and discard the payload
+# after reading it, so the writer's own serialisation cost is measured without a server.
+
+def open_stub_pool():
+    return {
+        "pool": StubPool(),
+        "idle_timeout": float("inf"),
+        "health_check": float("inf"),
+        "returned_at": {},
+        "lock": threading.Lock()
+    }
+
+class StubPool:
+    def getconn(self):
+        return StubConnection()
+
+    def putconn(self, conn, close=False):
+        conn.close()
+
+    def closeall(self):
+        pass
+
+class StubConnection:
+    encoding = "UTF8"
+
+    def __init__(self):
+        self.closed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set_client_encoding(self, encoding):
+        self.encoding = encoding
+
+    def cursor(self):
+        return StubCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+class StubCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.bytes_received = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def copy_expert(self, sql, file):
+        self.bytes_received += len(file.read())
+
+    def execute(self, sql, args=None):
+        self.bytes_received += len(sql)
+
+    def mogrify(self, template, args):
+        quoted = []
+        for value in args:
+            adapted = adapt(value)
+            if hasattr(adapted, "encoding"):
+                adapted.encoding = "utf8"
+            quoted.append(adapted.getquoted())
+        return b"(" + b",".join(quoted) + b")"
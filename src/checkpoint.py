@@ -0,0 +1,107 @@
+# checkpoint.py
+
+import hashlib
+from src.db_pool import get_connection, put_connection
+from src.db_writer import write_to_db
+from src.logger import log_event
+
+# one row per (file, destination table); updated in the same transaction as the rows it covers
+CHECKPOINT_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS {checkpoint_table} (
+    fingerprint TEXT NOT NULL,
+    dest_table TEXT NOT NULL,
+    csv_path TEXT,
+    next_source_index BIGINT NOT NULL,
+    last_sort_key TEXT,
+    rows_written BIGINT NOT NULL,
+    complete BOOLEAN NOT NULL,
+    session_id TEXT,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (fingerprint, dest_table)
+);
+"""
+
+def file_fingerprint(csv_path, block_size=1 << 20):
+    # content hash of the file; a resumed run must read exactly the bytes the first run read
+    digest = hashlib.blake2b(digest_size=20)
+    with open(csv_path, "rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+def open_checkpoint(runtime_config, db_config, db_pool, fingerprint=None):
+    """
+    Read (or start) the checkpoint of runtime_config["csv_path"] for db_config["table"].
+    """
+    checkpoint_table = runtime_config.get("checkpoint_table", "ingestion_checkpoints")
+    checkpoint = {
+        "fingerprint": fingerprint or file_fingerprint(runtime_config["csv_path"]),
+        "dest_table": db_config["table"],
+        "csv_path": runtime_config["csv_path"],
+        "next_source_index": 0,
+        "last_sort_key": None,
+        "rows_written": 0,
+        "complete": False,
+        "session_id": runtime_config["session_id"]
+    }
+    conn = get_connection(db_pool)
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(CHECKPOINT_TABLE_DDL.format(checkpoint_table=checkpoint_table))
+                cur.execute(f"SELECT next_source_index, last_sort_key, rows_written, complete FROM {checkpoint_table} "
+                            "WHERE fingerprint = %s AND dest_table = %s;",
+                            (checkpoint["fingerprint"], checkpoint["dest_table"]))
+                saved = cur.fetchone()
+    finally:
+        put_connection(db_pool, conn)
+    if saved is not None:
+        checkpoint.update(zip(("next_source_index", "last_sort_key", "rows_written", "complete"), saved))
+    return checkpoint
+
+def save_checkpoint(cur, checkpoint_table, checkpoint):
+    cur.execute(f"""
+        INSERT INTO {checkpoint_table}
+            (fingerprint, dest_table, csv_path, next_source_index, last_sort_key, rows_written, complete, session_id, updated_at)
+        VALUES (%(fingerprint)s, %(dest_table)s, %(csv_path)s, %(next_source_index)s, %(last_sort_key)s,
+                %(rows_written)s, %(complete)s, %(session_id)s, now())
+        ON CONFLICT (fingerprint, dest_table) DO UPDATE SET
+            csv_path = EXCLUDED.csv_path,
+            next_source_index = EXCLUDED.next_source_index,
+            last_sort_key = EXCLUDED.last_sort_key,
+            rows_written = EXCLUDED.rows_written,
+            complete = EXCLUDED.complete,
+            session_id = EXCLUDED.session_id,
+            updated_at = now();
+        """, checkpoint)
+
+def write_checkpointed(runtime_config, db_config, validated_groups, checkpoint, db_pool, before_frame=None):
+    """
+    Commit each run of accepted groups together with the checkpoint it reaches.
+    """
+    checkpoint_table = runtime_config.get("checkpoint_table", "ingestion_checkpoints")
+    for accepted_rows, progress in validated_groups:
+        reached = dict(checkpoint, complete=progress["complete"], session_id=runtime_config["session_id"])
+        if progress["next_source_index"] is not None:
+            reached.update(next_source_index=progress["next_source_index"], last_sort_key=progress["last_sort_key"])
+
+        def commit_checkpoint(cur, rows_written):
+            # rows the server refused (isolate_write_errors) are not counted
+            reached["rows_written"] = checkpoint["rows_written"] + rows_written
+            save_checkpoint(cur, checkpoint_table, reached)
+
+        written = write_to_db(runtime_config, db_config, accepted_rows if accepted_rows is not None else [], db_pool,
+                              in_transaction=commit_checkpoint, before_frame=before_frame)
+        if not written:
+            raise RuntimeError(f"write to {db_config['table']} failed after row {checkpoint['next_source_index']}; "
+                               "rerun to resume from there")
+        checkpoint.update(reached)
+
+    log_event(runtime_config, {
+        "message": f"{checkpoint['csv_path']} complete: {checkpoint['rows_written']} rows written to "
+                   f"{checkpoint['dest_table']} (checkpoint {checkpoint['fingerprint']})",
+        "log_type": "EVENT",
+        "log_class": "procedure_status",
+        "called_by": "checkpoint.py"
+        })
+    return True
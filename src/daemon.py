@@ -0,0 +1,297 @@
+# daemon.py
+
+import os
+import sys
+import json
+import time
+import uuid
+import errno
+import ctypes
+import ctypes.util
+import fnmatch
+import select
+import signal
+import socket
+import struct
+from datetime import datetime
+from concurrent.futures.process import BrokenProcessPool
+from src.batch import _start_pool_worker, _ingest_file, failed_result, BATCH_FAILED_STATUSES
+from src.registry import owner_alive
+from src.process_pool import open_process_pool
+
+# subdirectories of the inbox: files being ingested (under the claiming host's name), and files whose session has ended
+CLAIMED_DIR = "processing"
+DONE_DIR = "done"
+FAILED_DIR = "failed"
+
+# inotify event masks (see inotify(7)): a file written and closed, a file renamed into the directory,
+# and the kernel's event queue overflowing
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+INOTIFY_EVENT = struct.Struct("iIII")
+
+def run_daemon(config_path, inbox, workers=None, pattern=None):
+    """
+    Ingest the files that land in inbox until SIGINT or SIGTERM; returns the daemon summary.
+    """
+    with open(config_path, "r") as f:
+        config = json.load(f)
+    runtime_config = config["runtime_config"]
+    workers = workers or runtime_config.get("watch_workers", 1)
+    pattern = pattern or runtime_config.get("batch_pattern", "*.csv*")
+    poll_seconds = runtime_config.get("watch_poll_seconds", 2.0)
+    for subdir in (os.path.join(CLAIMED_DIR, socket.gethostname()), DONE_DIR, FAILED_DIR):
+        os.makedirs(os.path.join(inbox, subdir), exist_ok=True)
+    release_claims(inbox)
+
+    daemon = {"daemon_id": str(uuid.uuid4()), "started": datetime.now().isoformat(), "inbox": os.path.abspath(inbox),
+              "workers": workers, "statuses": {}, "files": 0, "rows_in": 0, "rows_out": 0, "latency_seconds": []}
+    daemon_log = runtime_config["log_config"].get("daemon_log_filename", "logs/{daemon_id}_DAEMON.jsonl").format(daemon_id=daemon["daemon_id"])
+    inotify_fd = open_inotify(inbox) if runtime_config.get("watch_inotify", True) else None
+    print(f"Daemon {daemon['daemon_id']}: watching {daemon['inbox']} for {pattern} "
+          f"({'inotify' if inotify_fd is not None else 'polling'} every {poll_seconds}s), {workers} workers")
+
+    # signals and finished sessions wake the loop through a pipe; see _wake
+    wake_read, wake_write = os.pipe()
+    os.set_blocking(wake_read, False)
+    os.set_blocking(wake_write, False)
+    stopping = []
+    previous_handlers = {signum: signal.signal(signum, lambda signum, frame: stopping.append(signum))
+                         for signum in (signal.SIGINT, signal.SIGTERM)}
+    previous_wakeup_fd = signal.set_wakeup_fd(wake_write)
+
+    arrived = {}      # path: arrival time, for files ready to be claimed, in arrival order
+    scanned = {}      # path: (size, mtime_ns) at the last scan, for files not yet stable
+    running = {}      # future: (path, claimed_path, arrived_at, claimed_at, pool)
+    pool = _open_pool(workers, config_path)
+    next_scan = 0.0
+    try:
+        while not stopping or running:
+            if not stopping and time.monotonic() >= next_scan:
+                scan_inbox(inbox, pattern, scanned, arrived)
+                next_scan = time.monotonic() + poll_seconds
+            for future in [future for future in running if future.done()]:
+                claim = running.pop(future)
+                _record_file(daemon, daemon_log, _finish_file(claim[:4], future))
+                if isinstance(future.exception(), BrokenProcessPool) and claim[4] is pool:
+                    # a worker died; its pool takes no more work
+                    pool.shutdown(wait=True)
+                    pool = _open_pool(workers, config_path)
+            while not stopping and arrived and len(running) < workers:
+                path, arrived_at = next(iter(arrived.items()))
+                del arrived[path]
+                claimed_path = claim_inbox_file(inbox, path)
+                if claimed_path is None:
+                    continue
+                future = pool.submit(_ingest_claimed, claimed_path, os.path.getsize(claimed_path))
+                running[future] = (path, claimed_path, arrived_at, time.time(), pool)
+                future.add_done_callback(lambda _: _wake(wake_write))
+
+            if stopping and not running:
+                break
+            watched = [wake_read] + ([inotify_fd] if inotify_fd is not None and not stopping else [])
+            ready, _, _ = select.select(watched, [], [], max(0.0, next_scan - time.monotonic()) if not stopping else None)
+            if wake_read in ready:
+                _drain(wake_read)
+            if inotify_fd in ready:
+                names, overflowed = read_inotify(inotify_fd)
+                if overflowed:
+                    next_scan = 0.0
+                for name in names:
+                    path = os.path.join(inbox, name)
+                    if not _wanted(name, pattern):
+                        continue
+                    try:
+                        arrived_at = os.stat(path).st_ctime
+                    except FileNotFoundError:
+                        continue
+                    scanned.pop(path, None)
+                    arrived.setdefault(path, arrived_at)
+    finally:
+        pool.shutdown(wait=True)
+        signal.set_wakeup_fd(previous_wakeup_fd)
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+        for fd in (wake_read, wake_write, inotify_fd):
+            if fd is not None:
+                os.close(fd)
+
+    summary = build_daemon_summary(daemon)
+    print(f"Daemon stopped: {summary['files']} files, {json.dumps(summary['statuses'])}, "
+          f"{summary['rows_out']} of {summary['rows_in']} rows written, latency median {summary['latency_p50_seconds']}s "
+          f"max {summary['latency_max_seconds']}s; {len(arrived)} files left in the inbox\n"
+          f"Daemon Log Written: {daemon_log}")
+    return summary
+
+def scan_inbox(inbox, pattern, scanned, arrived):
+    # files of inbox matching pattern join arrived once their size and mtime held still for one scan
+    unstable = {}
+    for entry in os.scandir(inbox):
+        if not _wanted(entry.name, pattern) or entry.path in arrived:
+            continue
+        try:
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        if scanned.get(entry.path) == (stat.st_size, stat.st_mtime_ns):
+            arrived[entry.path] = stat.st_ctime
+        else:
+            unstable[entry.path] = (stat.st_size, stat.st_mtime_ns)
+    # files that were claimed elsewhere or removed are forgotten
+    scanned.clear()
+    scanned.update(unstable)
+
+def claim_inbox_file(inbox, path):
+    """
+    Move path into inbox/processing/<host> as "<pid>-<name>"; None if another daemon took it first.
+    """
+    claimed_path = os.path.join(inbox, CLAIMED_DIR, socket.gethostname(), f"{os.getpid()}-{os.path.basename(path)}")
+    try:
+        os.rename(path, claimed_path)
+    except FileNotFoundError:
+        return None
+    return claimed_path
+
+def release_claims(inbox):
+    # files claimed by daemons of this host that are no longer running go back to the inbox;
+    # the claims of other hosts are theirs to release
+    host = socket.gethostname()
+    for entry in os.scandir(os.path.join(inbox, CLAIMED_DIR, host)):
+        pid, _, name = entry.name.partition("-")
+        if not pid.isdigit() or not name or owner_alive(host, pid):
+            continue
+        try:
+            os.rename(entry.path, os.path.join(inbox, name))
+            print(f"Released claim of stopped daemon {pid} on {name}")
+        except FileNotFoundError:
+            pass
+
+def build_daemon_summary(daemon):
+    latencies = sorted(daemon["latency_seconds"])
+    return {
+        "daemon_id": daemon["daemon_id"],
+        "inbox": daemon["inbox"],
+        "started": daemon["started"],
+        "stopped": datetime.now().isoformat(),
+        "workers": daemon["workers"],
+        "files": daemon["files"],
+        "statuses": daemon["statuses"],
+        "rows_in": daemon["rows_in"],
+        "rows_out": daemon["rows_out"],
+        "latency_p50_seconds": round(latencies[len(latencies) // 2], 4) if latencies else None,
+        "latency_max_seconds": round(latencies[-1], 4) if latencies else None
+    }
+
+def open_inotify(directory):
+    """
+    A non-blocking inotify descriptor on directory, or None where inotify is not available.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        inotify_fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if inotify_fd < 0:
+        return None
+    if libc.inotify_add_watch(inotify_fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        print(f"inotify unavailable for {directory} ({os.strerror(ctypes.get_errno())}); scanning only")
+        os.close(inotify_fd)
+        return None
+    return inotify_fd
+
+def read_inotify(inotify_fd):
+    # the names of the files in the pending events, and whether events were lost to an overflow
+    names = []
+    overflowed = False
+    while True:
+        try:
+            events = os.read(inotify_fd, 65536)
+        except BlockingIOError:
+            break
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                continue
+            raise
+        offset = 0
+        while offset < len(events):
+            _, mask, _, name_length = INOTIFY_EVENT.unpack_from(events, offset)
+            offset += INOTIFY_EVENT.size
+            name = events[offset:offset + name_length].rstrip(b"\0")
+            offset += name_length
+            if mask & IN_Q_OVERFLOW:
+                overflowed = True
+            elif name:
+                names.append(os.fsdecode(name))
+    return names, overflowed
+
+def _wanted(name, pattern):
+    return not name.startswith(".") and fnmatch.fnmatch(name, pattern)
+
+def _open_pool(workers, config_path):
+    return open_process_pool(workers, initializer=_start_daemon_worker, initargs=(config_path,))
+
+def _start_daemon_worker(config_path):
+    # the daemon decides when to stop; a Ctrl-C sent to the whole process group must not cut a session short
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    _start_pool_worker(config_path)
+
+def _ingest_claimed(claimed_path, size):
+    result = _ingest_file(claimed_path, size)
+    result["finished_at"] = time.time()
+    return result
+
+def _finish_file(claim, future):
+    # the file's result, after moving it out of processing according to its session's status
+    path, claimed_path, arrived_at, claimed_at = claim
+    try:
+        result = future.result()
+    except Exception as e:
+        result = failed_result(path, os.path.getsize(claimed_path), e)
+        result["finished_at"] = time.time()
+    finished_dir = FAILED_DIR if result["status"] in BATCH_FAILED_STATUSES else DONE_DIR
+    finished_path = os.path.join(os.path.dirname(path), finished_dir, os.path.basename(path))
+    if os.path.exists(finished_path):
+        stem, extension = os.path.basename(path).split(".", 1) if "." in os.path.basename(path) else (os.path.basename(path), "")
+        finished_path = os.path.join(os.path.dirname(finished_path),
+                                     f"{stem}.{datetime.now().strftime('%Y%m%dT%H%M%S%f')}" + (f".{extension}" if extension else ""))
+    os.rename(claimed_path, finished_path)
+    result.update({
+        "csv_path": path,
+        "moved_to": finished_path,
+        "arrived": datetime.fromtimestamp(arrived_at).isoformat(),
+        "queued_seconds": round(claimed_at - arrived_at, 4),
+        "latency_seconds": round(result["finished_at"] - arrived_at, 4)
+    })
+    del result["finished_at"]
+    return result
+
+def _record_file(daemon, daemon_log, result):
+    daemon["files"] += 1
+    daemon["statuses"][result["status"]] = daemon["statuses"].get(result["status"], 0) + 1
+    daemon["rows_in"] += result["rows_in"]
+    daemon["rows_out"] += result["rows_out"]
+    daemon["latency_seconds"].append(result["latency_seconds"])
+    with open(daemon_log, mode="a") as f:
+        f.write(json.dumps(result) + "\n")
+    print(f"[{daemon['files']}] {result['status']}: {result['csv_path']} ({result['rows_out']} of {result['rows_in']} rows, "
+          f"{result['latency_seconds']:.2f}s from arrival)")
+
+def _wake(wake_write):
+    try:
+        os.write(wake_write, b"\0")
+    except (BlockingIOError, OSError):
+        # the pipe is full (the loop will wake anyway) or already closed
+        pass
+
+def _drain(wake_read):
+    try:
+        while os.read(wake_read, 4096):
+            pass
+    except BlockingIOError:
+        pass
@@ -0,0 +1,228 @@
+# data_generator.py
+
+import re
+import string
+import numpy as np
+import pandas as pd
+
+try:
+    from re import _parser as regex_parser, _constants as regex_constants
+except ImportError:
+    import sre_parse as regex_parser, sre_constants as regex_constants
+
+# characters drawn for ".", negated classes and categories without a narrower alphabet
+GENERATOR_ALPHABET = string.ascii_letters + string.digits
+
+def generate_data(schema, rows, rows_per_group=3, error_rate=0.0, extra_cols=0, null_ratio=0.0, seed=0):
+    """
+    Generate reproducible CSV text following schema.json, with error_rate and null_ratio applied.
+    """
+    rng = np.random.default_rng(seed)
+    sort_key = schema["sort_key"]
+    group_sizes = _group_sizes(rows, rows_per_group, rng)
+    group_of_row = np.repeat(np.arange(len(group_sizes)), group_sizes)
+
+    data = {}
+    for col_name, col_def in schema["schema_definitions"].items():
+        col_rules = col_def.get("rules", {})
+        if col_name == sort_key:
+            values = _unique_values(col_rules, len(group_sizes), rng)
+            values = _inject_errors(col_name, col_rules, values, error_rate, null_ratio, rng, shared_values=False)
+            data[col_name] = values[group_of_row]
+        else:
+            values = _column_values(col_rules, rows, rng)
+            data[col_name] = _inject_errors(col_name, col_rules, values, error_rate, null_ratio, rng)
+    for extra_number in range(1, extra_cols + 1):
+        data[f"extra_{extra_number}"] = rng.integers(0, 1000000, rows).astype(str).astype(object)
+    return pd.DataFrame(data)
+
+def write_data(csv_path, schema, rows, **generator_options):
+    generated = generate_data(schema, rows, **generator_options)
+    generated.to_csv(csv_path, index=False)
+    return len(generated)
+
+def regex_values(pattern, size, rng):
+    """
+    Draw size strings matching pattern; open-ended repeats stop at n + 3.
+    """
+    return _render(regex_parser.parse(pattern), size, rng)
+
+def _group_sizes(rows, rows_per_group, rng):
+    group_sizes = rng.integers(1, 2 * max(rows_per_group, 1), size=rows // max(rows_per_group, 1) + 1)
+    while group_sizes.sum() < rows:
+        group_sizes = np.concatenate([group_sizes, rng.integers(1, 2 * max(rows_per_group, 1), size=len(group_sizes))])
+    group_count = np.searchsorted(np.cumsum(group_sizes), rows) + 1
+    group_sizes = group_sizes[:group_count]
+    group_sizes[-1] -= group_sizes.sum() - rows
+    return group_sizes
+
+def _column_values(col_rules, size, rng):
+    data_type = (col_rules.get("data_type") or "TEXT").upper()
+    restrictions = col_rules.get("value_restrictions", {})
+    limit = col_rules.get("limit") or {}
+
+    if "ALLOW" in restrictions:
+        allowed = np.array([str(value) for value in restrictions["ALLOW"]], dtype=object)
+        return allowed[rng.integers(0, len(allowed), size)]
+    if col_rules.get("format"):
+        values = regex_values(col_rules["format"], size, rng)
+    elif data_type in ("INTEGER", "INT", "SMALLINT", "BIGINT"):
+        low, high = _limit_range(limit, 1, 99)
+        values = rng.integers(int(np.ceil(low)), int(np.floor(high)) + 1, size).astype(str).astype(object)
+    elif data_type in ("REAL", "FLOAT", "DOUBLE PRECISION", "NUMERIC"):
+        low, high = _limit_range(limit, 0.0, 100.0)
+        values = np.char.mod("%.2f", np.clip(np.round(rng.uniform(low, high, size), 2), low, high)).astype(object)
+    elif data_type == "BOOLEAN":
+        values = np.array(["true", "false"], dtype=object)[rng.integers(0, 2, size)]
+    elif data_type in ("DATE", "TIMESTAMP", "TIME"):
+        moments = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 366 * 86400, size), unit="s")
+        date_format = {"DATE": "%Y-%m-%d", "TIMESTAMP": "%Y-%m-%d %H:%M:%S", "TIME": "%H:%M:%S"}[data_type]
+        values = moments.strftime(date_format).to_numpy(dtype=object)
+    else:
+        values = ("value_" + rng.integers(0, 1000, size).astype(str).astype(object)).astype(object)
+
+    if "FORBID" in restrictions:
+        forbidden = np.isin(values, [str(value) for value in restrictions["FORBID"]])
+        values[forbidden] = regex_values(col_rules["format"], forbidden.sum(), rng) if col_rules.get("format") else "value_ok"
+    return values
+
+def _unique_values(col_rules, size, rng):
+    # sort_key values: a repeated key would merge two groups, so duplicates are redrawn
+    values = _column_values(col_rules, size, rng)
+    for _ in range(10):
+        repeated = pd.Series(values).duplicated().to_numpy()
+        if not repeated.any():
+            break
+        values[repeated] = _column_values(col_rules, repeated.sum(), rng)
+    return values
+
+def _limit_range(limit, default_low, default_span):
+    low, high = limit.get("min"), limit.get("max")
+    if low is None and high is None:
+        low = default_low
+    if low is None:
+        low = high - default_span
+    if high is None:
+        high = low + default_span
+    return low, high
+
+def _inject_errors(col_name, col_rules, values, error_rate, null_ratio, rng, shared_values=True):
+    values = values.copy()
+    for rule_name, schema_rule in col_rules.items():
+        rate = _error_rate(error_rate, col_name, rule_name)
+        bad_value = _breaking_value(rule_name, schema_rule, col_rules, shared_values)
+        if rate and bad_value is not None:
+            broken = rng.random(len(values)) < rate
+            if bad_value and not shared_values:
+                values[broken] = bad_value + np.flatnonzero(broken).astype(str).astype(object)
+            else:
+                values[broken] = bad_value
+    if null_ratio and not col_rules.get("required"):
+        values[rng.random(len(values)) < null_ratio] = ""
+    return values
+
+def _error_rate(error_rate, col_name, rule_name):
+    if not isinstance(error_rate, dict):
+        return error_rate
+    for key in (f"{col_name}.{rule_name}", rule_name, col_name):
+        if key in error_rate:
+            return error_rate[key]
+    return 0.0
+
+def _breaking_value(rule_name, schema_rule, col_rules, shared_values):
+    # a value that fails rule_name, or None when the rule cannot be broken from a CSV. Without
+    # shared_values (sort_key columns) every group must get its own value: text is suffixed with
+    # the group number by _inject_errors, and rules only broken by one shared value are skipped
+    data_type = (col_rules.get("data_type") or "TEXT").upper()
+    if rule_name == "required":
+        return "" if schema_rule else None
+    if rule_name == "format":
+        return None if re.match(schema_rule, "#bad#") else "#bad#"
+    if rule_name == "data_type":
+        # bool() accepts any text, so a BOOLEAN column cannot be broken through its data_type
+        return None if data_type in ("TEXT", "VARCHAR", "CHAR", "BOOLEAN") else "#bad#"
+    if rule_name == "limit":
+        if not shared_values:
+            return None
+        if schema_rule.get("min") is not None:
+            return str(schema_rule["min"] - 1)
+        if schema_rule.get("max") is not None:
+            return str(schema_rule["max"] + 1)
+        return None
+    if rule_name == "value_restrictions":
+        if "ALLOW" in schema_rule:
+            return "#bad#"
+        # a forbidden value would be shared by every group that gets it, splitting sort_key groups
+        return str(schema_rule["FORBID"][0]) if shared_values and schema_rule["FORBID"] else None
+    return None
+
+def _render(parsed, size, rng):
+    values = np.full(size, "", dtype=object)
+    for opcode, argument in parsed:
+        values = values + _render_token(opcode, argument, size, rng)
+    return values
+
+def _render_token(opcode, argument, size, rng):
+    if opcode == regex_constants.LITERAL:
+        return chr(argument)
+    if opcode == regex_constants.AT:
+        return ""
+    if opcode in (regex_constants.ANY, regex_constants.NOT_LITERAL, regex_constants.IN):
+        if opcode == regex_constants.IN:
+            alphabet = _class_alphabet(argument)
+        elif opcode == regex_constants.NOT_LITERAL:
+            alphabet = GENERATOR_ALPHABET.replace(chr(argument), "")
+        else:
+            alphabet = GENERATOR_ALPHABET
+        return np.array(list(alphabet), dtype=object)[rng.integers(0, len(alphabet), size)]
+    if opcode in (regex_constants.MAX_REPEAT, regex_constants.MIN_REPEAT):
+        low, high, repeated = argument
+        high = low + 3 if high == regex_constants.MAXREPEAT else high
+        counts = rng.integers(low, high + 1, size)
+        values = np.full(size, "", dtype=object)
+        for repeat_number in range(high):
+            extended = counts > repeat_number
+            values[extended] = values[extended] + _render(repeated, extended.sum(), rng)
+        return values
+    if opcode == regex_constants.SUBPATTERN:
+        return _render(argument[-1], size, rng)
+    if opcode == regex_constants.BRANCH:
+        branches = argument[1]
+        chosen = rng.integers(0, len(branches), size)
+        values = np.full(size, "", dtype=object)
+        for branch_number, branch in enumerate(branches):
+            picked = chosen == branch_number
+            values[picked] = _render(branch, picked.sum(), rng)
+        return values
+    raise ValueError(f"unsupported pattern element for data generation: {opcode}")
+
+def _class_alphabet(class_items):
+    categories = {regex_constants.CATEGORY_DIGIT: string.digits,
+                  regex_constants.CATEGORY_WORD: GENERATOR_ALPHABET + "_",
+                  regex_constants.CATEGORY_SPACE: " "}
+    negated = False
+    alphabet = set()
+    for opcode, argument in class_items:
+        if opcode == regex_constants.NEGATE:
+            negated = True
+        elif opcode == regex_constants.LITERAL:
+            alphabet.add(chr(argument))
+        elif opcode == regex_constants.RANGE:
+            alphabet.update(chr(code) for code in range(argument[0], argument[1] + 1))
+        elif opcode == regex_constants.CATEGORY:
+            alphabet.update(categories.get(argument, GENERATOR_ALPHABET))
+    if negated:
+        alphabet = set(GENERATOR_ALPHABET) - alphabet
+    return "".join(sorted(alphabet))
+
+if __name__ == "__main__":
+    import sys
+    import json
+
+    if len(sys.argv) >= 3:
+        with open(sys.argv[3] if len(sys.argv) >= 4 else "config/schema.json", "r") as f:
+            schema = json.load(f)
+        rows_written = write_data(sys.argv[2], schema, int(sys.argv[1]), error_rate=0.02, extra_cols=1, null_ratio=0.05)
+        print(f"{rows_written} rows written to {sys.argv[2]}")
+    else:
+        print("Usage: python -m src.data_generator <rows> <csv_path> [schema_path]")
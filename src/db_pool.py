@@ -0,0 +1,66 @@
+# db_pool.py
+
+import time
+import threading
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+def open_pool(db_config):
+    """
+    Open the process's connection pool from db_config, as a dict kept in the runtime context.
+    """
+    try:
+        pool = ThreadedConnectionPool(
+            db_config.get("pool_min_size", 1), db_config.get("pool_size", 4),
+            host=db_config["host"],
+            port=db_config["port"],
+            dbname=db_config["name"],
+            user=db_config["user"],
+            password=db_config["password"],
+            connect_timeout=db_config.get("connect_timeout", 5)
+        )
+    except psycopg2.OperationalError as e:
+        raise RuntimeError(f"Database connection failed: {e}")
+    return {
+        "pool": pool,
+        "idle_timeout": db_config.get("pool_idle_timeout", 300),
+        "health_check": db_config.get("pool_health_check", 30),
+        "returned_at": {},
+        "lock": threading.Lock()
+    }
+
+def get_connection(db_pool):
+    """
+    Borrow a healthy connection; raises psycopg2.pool.PoolError if all are lent out.
+    """
+    while True:
+        with db_pool["lock"]:
+            conn = db_pool["pool"].getconn()
+            returned_at = db_pool["returned_at"].pop(id(conn), None)
+        idle_seconds = time.monotonic() - returned_at if returned_at is not None else 0
+        if conn.closed or idle_seconds > db_pool["idle_timeout"]:
+            db_pool["pool"].putconn(conn, close=True)
+            continue
+        if idle_seconds > db_pool["health_check"] and not _healthy(conn):
+            db_pool["pool"].putconn(conn, close=True)
+            continue
+        return conn
+
+def put_connection(db_pool, conn):
+    with db_pool["lock"]:
+        db_pool["returned_at"][id(conn)] = time.monotonic()
+        db_pool["pool"].putconn(conn, close=bool(conn.closed))
+        if conn.closed:
+            db_pool["returned_at"].pop(id(conn), None)
+
+def close_pool(db_pool):
+    db_pool["pool"].closeall()
+
+def _healthy(conn):
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1;")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
@@ -1,15 +1,83 @@
 # db_writer.py
 
+import io
+import re
+import time
+import queue
+import threading
+import numpy as np
+import pandas as pd
 import psycopg2
 from psycopg2.extras import execute_values
+from src.db_pool import get_connection, put_connection
 from src.logger import log_event
+from src.metrics import count_rows
 
-def write_to_db(runtime_config, db_config, cleaned_data):
+def build_writer_table():
+    # write_mode -> (render, send): render turns a batch into the rows to send, once; send writes
+    # a list of rendered rows, so a part of a batch can be sent again without rendering it again
+    return {
+        "copy": (copy_rows, send_copy),
+        "values": (insert_rows, send_insert)
+    }
+
+def write_to_db(runtime_config, db_config, cleaned_data, db_pool=None, in_transaction=None, before_frame=None):
+    """
+    Write cleaned_data (a DataFrame or an iterable of them) in one transaction; True if committed.
+    """
     dest_table = db_config['table']
-    columns = list(cleaned_data.columns)
-    insert_statement = f"INSERT INTO {dest_table} ({', '.join(columns)}) VALUES %s"
-    insert_data = [tuple(row) for row in cleaned_data.to_numpy()]
-    try:
+    write_retries = runtime_config.get("write_retries", 3)
+    frames = [cleaned_data] if isinstance(cleaned_data, pd.DataFrame) else cleaned_data
+    replayable = isinstance(frames, (list, tuple))
+    for attempt in range(write_retries + 1):
+        progress = {"started": False}
+        try:
+            return _write_transaction(runtime_config, db_config, frames, db_pool, in_transaction, before_frame, progress)
+        except TRANSIENT_ERRORS as e:
+            if attempt == write_retries or (progress["started"] and not replayable):
+                error = e
+                break
+            retry_seconds = runtime_config.get("write_retry_backoff", 0.5) * 2 ** attempt
+            log_event(runtime_config, {
+                "message": f"write to {dest_table} interrupted (attempt {attempt + 1} of {write_retries + 1}), "
+                           f"retrying in {retry_seconds:.1f}s: {e}",
+                "log_type": "ERROR",
+                "log_class": "error_minor",
+                "called_by": "db_writer.py"
+                })
+            time.sleep(retry_seconds)
+        except Exception as e:
+            error = e
+            break
+    log_event(runtime_config, {
+        "message": f"failed to write to {dest_table}: {error}",
+        "log_type": "ERROR",
+        "log_class": "error_critical",
+        "called_by": "db_writer.py"
+        })
+    return False
+
+# errors that say nothing about the rows being written; the whole transaction is tried again
+TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+def _write_transaction(runtime_config, db_config, frames, db_pool, in_transaction, before_frame, progress):
+    # one attempt at the whole write; progress["started"] is set once a frame has been taken
+    dest_table = db_config['table']
+    write_mode = runtime_config.get("write_mode", "copy")
+    batch_size = runtime_config.get("write_batch_size", 10000)
+    isolate_write_errors = runtime_config.get("isolate_write_errors", False)
+    load_policies = policies_in_use(runtime_config)
+    unknown_policies = load_policies - set(LOAD_POLICIES)
+    if unknown_policies:
+        raise ValueError(f"unknown load_policy {sorted(unknown_policies)[0]!r}")
+    render_rows, send_rows = build_writer_table()[write_mode]
+    rows_written = rows_replaced = rows_merged = 0
+    write_seconds = 0.0
+    rejected_rows = []
+    transaction = {}
+    if db_pool is not None:
+        conn = get_connection(db_pool)
+    else:
         conn = psycopg2.connect(
             host=db_config["host"],
             port=db_config["port"],
@@ -17,26 +85,293 @@ def write_to_db(runtime_config, db_config, cleaned_data):
             user=db_config["user"],
             password=db_config["password"]
         )
-        with conn:
-            with conn.cursor() as cur:
-                execute_values(cur, insert_statement, insert_data)
-                log_event(runtime_config, {
-                    "message": f"data written to {dest_table}",
-                    "log_type": "EVENT",
-                    "log_class": "procedure_status",
-                    "called_by": "db_writer.py"
-                    })
-    except Exception as e:
+    try:
+        # pandas decodes the CSV as UTF-8, so send text to the server as UTF-8 too
+        conn.set_client_encoding("UTF8")
+        with conn.cursor() as cur:
+            senders = {"append": send_rows, "replace": send_rows}
+            if load_policies != {"append"}:
+                staging_table = open_staging(cur, dest_table)
+            if "merge" in load_policies:
+                senders["merge"] = merge_staged(send_rows, staging_table, runtime_config["load_key"])
+            for frame in frames:
+                progress["started"] = True
+                if before_frame is not None:
+                    before_frame(cur, dest_table, frame, transaction)
+                for load_policy, rows in split_by_policy(runtime_config, frame):
+                    if load_policy == "replace":
+                        rows_replaced += replace_keys(cur, dest_table, staging_table, rows, runtime_config["load_key"],
+                                                      transaction.setdefault("replaced_keys", set()))
+                    elif load_policy == "merge":
+                        rows_merged += int(rows.duplicated(runtime_config["load_key"]).sum())
+                    for start in range(0, len(rows), batch_size):
+                        batch = rows.iloc[start:start + batch_size]
+                        started = time.perf_counter()
+                        rendered_rows = render_rows(batch)
+                        if isolate_write_errors:
+                            rows_written += write_isolated(cur, senders[load_policy], dest_table, batch, rendered_rows,
+                                                           rejected_rows)
+                        else:
+                            senders[load_policy](cur, dest_table, batch.columns, rendered_rows)
+                            rows_written += len(batch)
+                        write_seconds += time.perf_counter() - started
+            if in_transaction is not None:
+                in_transaction(cur, rows_written)
+            log_event(runtime_config, {
+                "message": f"{rows_written} rows written to {dest_table} ({write_mode}"
+                           + (f", {'/'.join(policy for policy in LOAD_POLICIES if policy in load_policies)}"
+                              if load_policies != {"append"} else "")
+                           + f": {write_seconds:.3f}s, {rows_written / write_seconds if write_seconds else 0:.0f} rows/sec)"
+                           + (f", {rows_replaced} earlier rows replaced" if rows_replaced else "")
+                           + (f", {len(rejected_rows)} rows refused by the server" if rejected_rows else ""),
+                "log_type": "EVENT",
+                "log_class": "procedure_status",
+                "called_by": "db_writer.py"
+                })
+        conn.commit()
+    except BaseException:
+        # a connection that was lost has nothing to roll back, and trying would hide the error
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        if db_pool is not None:
+            put_connection(db_pool, conn)
+        else:
+            conn.close()
+    # refused rows are only reported once the rows around them are committed
+    for rejected_row, error in rejected_rows:
+        source_index = rejected_row["source_index"].iloc[0] if "source_index" in rejected_row else None
+        log_event(runtime_config, {
+            "message": f"row {source_index} refused by {dest_table}: {server_error(error)}",
+            "log_type": "ERROR",
+            "log_class": "error_minor",
+            "called_by": "db_writer.py",
+            "col_name": error.diag.column_name,
+            "source_index": source_index,
+            "valid": False
+            })
+    if rows_merged:
         log_event(runtime_config, {
-            "message": f"failed to write to {dest_table}: {e}",
+            "message": f"{rows_merged} rows shared their load_key ({', '.join(runtime_config['load_key'])}) with a later row "
+                       f"and were merged into it",
             "log_type": "ERROR",
-            "log_class": "error_critical",
+            "log_class": "error_minor",
             "called_by": "db_writer.py"
             })
-    finally:
-        if "conn" in locals():
-            conn.close()
+    count_rows(runtime_config, "write_to_db", rows_out=rows_written)
+    return True
+
+def write_isolated(cur, send_rows, dest_table, batch, rendered_rows, rejected_rows, start=0, end=None):
+    """
+    Send rendered_rows[start:end], narrowing refused rows down to rejected_rows; returns rows written.
+    """
+    end = len(rendered_rows) if end is None else end
+    cur.execute("SAVEPOINT write_isolated;")
+    try:
+        send_rows(cur, dest_table, batch.columns, rendered_rows[start:end])
+    except TRANSIENT_ERRORS:
+        raise
+    except psycopg2.Error as e:
+        cur.execute("ROLLBACK TO SAVEPOINT write_isolated;")
+        cur.execute("RELEASE SAVEPOINT write_isolated;")
+        if end - start == 1:
+            rejected_rows.append((batch.iloc[start:end], e))
+            return 0
+        failed_line = copy_failed_line(e)
+        if failed_line is not None and failed_line <= end - start:
+            failed_row = start + failed_line - 1
+            bounds = [start, failed_row, failed_row + 1, end]
+        else:
+            bounds = [start, (start + end) // 2, end]
+        return sum(write_isolated(cur, send_rows, dest_table, batch, rendered_rows, rejected_rows, part_start, part_end)
+                   for part_start, part_end in zip(bounds, bounds[1:]) if part_end > part_start)
+    cur.execute("RELEASE SAVEPOINT write_isolated;")
+    return end - start
+
+# how loaded rows meet the rows already in the table, in the order a frame's rows are sent
+LOAD_POLICIES = ("replace", "merge", "append")
+
+def policies_in_use(runtime_config):
+    # load_policy, and with load_policy_column every policy load_policies names
+    load_policies = {runtime_config.get("load_policy", "append")}
+    if runtime_config.get("load_policy_column"):
+        load_policies.update(runtime_config.get("load_policies", {}).values())
+    return load_policies
+
+def split_by_policy(runtime_config, frame):
+    """
+    Split frame into (load_policy, rows) parts by the value of each row's load_policy_column.
+    """
+    load_policy = runtime_config.get("load_policy", "append")
+    policy_column = runtime_config.get("load_policy_column")
+    if not policy_column:
+        return [(load_policy, frame)]
+    row_policies = frame[policy_column].astype("string").map(runtime_config.get("load_policies", {})).fillna(load_policy)
+    return [(policy, frame[row_policies == policy]) for policy in LOAD_POLICIES if (row_policies == policy).any()]
+
+def open_staging(cur, dest_table):
+    """
+    Create dest_table's staging table once per connection and return its name.
+    """
+    staging_table = "staging_" + dest_table.replace(".", "_")
+    cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS {staging_table} ON COMMIT DELETE ROWS AS "
+                f"SELECT * FROM {dest_table} WITH NO DATA;")
+    return staging_table
+
+def merge_staged(send_rows, staging_table, load_key):
+    """
+    Wrap send_rows to upsert each batch on load_key through staging_table.
+    """
+    key_list = ", ".join(load_key)
+
+    def send_merged(cur, dest_table, columns, rows):
+        send_rows(cur, staging_table, columns, rows)
+        column_list = ", ".join(columns)
+        updates = ", ".join(f"{col_name} = EXCLUDED.{col_name}" for col_name in columns if col_name not in load_key)
+        latest_first = ", source_index DESC" if "source_index" in columns else ""
+        cur.execute(f"INSERT INTO {dest_table} ({column_list}) "
+                    f"SELECT DISTINCT ON ({key_list}) {column_list} FROM {staging_table} ORDER BY {key_list}{latest_first} "
+                    f"ON CONFLICT ({key_list}) DO " + (f"UPDATE SET {updates};" if updates else "NOTHING;"))
+        cur.execute(f"TRUNCATE {staging_table};")
+    return send_merged
+
+def replace_keys(cur, dest_table, staging_table, frame, load_key, replaced_keys):
+    """
+    Delete the rows of dest_table with a load_key of frame not in replaced_keys; returns rows deleted.
+    """
+    frame_keys = frame[load_key].dropna().drop_duplicates()
+    key_values = list(frame_keys.itertuples(index=False, name=None))
+    due = np.fromiter((key not in replaced_keys for key in key_values), dtype=bool, count=len(key_values))
+    if not due.any():
+        return 0
+    replaced_keys.update(key_values)
+    send_copy(cur, staging_table, load_key, copy_rows(frame_keys[due]))
+    cur.execute(f"DELETE FROM {dest_table} AS target USING (SELECT DISTINCT {', '.join(load_key)} FROM {staging_table}) AS staged "
+                "WHERE " + " AND ".join(f"target.{col_name} = staged.{col_name}" for col_name in load_key) + ";")
+    rows_deleted = cur.rowcount
+    cur.execute(f"TRUNCATE {staging_table};")
+    return rows_deleted
+
+def copy_failed_line(error):
+    # the 1-based line of a COPY error ("COPY orders, line 57, column ..."), or None
+    line = re.search(r"^COPY \S+, line (\d+)", error.diag.context or "")
+    return int(line.group(1)) if line else None
+
+def server_error(error):
+    # the server's message and detail on one line
+    return " ".join(part for part in (error.diag.message_primary, error.diag.message_detail) if part) or str(error).strip()
+
+def write_pipelined(runtime_config, db_config, cleaned_data, db_pool=None, before_frame=None):
+    """
+    Write batches on a background thread while the caller validates the next ones.
+    """
+    batch_queue = queue.Queue(maxsize=runtime_config["pipeline_depth"])
+    writer_done = threading.Event()
+    outcome = {"written": False}
+
+    def queued_batches():
+        while True:
+            batch = batch_queue.get()
+            if batch is None:
+                return
+            if isinstance(batch, BaseException):
+                raise RuntimeError(f"pipeline aborted: {batch}")
+            yield batch
+
+    def run_writer():
+        try:
+            outcome["written"] = write_to_db(runtime_config, db_config, queued_batches(), db_pool, before_frame=before_frame)
+        finally:
+            writer_done.set()
+
+    writer = threading.Thread(target=run_writer, name="db_writer", daemon=True)
+    writer.start()
+    try:
+        for batch in cleaned_data:
+            if not _enqueue(batch_queue, batch, writer_done):
+                break
+        _enqueue(batch_queue, None, writer_done)
+    except BaseException as e:
+        _enqueue(batch_queue, e, writer_done)
+        writer.join()
+        raise
+    writer.join()
+    if not outcome["written"]:
+        raise RuntimeError(f"pipelined write to {db_config['table']} failed, see ERROR log")
+    return True
+
+def _enqueue(batch_queue, item, writer_done):
+    # blocks while the queue is full (backpressure), gives up if the writer has stopped
+    while not writer_done.is_set():
+        try:
+            batch_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def insert_rows(batch):
+    return list(zip(*(insert_values(batch[col_name]) for col_name in batch.columns)))
+
+def send_insert(cur, dest_table, columns, insert_data):
+    insert_statement = f"INSERT INTO {dest_table} ({', '.join(columns)}) VALUES %s"
+    execute_values(cur, insert_statement, insert_data, page_size=len(insert_data))
+
+def insert_values(column):
+    # one column as a list of Python values for execute_values; missing values (NaN, pd.NA, NaT) are sent as NULL
+    if column.dtype.kind in "mM":
+        text = temporal_text(column)
+        return text.where(column.notna().to_numpy(), None).tolist()
+    if column.dtype.kind in "iub" and isinstance(column.dtype, np.dtype):
+        return column.tolist()
+    return column.astype(object).where(column.notna(), None).tolist()
+
+def copy_rows(batch):
+    # one line of COPY text per row
+    columns = [copy_text_column(batch[col_name]) for col_name in batch.columns]
+    lines = columns[0].str.cat(columns[1:], sep="\t") if len(columns) > 1 else columns[0]
+    return lines.tolist()
+
+def send_copy(cur, dest_table, columns, lines):
+    copy_statement = f"COPY {dest_table} ({', '.join(columns)}) FROM STDIN"
+    buffer = io.StringIO("\n".join(lines) + "\n")
+    cur.copy_expert(copy_statement, buffer)
+
+def copy_text_column(column):
+    """
+    Render one column in COPY text format.
+    """
+    missing = column.isna().to_numpy()
+    if column.dtype.kind in "mM":
+        return temporal_text(column).where(~missing, "\\N").reset_index(drop=True)
+    text = column.astype(str)
+    if column.dtype.kind not in "iubf":
+        text = (text.str.replace("\\", "\\\\", regex=False)
+                    .str.replace("\t", "\\t", regex=False)
+                    .str.replace("\n", "\\n", regex=False)
+                    .str.replace("\r", "\\r", regex=False))
+    return text.astype(object).where(~missing, "\\N").reset_index(drop=True)
+
+def temporal_text(column):
+    """
+    Render a datetime64 or timedelta64 column as ISO 8601 text.
+    """
+    suffix = ""
+    if isinstance(column.dtype, pd.DatetimeTZDtype):
+        column = column.dt.tz_convert("UTC").dt.tz_localize(None)
+        suffix = "+00:00"
+    if column.dtype.kind == "m":
+        # time of day: the time part of the epoch plus the offset
+        text = np.datetime_as_string(np.datetime64(0, "ns") + column.to_numpy(dtype="timedelta64[ns]"), unit="us")
+        return pd.Series(text, dtype=object, index=column.index).str[11:]
+    # in the column's own unit: datetime64[us] holds dates that datetime64[ns] cannot (9999-12-31)
+    values = column.to_numpy()
+    present = ~np.isnat(values)
+    whole_days = not suffix and (values[present] == values[present].astype("datetime64[D]")).all()
+    text = np.datetime_as_string(values, unit="D" if whole_days else "us")
+    return pd.Series(text, dtype=object, index=column.index) + suffix
 
 '''
 {"message": "","log_type": "","log_class": "","called_by": ""}
-'''
\ No newline at end of file
+'''
@@ -0,0 +1,114 @@
+# decompress.py
+
+import io
+import gzip
+import queue
+import threading
+import contextlib
+import importlib.util
+
+# leading bytes of each compressed format read by open_csv
+COMPRESSION_MAGIC = {
+    "gzip": b"\x1f\x8b",
+    "zstd": b"\x28\xb5\x2f\xfd"
+}
+
+# decompressed block size, and the blocks the background thread may run ahead of the parser
+DECOMPRESS_BLOCK_SIZE = 1 << 20
+DECOMPRESS_BUFFER_BLOCKS = 8
+
+def detect_compression(csv_path):
+    # the compression format of csv_path from its first bytes, or None for plain text
+    with open(csv_path, "rb") as f:
+        leading_bytes = f.read(4)
+    for compression, magic in COMPRESSION_MAGIC.items():
+        if leading_bytes.startswith(magic):
+            return compression
+    return None
+
+@contextlib.contextmanager
+def open_csv(csv_path, compression=None, buffer_blocks=DECOMPRESS_BUFFER_BLOCKS):
+    """
+    The path itself for plain text, else a DecompressedStream closed on exit.
+    """
+    if compression is None:
+        yield csv_path
+        return
+    stream = DecompressedStream(csv_path, compression, buffer_blocks)
+    try:
+        yield stream
+    finally:
+        stream.close()
+
+def _open_decompressor(raw_file, compression):
+    if compression == "gzip":
+        # reads multi-member files too
+        return gzip.GzipFile(fileobj=raw_file, mode="rb")
+    if importlib.util.find_spec("zstandard") is None:
+        raise RuntimeError("zstd input needs the zstandard package, which is not installed")
+    import zstandard
+    return zstandard.ZstdDecompressor().stream_reader(raw_file, read_across_frames=True)
+
+class DecompressedStream(io.RawIOBase):
+    """
+    A read-only stream of a compressed file's contents, decompressed ahead on a background thread.
+    """
+
+    def __init__(self, csv_path, compression, buffer_blocks=DECOMPRESS_BUFFER_BLOCKS):
+        super().__init__()
+        self.csv_path = csv_path
+        self.compression = compression
+        self.bytes_read = 0
+        self._blocks = queue.Queue(maxsize=buffer_blocks)
+        self._stopping = threading.Event()
+        self._pending = b""
+        self._offset = 0
+        self._finished = False
+        self._thread = threading.Thread(target=self._decompress, name="decompress", daemon=True)
+        self._thread.start()
+
+    def _decompress(self):
+        try:
+            with open(self.csv_path, "rb") as raw_file, _open_decompressor(raw_file, self.compression) as decompressor:
+                while not self._stopping.is_set():
+                    block = decompressor.read(DECOMPRESS_BLOCK_SIZE)
+                    if not block:
+                        break
+                    self._put(block)
+        except Exception as e:
+            self._put(e)
+        self._put(None)
+
+    def _put(self, item):
+        # waits while the parser is behind, gives up once the stream is closed
+        while not self._stopping.is_set():
+            try:
+                self._blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self._offset == len(self._pending) and not self._finished:
+            block = self._blocks.get()
+            if block is None:
+                self._finished = True
+            elif isinstance(block, BaseException):
+                self._finished = True
+                raise OSError(f"cannot decompress {self.csv_path} ({self.compression}): {block}") from block
+            else:
+                self._pending, self._offset = block, 0
+        size = min(len(buffer), len(self._pending) - self._offset)
+        buffer[:size] = memoryview(self._pending)[self._offset:self._offset + size]
+        self._offset += size
+        self.bytes_read += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._stopping.set()
+            self._thread.join()
+        super().close()
@@ -1,52 +1,38 @@
 # file_loader.py
 
+import io
+import os
+import mmap
+import contextlib
+import importlib.util
+import numpy as np
 import pandas
+from datetime import datetime
 import src.validation_library as vl
+from src.decompress import detect_compression, open_csv
+from src.process_pool import open_process_pool, usable_cpus
 from src.logger import log_event
 
-def load_csv(runtime_config, schema_keys):
+def load_csv(runtime_config, schema):
     """
     Load a CSV file and return a pandas DataFrame.
     """
-    reserved_cols = {"source_index"}
     try:
         csv_path = runtime_config["csv_path"]
-        raw_data = pandas.read_csv(csv_path)
-        csv_keys = set(raw_data.columns)
+        compression = input_compression(runtime_config, csv_path)
+        with open_csv(csv_path, compression) as source:
+            header = pandas.read_csv(source, nrows=0)
 
-        missing_cols = schema_keys - csv_keys
-        if missing_cols:
-            log_event(runtime_config, {
-                "message": f"Missing required columns: {missing_cols}",
-                "log_type": "ERROR",
-                "log_class": "error_critical",
-                "called_by": "load_csv"
-                })
+        column_plan = plan_columns(runtime_config, set(header.columns), {column.col_name for column in schema.columns})
+        if column_plan is None:
             return None
-        
-        extraneous_cols = csv_keys - schema_keys
-        if extraneous_cols:
-            if runtime_config["drop_extra_cols"]:
-                raw_data = raw_data[list(schema_keys)]
-            log_event(runtime_config, {
-                "message": f"Extraneous columns {'dropped' if runtime_config["drop_extra_cols"]==True else 'found'}: {sorted(list(extraneous_cols))}",
-                "log_type": "INGEST",
-                "log_class": "info_general",
-                "called_by": "load_csv"
-                })
+        parse_ranges = split_csv(runtime_config, csv_path) if compression is None else None
+        if parse_ranges is not None:
+            raw_data = read_csv_ranges(runtime_config, csv_path, schema, list(header.columns), column_plan[0], parse_ranges)
+        else:
+            raw_data = read_typed_csv(runtime_config, csv_path, schema, column_plan[0], compression)
+        raw_data = align_columns(raw_data, column_plan, 0)
 
-        rename_map = {col:f"input_{col}" for col in raw_data.columns if col in reserved_cols}
-        if rename_map:
-            log_event(runtime_config, {
-                "message": f"Conflicting columns renamed: {rename_map}",
-                "log_type": "INGEST",
-                "log_class": "info_detailed",
-                "called_by": "load_csv"
-                })
-            raw_data.rename(columns=rename_map, inplace=True)
-    
-        raw_data.insert(0, "source_index", range(len(raw_data)))
-    
         log_event(runtime_config, {
             "message": f"Successfully loaded data from {csv_path}",
             "log_type": "EVENT",
@@ -62,4 +48,291 @@ def load_csv(runtime_config, schema_keys):
             "log_class": "error_critical",
             "called_by": "load_csv"
             })
-        return None
\ No newline at end of file
+        return None
+
+def load_csv_chunks(runtime_config, schema, start_index=0):
+    """
+    Return a generator of DataFrames of at most chunk_size rows, or None if the file cannot be loaded.
+    """
+    inputs = contextlib.ExitStack()
+    try:
+        csv_path = runtime_config["csv_path"]
+        compression = input_compression(runtime_config, csv_path)
+        with open_csv(csv_path, compression) as source:
+            header = pandas.read_csv(source, nrows=0)
+
+        column_plan = plan_columns(runtime_config, set(header.columns), {column.col_name for column in schema.columns})
+        if column_plan is None:
+            return None
+        chunk_size = runtime_config.get("chunk_size") or DEFAULT_CHUNK_SIZE
+        source = inputs.enter_context(open_csv(csv_path, compression))
+        reader = inputs.enter_context(pandas.read_csv(source, usecols=column_plan[0], dtype=str, chunksize=chunk_size,
+                                                      skiprows=range(1, start_index + 1) if start_index else None))
+
+        log_event(runtime_config, {
+            "message": f"Streaming data from {csv_path} in chunks of {chunk_size} rows"
+                       + (f", starting at row {start_index}" if start_index else ""),
+            "log_type": "EVENT",
+            "log_class": "info_general",
+            "called_by": "load_csv_chunks"
+            })
+        return _stream_chunks(runtime_config, reader, inputs, header, schema, column_plan, start_index)
+
+    except Exception as e:
+        inputs.close()
+        log_event(runtime_config, {
+            "message": f"ERROR loading CSV: {e}",
+            "log_type": "ERROR",
+            "log_class": "error_critical",
+            "called_by": "load_csv_chunks"
+            })
+        return None
+
+def _stream_chunks(runtime_config, reader, inputs, header, schema, column_plan, start_index):
+    # inputs holds the reader and the stream it reads, closed when the chunks run out
+    chunk_count = 0
+    with inputs:
+        for chunk in reader:
+            chunk = convert_columns(runtime_config, chunk, schema)
+            yield align_columns(chunk, column_plan, start_index)
+            start_index += len(chunk)
+            chunk_count += 1
+    if chunk_count == 0:
+        # header-only file: still hand the validator one empty, correctly shaped chunk
+        empty_chunk = header if column_plan[0] is None else header[column_plan[0]]
+        yield align_columns(empty_chunk.copy(), column_plan, start_index)
+
+def read_typed_csv(runtime_config, csv_path, schema, usecols, compression=None):
+    """
+    Parse usecols with the schema dtypes, keeping a column that does not convert as text.
+    """
+    engine = parse_engine(runtime_config)
+    column_dtypes = {column.col_name: column.dtype for column in schema.columns if column.dtype is not None}
+    try:
+        with open_csv(csv_path, compression) as source:
+            raw_data = pandas.read_csv(source, usecols=usecols, dtype=column_dtypes, engine=engine)
+    except (ValueError, TypeError):
+        with open_csv(csv_path, compression) as source:
+            raw_data = pandas.read_csv(source, usecols=usecols, dtype={col: str for col in column_dtypes}, engine=engine)
+        raw_data = convert_columns(runtime_config, raw_data, schema)
+    return categorize_text(runtime_config, raw_data, schema)
+
+# Parallel parsing: the file is memory-mapped and cut into byte ranges that end on record
+# boundaries, each range is parsed in a worker process, and the parts are put back together in
+# file order, so source_index is numbered as for one read
+
+def split_csv(runtime_config, csv_path):
+    """
+    Cut the data rows into byte ranges ending outside quotes, or None to read the file in one go.
+    """
+    workers = min(runtime_config.get("parse_workers", 1), usable_cpus())
+    file_size = os.path.getsize(csv_path)
+    range_count = min(workers, file_size // PARSE_RANGE_MIN_BYTES)
+    if range_count < 2:
+        return None
+    with open(csv_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        data_start = record_end(mapped, 0, 0)
+        cuts = [data_start + (file_size - data_start) * part // range_count for part in range(1, range_count)]
+        bounds = [data_start]
+        quotes_before, counted_to = 0, 0
+        for cut in cuts:
+            quotes_before += count_quotes(mapped, counted_to, cut)
+            counted_to = cut
+            bounds.append(max(bounds[-1], record_end(mapped, cut, quotes_before)))
+        bounds.append(file_size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+def count_quotes(mapped, start, end, block_size=1 << 26):
+    # quote characters in mapped[start:end], counted in blocks to keep the comparison arrays small
+    quotes = 0
+    for block_start in range(start, end, block_size):
+        block = np.frombuffer(mapped, dtype=np.uint8, count=min(block_size, end - block_start), offset=block_start)
+        quotes += int(np.count_nonzero(block == ord('"')))
+        del block
+    return quotes
+
+def record_end(mapped, position, quotes_before):
+    # the offset after the first newline at or after position that is outside quotes, given the
+    # number of quote characters before position
+    in_quotes = quotes_before % 2 == 1
+    while True:
+        newline = mapped.find(b"\n", position)
+        if newline == -1:
+            return len(mapped)
+        in_quotes ^= mapped[position:newline].count(b'"') % 2 == 1
+        if not in_quotes:
+            return newline + 1
+        position = newline + 1
+
+def read_csv_ranges(runtime_config, csv_path, schema, names, usecols, parse_ranges):
+    """
+    Parse parse_ranges of csv_path in worker processes and concatenate them in file order.
+    """
+    engine = parse_engine(runtime_config)
+    column_dtypes = {column.col_name: column.dtype for column in schema.columns if column.dtype is not None}
+    tasks = [(csv_path, start, end, names, usecols, column_dtypes, schema, engine) for start, end in parse_ranges]
+    with open_process_pool(len(tasks)) as pool:
+        results = list(pool.map(_parse_range, tasks))
+        failed_cols = sorted({col_name for _, range_failed in results for col_name in range_failed})
+        if failed_cols:
+            text_tasks = {}
+            for position, ((start, end), (_, range_failed)) in enumerate(zip(parse_ranges, results)):
+                typed_cols = [col_name for col_name in failed_cols if col_name not in range_failed]
+                if typed_cols:
+                    text_tasks[position] = (csv_path, start, end, names, typed_cols, {col_name: str for col_name in typed_cols}, None, engine)
+            text_parts = dict(zip(text_tasks, (text_part for text_part, _ in pool.map(_parse_range, text_tasks.values()))))
+    raw_data = pandas.concat([part for part, _ in results], ignore_index=True)
+    if failed_cols:
+        text_data = pandas.concat([pandas.DataFrame({col_name: (part if col_name in range_failed else text_parts[position])[col_name]
+                                                     for col_name in failed_cols})
+                                   for position, (part, range_failed) in enumerate(results)], ignore_index=True)
+        text_data = convert_columns(runtime_config, text_data, schema)
+        for col_name in failed_cols:
+            raw_data[col_name] = text_data[col_name]
+    return categorize_text(runtime_config, raw_data, schema)
+
+def _parse_range(task):
+    # parse one byte range; returns the frame and the columns that had to be kept as text
+    csv_path, start, end, names, usecols, column_dtypes, schema, engine = task
+    with open(csv_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        range_bytes = io.BytesIO(mapped[start:end])
+    read_options = {"header": None, "names": names, "usecols": usecols, "engine": engine}
+    try:
+        return pandas.read_csv(range_bytes, dtype=column_dtypes, **read_options), []
+    except (ValueError, TypeError):
+        range_bytes.seek(0)
+        part = pandas.read_csv(range_bytes, dtype={col: str for col in column_dtypes}, **read_options)
+        # no logging in the worker: the parent reports the column once, for the whole file
+        part = convert_columns(_QUIET_CONFIG, part, schema)
+        failed_cols = [column.col_name for column in schema.columns
+                       if column.dtype not in (None, "string") and column.col_name in part.columns
+                       and part[column.col_name].dtype != column.dtype]
+        return part, failed_cols
+
+def convert_columns(runtime_config, raw_data, schema):
+    """
+    Convert text columns to their schema dtypes; a column that does not convert stays text.
+    """
+    for column in schema.columns:
+        if column.dtype is None or column.col_name not in raw_data.columns:
+            continue
+        text_values = raw_data[column.col_name]
+        if column.dtype == "string":
+            raw_data[column.col_name] = text_values.astype("string")
+            continue
+        if column.dtype == "boolean":
+            converted = text_values.map(BOOLEAN_STRINGS)
+        else:
+            converted = pandas.to_numeric(text_values, errors="coerce")
+        failed = converted.isna() & text_values.notna()
+        if column.dtype == "Int64":
+            failed |= converted.notna() & (converted % 1 != 0)
+        if failed.any():
+            log_event(runtime_config, {
+                "message": f"{column.col_name}: {int(failed.sum())} values not convertible to {column.dtype}, column kept as text",
+                "log_type": "INGEST",
+                "log_class": "info_general",
+                "called_by": "load_csv"
+                })
+            continue
+        raw_data[column.col_name] = converted.astype(column.dtype)
+    return raw_data
+
+def categorize_text(runtime_config, raw_data, schema):
+    # low-cardinality text columns are stored as categoricals
+    threshold = runtime_config.get("category_threshold", 0)
+    if not threshold or raw_data.empty:
+        return raw_data
+    for column in schema.columns:
+        if column.dtype == "string" and column.col_name in raw_data.columns:
+            if raw_data[column.col_name].nunique() <= threshold * len(raw_data):
+                raw_data[column.col_name] = raw_data[column.col_name].astype("category")
+    return raw_data
+
+def input_compression(runtime_config, csv_path):
+    # the file's compression (see decompress.detect_compression), logged with the compressed
+    # file's size and modification time; registry and checkpoint fingerprints hash these bytes too
+    compression = detect_compression(csv_path)
+    if compression is not None:
+        file_stat = os.stat(csv_path)
+        log_event(runtime_config, {
+            "message": f"{csv_path} is {compression} compressed ({file_stat.st_size} bytes, modified "
+                       f"{datetime.fromtimestamp(file_stat.st_mtime).isoformat()}); decompressing on a background thread",
+            "log_type": "EVENT",
+            "log_class": "info_general",
+            "called_by": "load_csv"
+            })
+    return compression
+
+def parse_engine(runtime_config):
+    engine = runtime_config.get("parse_engine", "c")
+    if engine == "pyarrow" and importlib.util.find_spec("pyarrow") is None:
+        log_event(runtime_config, {
+            "message": "parse_engine 'pyarrow' requested but pyarrow is not installed; using 'c'",
+            "log_type": "EVENT",
+            "log_class": "error_minor",
+            "called_by": "load_csv"
+            })
+        return "c"
+    return engine
+
+def plan_columns(runtime_config, csv_keys, schema_keys):
+    """
+    Columns to keep and renames for the CSV header, or None if required columns are missing.
+    """
+    reserved_cols = {"source_index"}
+
+    missing_cols = schema_keys - csv_keys
+    if missing_cols:
+        log_event(runtime_config, {
+            "message": f"Missing required columns: {missing_cols}",
+            "log_type": "ERROR",
+            "log_class": "error_critical",
+            "called_by": "load_csv"
+            })
+        return None
+
+    keep_cols = None
+    extraneous_cols = csv_keys - schema_keys
+    if extraneous_cols:
+        if runtime_config["drop_extra_cols"]:
+            keep_cols = list(schema_keys)
+        log_event(runtime_config, {
+            "message": f"Extraneous columns {'dropped' if runtime_config["drop_extra_cols"]==True else 'found'}: {sorted(list(extraneous_cols))}",
+            "log_type": "INGEST",
+            "log_class": "info_general",
+            "called_by": "load_csv"
+            })
+
+    rename_map = {col:f"input_{col}" for col in (keep_cols or csv_keys) if col in reserved_cols}
+    if rename_map:
+        log_event(runtime_config, {
+            "message": f"Conflicting columns renamed: {rename_map}",
+            "log_type": "INGEST",
+            "log_class": "info_detailed",
+            "called_by": "load_csv"
+            })
+    return keep_cols, rename_map
+
+def align_columns(raw_data, column_plan, start_index):
+    keep_cols, rename_map = column_plan
+    if keep_cols is not None:
+        raw_data = raw_data[keep_cols]
+    if rename_map:
+        raw_data = raw_data.rename(columns=rename_map)
+    raw_data.insert(0, "source_index", range(start_index, start_index + len(raw_data)))
+    return raw_data
+
+# smallest byte range worth a parse worker; smaller files are read in one go. Measured on one
+# core, a split costs about a third of a serial parse more (the parts are pickled back and
+# concatenated) plus ~80 ms of pool start-up, so it breaks even at 2 cores near 16 MB files
+PARSE_RANGE_MIN_BYTES = 8 << 20
+
+# a runtime_config whose log_event drops everything (see _parse_range)
+_QUIET_CONFIG = {"log_config": {"log_profile": frozenset()}}
+
+# chunk size for modes that stream even when runtime_config["chunk_size"] is 0 (resumable)
+DEFAULT_CHUNK_SIZE = 10000
+
+# text values the C parser reads as booleans
+BOOLEAN_STRINGS = {"True": True, "TRUE": True, "true": True, "False": False, "FALSE": False, "false": False}
@@ -3,18 +3,45 @@
 from datetime import datetime
 import os
 import csv
+import time
+import threading
+from src.metrics import stage_timer, count_rows
 
 log_library = ["INGEST", "ERROR", "EVENT", "EXCEPTION"]
 
+# fixed column layout of every log file
+LOG_FIELDS = ["timestamp", "session_id", "user_id", "log_type", "log_class", "message", "called_by",
+              "col_name", "source_index", "valid"]
+
 '''
 EXCEPTION_LOG = os.path.join("logs", "exception_log.txt")
 '''
 
+def build_log_profile(log_config):
+    """
+    The frozenset of enabled log classes from config.json's log_profile mapping.
+    """
+    log_profile = log_config["log_profile"]
+    if isinstance(log_profile, dict):
+        return frozenset(key for key, keyval in log_profile.items() if keyval == True)
+    return frozenset(log_profile)
+
+def log_enabled(runtime_config, log_class):
+    return log_class in runtime_config["log_config"]["log_profile"]
+
 def log_event(runtime_config, log_entry):
+    # entries of disabled classes are dropped before anything is built
+    if log_entry.get("log_class", "error_critical") not in runtime_config["log_config"]["log_profile"]:
+        return
+
     checked_entry = log_entry.copy()
+    # lazy messages: "message" is a str.format template when "message_args" is given
+    message_args = checked_entry.pop("message_args", None)
+    if message_args is not None:
+        checked_entry["message"] = checked_entry.get("message", "undefined").format(*message_args)
     checked_entry.update({"timestamp": datetime.now().isoformat(), "user_id": runtime_config["user_id"], "session_id": runtime_config["session_id"]})
 
-    # Lines 19 - 27 are developer-facing check to catch malformed function calls
+    # developer-facing check to catch malformed function calls
     required = ["log_type", "log_class", "message"]    
     default_entries = {"log_type": "EXCEPTION", "log_class": "error_critical", "message": "undefined", "called_by": "undefined"}
 
@@ -26,46 +53,93 @@ def log_event(runtime_config, log_entry):
         checked_entry["log_type"] = "EXCEPTION"
     # end malformed function call validation check
 
-    runtime_config["log_buffer"].append(checked_entry)
+    record_log_entry(runtime_config, checked_entry)
 
     if runtime_config["log_config"]["log_to_console"]:
         print(checked_entry)
 
-def write_to_logs(runtime_config):
+def record_log_entry(runtime_config, checked_entry):
+    """
+    Hand an entry to the session's log sinks, or to runtime_config["log_buffer"] without sinks.
+    """
+    log_sinks = runtime_config.get("log_sinks")
+    if log_sinks is None:
+        runtime_config.setdefault("log_buffer", []).append(checked_entry)
+        return
+    with log_sinks["lock"]:
+        log_sinks["pending"].append(checked_entry)
+        if (len(log_sinks["pending"]) >= log_sinks["flush_rows"]
+                or time.monotonic() - log_sinks["last_flush"] >= log_sinks["flush_seconds"]):
+            _flush_sinks(runtime_config, log_sinks)
+
+def open_log_sinks(runtime_config):
+    """
+    Open the session's log files, appended to in batches as the session runs.
+    """
     log_config = runtime_config["log_config"]
-    logs_by_type = {"INGEST": {"fieldnames": set(), "data_rows": list()},
-                    "ERROR": {"fieldnames": set(), "data_rows": list()},
-                    "EVENT": {"fieldnames": set(), "data_rows": list()},
-                    "EXCEPTION": {"fieldnames": set(), "data_rows": list()}
-                    }
-    log_buffer = runtime_config["log_buffer"]
-
-    if log_config["merge_logs"]:
-        logs_by_type["MERGED"] = {"fieldnames": set(), "data_rows": list()}
-
-    for log_entry in log_buffer:
-        if log_entry["log_class"] in log_config["log_profile"]:
-            logs_by_type[log_entry["log_type"]]["fieldnames"].update(log_entry.keys())
-            logs_by_type[log_entry["log_type"]]["data_rows"].append(log_entry)
-            if log_config["merge_logs"]:
-                logs_by_type["MERGED"]["fieldnames"].update(log_entry.keys())
-                logs_by_type["MERGED"]["data_rows"].append(log_entry)
-
-    for compiled_log, log_data in logs_by_type.items():
-        log_file = log_config["log_filename"].format(session_id=runtime_config["session_id"], log_type=compiled_log)
-        headers = list(log_data["fieldnames"])
-        with open(log_file, mode="w", newline="") as file:
-            writer = csv.DictWriter(file, fieldnames=headers)
-            writer.writeheader()
-            for row in log_data["data_rows"]:
-                writer.writerow(row)
-                if log_config["log_to_console"]: print(row)
-        print(f"Log File Written: {log_file} ({len(log_data['data_rows'])} entries)")
-    
-    runtime_config["log_buffer"] = []
+    log_types = log_library + (["MERGED"] if log_config["merge_logs"] else [])
+    log_sinks = {"files": {}, "writers": {}, "counts": {}, "pending": [],
+                 "merge_logs": log_config["merge_logs"],
+                 "flush_rows": log_config.get("flush_rows", 1000),
+                 "flush_seconds": log_config.get("flush_seconds", 5),
+                 "last_flush": time.monotonic(),
+                 "lock": threading.Lock()}
+    for log_type in log_types:
+        log_file = log_config["log_filename"].format(session_id=runtime_config["session_id"], log_type=log_type)
+        log_sinks["files"][log_type] = open(log_file, mode="w", newline="")
+        log_sinks["writers"][log_type] = csv.DictWriter(log_sinks["files"][log_type], fieldnames=LOG_FIELDS, extrasaction="ignore")
+        log_sinks["writers"][log_type].writeheader()
+        log_sinks["counts"][log_type] = 0
+    return log_sinks
+
+def _flush_sinks(runtime_config, log_sinks):
+    with stage_timer(runtime_config, "write_to_logs"):
+        _write_pending(log_sinks)
+    count_rows(runtime_config, "write_to_logs", rows_in=len(log_sinks["pending"]), rows_out=len(log_sinks["pending"]))
+    log_sinks["pending"] = []
+    log_sinks["last_flush"] = time.monotonic()
+
+def _write_pending(log_sinks):
+    for log_entry in log_sinks["pending"]:
+        log_sinks["writers"][log_entry["log_type"]].writerow(log_entry)
+        log_sinks["counts"][log_entry["log_type"]] += 1
+    if log_sinks["merge_logs"]:
+        log_sinks["writers"]["MERGED"].writerows(log_sinks["pending"])
+        log_sinks["counts"]["MERGED"] += len(log_sinks["pending"])
+    for file in log_sinks["files"].values():
+        file.flush()
+
+def write_to_logs(runtime_config):
+    """
+    Flush and close the session's log sinks; safe to call more than once.
+    """
+    log_sinks = runtime_config.get("log_sinks")
+    if log_sinks is None:
+        return
+    with log_sinks["lock"]:
+        _flush_sinks(runtime_config, log_sinks)
+        for log_type, file in log_sinks["files"].items():
+            file.close()
+            print(f"Log File Written: {file.name} ({log_sinks['counts'][log_type]} entries)")
+    runtime_config["log_sinks"] = None
 
     return
 
+def write_crash_marker(runtime_config, message):
+    """
+    Append a crash marker to the EXCEPTION log whatever the profile; returns its file.
+    """
+    crash_entry = {"timestamp": datetime.now().isoformat(), "session_id": runtime_config["session_id"],
+                   "user_id": runtime_config["user_id"], "log_type": "EXCEPTION", "log_class": "error_critical",
+                   "message": message, "called_by": "main.py"}
+    log_sinks = runtime_config.get("log_sinks")
+    if log_sinks is None:
+        return None
+    with log_sinks["lock"]:
+        log_sinks["pending"].append(crash_entry)
+        _flush_sinks(runtime_config, log_sinks)
+    return log_sinks["files"]["MERGED" if log_sinks["merge_logs"] else "EXCEPTION"].name
+
 if __name__ == "__main__":
     import sys
 
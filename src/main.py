@@ -1,15 +1,21 @@
 # main.py
 
+import os
 import sys
 import json
 import uuid
-import csv
 import src.validation_library as vl
-from datetime import datetime
-from src.file_loader import load_csv
-from src.validator import validate_data
-from src.db_writer import write_to_db
-from src.logger import log_event, write_to_logs
+from src.file_loader import load_csv, load_csv_chunks
+from src.validator import validate_data, validate_chunks, validate_chunk_groups, seed_unique_indexes
+from src.db_writer import write_to_db, write_pipelined
+from src.db_pool import open_pool
+from src.checkpoint import open_checkpoint, write_checkpointed
+from src.row_index import open_row_indexes
+from src.registry import open_registry, claim_file, skip_known_groups, replace_groups, close_registry
+from src.validation_stats import new_validation_stats, write_stats_summary
+from src.quarantine import open_quarantine, close_quarantine
+from src.metrics import open_metrics, close_metrics, build_metrics_record, write_metrics, stage_timer, metered_chunks, count_rows
+from src.logger import log_event, write_to_logs, write_crash_marker, build_log_profile, open_log_sinks
 
 def main(csv_path="", runtime_context=""):
 
@@ -19,40 +25,143 @@ def main(csv_path="", runtime_context=""):
 
     # runtime setup
     runtime_config["session_id"] = str(uuid.uuid4())
-    runtime_config["log_buffer"] = []
     runtime_config["csv_path"] = csv_path
-    log_profile = list()
-    for key, keyval in runtime_config["log_config"]["log_profile"].items():
-        if keyval == True:
-            log_profile.append(key)
-    runtime_config["log_config"]["log_profile"] = log_profile
+    runtime_config["log_config"]["log_profile"] = build_log_profile(runtime_config["log_config"])
 
     # schema setup
     schema = initialize_schema(schema_path)
-    schema_keys = set(schema["schema_definitions"].keys())
 
+    runtime_config["log_sinks"] = open_log_sinks(runtime_config)
+    runtime_config["quarantine"] = open_quarantine(runtime_config)
+    runtime_config["validation_stats"] = new_validation_stats(schema, runtime_config.get("stats_sample_size", 10))
+    runtime_config["metrics"] = open_metrics(runtime_config)
+    registry = checkpoint = None
     try:
-        # Load raw data from a CSV file
-        raw_data = load_csv(runtime_config, schema_keys)
-        if raw_data is None:
-            log_event(runtime_config, {
-                "message": "Aborting pipeline: no data loaded.",
-                "log_type": "ERROR",
-                "log_class": "error_critical",
-                "called_by": "main.py"})
-            return
-
-        # Validate ~~and clean~~ the data
-        cleaned_data = validate_data(runtime_config, schema, raw_data)
+        # the uniqueness sets and reference keys of the schema's cross-row rules
+        runtime_config["row_indexes"] = open_row_indexes(runtime_config, schema, db_config, runtime_context.get("db_pool"))
+
+        # Skip a file the registry has already seen, and with registry_groups the groups it has
+        registry = open_registry(runtime_config, db_config)
+        group_filter = before_frame = None
+        if registry is not None:
+            skip_reason = claim_file(runtime_config, registry)
+            if skip_reason is not None:
+                log_event(runtime_config, {
+                    "message": f"Skipping {csv_path}: {skip_reason}",
+                    "log_type": "EVENT",
+                    "log_class": "procedure_status",
+                    "called_by": "main.py"})
+                runtime_config["metrics"]["status"] = "skipped"
+                return
+            if runtime_config.get("registry_groups"):
+                group_filter = lambda raw_rows: skip_known_groups(runtime_config, registry, raw_rows, schema)
+                before_frame = replace_groups(registry, schema.sort_key)
+
+        if runtime_config.get("resumable"):
+            # Commit whole sort_key groups chunk by chunk, each with a checkpoint, from where
+            # the last run on this file stopped
+            checkpoint = open_checkpoint(runtime_config, db_config, runtime_context["db_pool"],
+                                         registry["fingerprint"] if registry is not None else None)
+            if checkpoint["complete"]:
+                log_event(runtime_config, {
+                    "message": f"{csv_path} was already ingested into {db_config['table']} ({checkpoint['rows_written']} rows); skipping",
+                    "log_type": "EVENT",
+                    "log_class": "procedure_status",
+                    "called_by": "main.py"})
+                runtime_config["metrics"]["status"] = "complete"
+                return
+            if checkpoint["next_source_index"]:
+                log_event(runtime_config, {
+                    "message": f"Resuming {csv_path} at row {checkpoint['next_source_index']} after group "
+                               f"{checkpoint['last_sort_key']} ({checkpoint['rows_written']} rows already written)",
+                    "log_type": "EVENT",
+                    "log_class": "procedure_status",
+                    "called_by": "main.py"})
+            if checkpoint["next_source_index"] and any(rule.rule_name in ("unique", "unique_together") for rule in schema.rules):
+                # the rows before the resume point claim their keys, accepted or not, as in one run
+                with stage_timer(runtime_config, "load_csv"):
+                    prior_chunks = load_csv_chunks(runtime_config, schema)
+                    rows_seen = (seed_unique_indexes(runtime_config, schema, prior_chunks, checkpoint["next_source_index"])
+                                 if prior_chunks is not None else None)
+                if rows_seen is not None:
+                    log_event(runtime_config, {
+                        "message": f"Uniqueness rules start with the keys of the {rows_seen} rows before row {checkpoint['next_source_index']}",
+                        "log_type": "EVENT",
+                        "log_class": "procedure_status",
+                        "called_by": "main.py"})
+            with stage_timer(runtime_config, "load_csv"):
+                raw_chunks = load_csv_chunks(runtime_config, schema, checkpoint["next_source_index"])
+            if raw_chunks is None:
+                log_event(runtime_config, {
+                    "message": "Aborting pipeline: no data loaded.",
+                    "log_type": "ERROR",
+                    "log_class": "error_critical",
+                    "called_by": "main.py"})
+                runtime_config["metrics"]["status"] = "aborted"
+                return
+            raw_chunks = metered_chunks(runtime_config, "load_csv", raw_chunks)
+            validated_groups = metered_chunks(runtime_config, "validate_data",
+                                              validate_chunk_groups(runtime_config, schema, raw_chunks, require_contiguous=True,
+                                                                    group_filter=group_filter),
+                                              count=lambda validated: len(validated[0]) if validated[0] is not None else 0)
+            send_message = f"Writing validated groups to database with checkpoints, starting at row {checkpoint['next_source_index']}"
+        elif runtime_config.get("chunk_size"):
+            # Stream chunks through load -> validate -> write
+            with stage_timer(runtime_config, "load_csv"):
+                raw_chunks = load_csv_chunks(runtime_config, schema)
+            if raw_chunks is None:
+                log_event(runtime_config, {
+                    "message": "Aborting pipeline: no data loaded.",
+                    "log_type": "ERROR",
+                    "log_class": "error_critical",
+                    "called_by": "main.py"})
+                runtime_config["metrics"]["status"] = "aborted"
+                return
+            raw_chunks = metered_chunks(runtime_config, "load_csv", raw_chunks)
+            # the registry hashes and claims whole groups, so with registry_groups a group must not reappear
+            cleaned_data = metered_chunks(runtime_config, "validate_data",
+                                          validate_chunks(runtime_config, schema, raw_chunks, group_filter,
+                                                          require_contiguous=True if group_filter is not None else None))
+            send_message = f"Streaming validated chunks of {runtime_config['chunk_size']} rows to database"
+        else:
+            # Load raw data from a CSV file
+            with stage_timer(runtime_config, "load_csv"):
+                raw_data = load_csv(runtime_config, schema)
+            if raw_data is None:
+                log_event(runtime_config, {
+                    "message": "Aborting pipeline: no data loaded.",
+                    "log_type": "ERROR",
+                    "log_class": "error_critical",
+                    "called_by": "main.py"})
+                runtime_config["metrics"]["status"] = "aborted"
+                return
+            count_rows(runtime_config, "load_csv", rows_out=len(raw_data))
+
+            # Validate ~~and clean~~ the data
+            with stage_timer(runtime_config, "validate_data"):
+                if group_filter is not None:
+                    raw_data = group_filter(raw_data)
+                cleaned_data = validate_data(runtime_config, schema, raw_data)
+            count_rows(runtime_config, "validate_data", rows_out=len(cleaned_data))
+            send_message = f"Sending {len(cleaned_data)} rows to database"
 
         # Write validated data to the database
         log_event(runtime_config, {
-            "message": f"Sending {len(cleaned_data)} rows to database",
+            "message": send_message,
             "log_type": "EVENT",
             "log_class": "function_call",
             "called_by": "main.py"
             })
-        write_to_db(runtime_config, db_config, cleaned_data)
+        # with a pipeline the database work runs on the writer thread; the write_to_db stage is
+        # then the time the pipeline waited for it
+        with stage_timer(runtime_config, "write_to_db"):
+            if runtime_config.get("resumable"):
+                write_checkpointed(runtime_config, db_config, validated_groups, checkpoint, runtime_context["db_pool"], before_frame)
+            elif runtime_config.get("chunk_size") and runtime_config.get("pipeline_depth"):
+                write_pipelined(runtime_config, db_config, cleaned_data, runtime_context.get("db_pool"), before_frame)
+            else:
+                if not write_to_db(runtime_config, db_config, cleaned_data, runtime_context.get("db_pool"), before_frame=before_frame):
+                    raise RuntimeError(f"write to {db_config['table']} failed, see ERROR log")
 
         # Log completion
         log_event(runtime_config, {
@@ -61,27 +170,31 @@ def main(csv_path="", runtime_context=""):
             "log_class": "procedure_status",
             "called_by": "main.py"
             })
-        
-        write_to_logs(runtime_config)
+        runtime_config["metrics"]["status"] = "complete"
 
     except Exception as e:
-        crashrow = {"timestamp": datetime.now().isoformat(), 
-                    "user_id": runtime_config["user_id"], 
-                    "message": f"critical error: {e}", 
-                    }
-        crashlog_name = f"logs/CRASH_{runtime_config['session_id']}.csv"
-        log_buffer = runtime_config["log_buffer"]
-        fieldnames = ["timestamp","message"]
-        for log_entry in log_buffer:
-            fieldnames += [key for key in log_entry.keys() if key not in fieldnames]
-        with open(crashlog_name, mode="w", newline="") as file:
-            writer = csv.DictWriter(file, fieldnames=fieldnames)
-            writer.writeheader()
-            for log_entry in log_buffer:
-                writer.writerow(log_entry)
-            writer.writerow(crashrow)
+        runtime_config["metrics"]["status"] = "crashed"
+        crashlog_name = write_crash_marker(runtime_config, f"critical error: {e}")
         print(f"critical error: {e}\ncrash log written to {crashlog_name}")
 
+    finally:
+        close_metrics(runtime_config)
+        if registry is not None:
+            # rows and groups committed before a crash stay recorded in resumable mode
+            close_registry(runtime_config, registry, runtime_config["metrics"]["status"],
+                           checkpoint["rows_written"] if checkpoint is not None else runtime_config["metrics"]["stages"]["write_to_db"]["rows_out"],
+                           checkpoint["next_source_index"] if checkpoint is not None else None)
+        log_event(runtime_config, {
+            "message": "session metrics: " + json.dumps(build_metrics_record(runtime_config)),
+            "log_type": "EVENT",
+            "log_class": "procedure_status",
+            "called_by": "main.py"
+            })
+        close_quarantine(runtime_config)
+        write_stats_summary(runtime_config)
+        write_to_logs(runtime_config)
+        write_metrics(runtime_config)
+
 def initialize_config(config_path="config/config.json"):
     runtime_context = {}
     with open(config_path, "r") as f:
@@ -92,19 +205,29 @@ def initialize_config(config_path="config/config.json"):
     runtime_context["schema_path"] = config["schema_path"]
 
     # TODO: vl.validate_config() will be called here
-    
-    vl.validate_database(runtime_context["db_config"])
+
+    # one pool per process: the startup check's connection is lent on to every write
+    runtime_context["db_pool"] = open_pool(runtime_context["db_config"])
+    vl.validate_database(runtime_context["db_config"], runtime_context["db_pool"], runtime_context["runtime_config"])
 
     return runtime_context    
 
 def initialize_schema(schema_path):
+    # compiled plans are cached per process, keyed on the schema file and its modification time
+    cache_key = (os.path.abspath(schema_path), os.path.getmtime(schema_path))
+    if cache_key in _schema_plans:
+        return _schema_plans[cache_key]
+
     schema = {}
     with open(schema_path, "r") as f:
         schema = json.load(f)
 
     vl.validate_schema(schema)
 
-    return schema
+    _schema_plans[cache_key] = vl.compile_schema(schema)
+    return _schema_plans[cache_key]
+
+_schema_plans = {}
 
 if __name__ == "__main__":
     # Accept a filepath as a command-line argument, fallback to default
@@ -0,0 +1,188 @@
+# metrics.py
+
+import re
+import sys
+import json
+import time
+import cProfile
+import threading
+import contextlib
+import tracemalloc
+from datetime import datetime
+
+# stages reported for every session, in pipeline order
+METRICS_STAGES = ["load_csv", "validate_data", "write_to_db", "write_to_logs"]
+
+# bumped whenever a field of the metrics record is renamed or removed
+METRICS_SCHEMA_VERSION = 2
+
+def open_metrics(runtime_config):
+    """
+    Start measuring a session, with exclusive per-thread stage timers and optional profilers.
+    """
+    metrics = {
+        "started": datetime.now().isoformat(),
+        "started_wall": time.perf_counter(),
+        "started_cpu": time.process_time(),
+        "status": "running",
+        "stages": {stage: _empty_stage() for stage in METRICS_STAGES},
+        "running": threading.local(),
+        "lock": threading.Lock(),
+        "profiler": None,
+        "profile_files": {}
+    }
+    if runtime_config.get("profile_memory"):
+        tracemalloc.start()
+    if runtime_config.get("profile_cpu"):
+        metrics["profiler"] = cProfile.Profile()
+        metrics["profiler"].enable()
+    return metrics
+
+def _empty_stage():
+    # peak_rss_kb stays None for a stage that only ran off the main thread
+    return {"wall_seconds": 0.0, "cpu_seconds": 0.0, "rows_in": 0, "rows_out": 0, "calls": 0, "peak_rss_kb": None}
+
+@contextlib.contextmanager
+def stage_timer(runtime_config, stage):
+    """Time the enclosed block as stage; does nothing when the session has no metrics."""
+    metrics = runtime_config.get("metrics")
+    if metrics is None:
+        yield
+        return
+    running = metrics["running"].__dict__.setdefault("stack", [])
+    if running:
+        _pause(metrics, running[-1])
+    running.append([stage, time.perf_counter(), time.thread_time()])
+    _reset_stage_peak()
+    try:
+        yield
+    finally:
+        _pause(metrics, running.pop())
+        with metrics["lock"]:
+            metrics["stages"][stage]["calls"] += 1
+        if running:
+            running[-1][1:] = [time.perf_counter(), time.thread_time()]
+            _reset_stage_peak()
+
+def _pause(metrics, running_stage):
+    stage, wall_started, cpu_started = running_stage
+    with metrics["lock"]:
+        stage_metrics = metrics["stages"][stage]
+        stage_metrics["wall_seconds"] += time.perf_counter() - wall_started
+        stage_metrics["cpu_seconds"] += time.thread_time() - cpu_started
+        if threading.current_thread() is threading.main_thread():
+            stage_metrics["peak_rss_kb"] = max(stage_metrics["peak_rss_kb"] or 0, peak_rss_kb())
+
+def _reset_stage_peak():
+    # the high-water mark is the process's: a reset from the writer thread would wipe the peak of
+    # the stage the main thread is running, so only main-thread stages reset and read it
+    if threading.current_thread() is threading.main_thread():
+        reset_peak_rss()
+
+def count_rows(runtime_config, stage, rows_in=0, rows_out=0):
+    metrics = runtime_config.get("metrics")
+    if metrics is None:
+        return
+    with metrics["lock"]:
+        metrics["stages"][stage]["rows_in"] += rows_in
+        metrics["stages"][stage]["rows_out"] += rows_out
+
+def metered_chunks(runtime_config, stage, chunks, count=len):
+    # time each chunk a streaming stage produces, and count its rows (count(chunk)) as that stage's output
+    chunks = iter(chunks)
+    while True:
+        with stage_timer(runtime_config, stage):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        count_rows(runtime_config, stage, rows_out=count(chunk))
+        yield chunk
+
+def close_metrics(runtime_config):
+    """
+    Stop the session clock and the profilers, dumping their output next to the metrics.
+    """
+    metrics = runtime_config["metrics"]
+    metrics["finished"] = datetime.now().isoformat()
+    metrics["wall_seconds"] = time.perf_counter() - metrics["started_wall"]
+    metrics["cpu_seconds"] = time.process_time() - metrics["started_cpu"]
+    if metrics["profiler"] is not None:
+        metrics["profiler"].disable()
+        metrics["profile_files"]["cprofile"] = _metrics_path(runtime_config, "prof")
+        metrics["profiler"].dump_stats(metrics["profile_files"]["cprofile"])
+    if tracemalloc.is_tracing():
+        _, metrics["traced_peak_bytes"] = tracemalloc.get_traced_memory()
+        top_sites = tracemalloc.take_snapshot().statistics("lineno")[:runtime_config.get("profile_memory_top", 25)]
+        tracemalloc.stop()
+        metrics["profile_files"]["tracemalloc"] = _metrics_path(runtime_config, "txt")
+        with open(metrics["profile_files"]["tracemalloc"], mode="w") as f:
+            f.write("\n".join(str(site) for site in top_sites) + "\n")
+
+def build_metrics_record(runtime_config):
+    """
+    The session's metrics record, with zeros for stages that did not run.
+    """
+    metrics = runtime_config["metrics"]
+    with metrics["lock"]:
+        stages = {stage: dict(stage_metrics) for stage, stage_metrics in metrics["stages"].items()}
+    rows_in = stages["load_csv"]["rows_out"]
+    for stage in ("load_csv", "validate_data", "write_to_db"):
+        stages[stage]["rows_in"] = rows_in
+        rows_in = stages[stage]["rows_out"]
+    for stage_metrics in stages.values():
+        stage_metrics["wall_seconds"] = round(stage_metrics["wall_seconds"], 4)
+        stage_metrics["cpu_seconds"] = round(stage_metrics["cpu_seconds"], 4)
+        stage_metrics["rows_per_sec"] = round(stage_metrics["rows_in"] / stage_metrics["wall_seconds"]) if stage_metrics["wall_seconds"] else 0
+        stage_peak_kb = stage_metrics.pop("peak_rss_kb")
+        stage_metrics["process_peak_rss_mb"] = None if stage_peak_kb is None else round(stage_peak_kb / 1024, 1)
+    wall_seconds = metrics.get("wall_seconds", time.perf_counter() - metrics["started_wall"])
+    return {
+        "schema_version": METRICS_SCHEMA_VERSION,
+        "session_id": runtime_config["session_id"],
+        "user_id": runtime_config["user_id"],
+        "csv_path": runtime_config["csv_path"],
+        "status": metrics["status"],
+        "started": metrics["started"],
+        "finished": metrics.get("finished"),
+        "wall_seconds": round(wall_seconds, 4),
+        "cpu_seconds": round(metrics.get("cpu_seconds", time.process_time() - metrics["started_cpu"]), 4),
+        "rows_in": stages["load_csv"]["rows_out"],
+        "rows_out": stages["write_to_db"]["rows_out"],
+        "rows_per_sec": round(stages["load_csv"]["rows_out"] / wall_seconds) if wall_seconds else 0,
+        "peak_rss_mb": max([round(peak_rss_kb() / 1024, 1)] + [stage_metrics["process_peak_rss_mb"] or 0 for stage_metrics in stages.values()]),
+        "traced_peak_mb": round(metrics["traced_peak_bytes"] / 2**20, 1) if "traced_peak_bytes" in metrics else None,
+        "stages": stages,
+        "profile_files": {"cprofile": metrics["profile_files"].get("cprofile"),
+                          "tracemalloc": metrics["profile_files"].get("tracemalloc")}
+    }
+
+def write_metrics(runtime_config):
+    metrics_path = _metrics_path(runtime_config, "json")
+    with open(metrics_path, mode="w") as f:
+        json.dump(build_metrics_record(runtime_config), f, indent=4)
+    print(f"Metrics Written: {metrics_path}")
+    return metrics_path
+
+def _metrics_path(runtime_config, file_type):
+    metrics_filename = runtime_config["log_config"].get("metrics_filename", "logs/{session_id}_METRICS.{file_type}")
+    return metrics_filename.format(session_id=runtime_config["session_id"], file_type=file_type)
+
+# Peak resident memory. On Linux the high-water mark (VmHWM) can be reset by writing 5 to
+# /proc/self/clear_refs, which gives the peak of each stage; elsewhere ru_maxrss is the
+# process peak so far.
+
+def peak_rss_kb():
+    try:
+        with open("/proc/self/status", "r") as f:
+            return int(re.search(r"VmHWM:\s+(\d+)", f.read()).group(1))
+    except (OSError, AttributeError):
+        import resource
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == "darwin" else 1)
+
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
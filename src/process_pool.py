@@ -0,0 +1,21 @@
+# process_pool.py
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+def can_fork():
+    # forked workers start with the modules already imported and see the parent's memory copy-on-write
+    return "fork" in multiprocessing.get_all_start_methods()
+
+def usable_cpus():
+    # the cores this process may run on, which can be fewer than the machine has
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def open_process_pool(workers, initializer=None, initargs=()):
+    # the worker processes of batch, daemon, parallel parsing and parallel validation: forked
+    # where the platform can fork, started by the platform's default method elsewhere
+    mp_context = multiprocessing.get_context("fork") if can_fork() else None
+    return ProcessPoolExecutor(workers, mp_context=mp_context, initializer=initializer, initargs=initargs)
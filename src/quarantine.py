@@ -0,0 +1,123 @@
+# quarantine.py
+
+import io
+import os
+import csv
+import contextlib
+import importlib.util
+import pandas as pd
+from src.logger import log_event
+from src.decompress import detect_compression, open_csv
+
+def open_quarantine(runtime_config):
+    """
+    Open the session's quarantine sink, or None when quarantine_filename is empty.
+    """
+    quarantine_filename = runtime_config["log_config"].get("quarantine_filename", "logs/{session_id}_QUARANTINE.{file_type}")
+    if not quarantine_filename:
+        return None
+    file_type = runtime_config.get("quarantine_format", "csv")
+    if file_type == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        log_event(runtime_config, {
+            "message": "quarantine_format 'parquet' requested but pyarrow is not installed; using 'csv'",
+            "log_type": "EVENT",
+            "log_class": "error_minor",
+            "called_by": "open_quarantine"
+            })
+        file_type = "csv"
+    if file_type not in ("csv", "parquet"):
+        raise ValueError(f"unknown quarantine_format {file_type!r}; expected 'csv' or 'parquet'")
+    return {
+        "path": quarantine_filename.format(session_id=runtime_config["session_id"], file_type=file_type),
+        "file_type": file_type,
+        "writer": None,
+        "rows": 0,
+        "source": None
+    }
+
+def write_quarantine(runtime_config, rejected_reasons):
+    """
+    Append the source rows of rejected_reasons (source_index, then the reason columns) to the quarantine file.
+    """
+    quarantine = runtime_config.get("quarantine")
+    if quarantine is None or rejected_reasons.empty:
+        return
+    header, records = source_records(quarantine, runtime_config["csv_path"], rejected_reasons["source_index"])
+    width = len(header)
+    raw_rows = pd.DataFrame([record[:width] + [None] * (width - len(record)) for record in records],
+                            columns=header, dtype="string")
+    rejected_rows = pd.concat([rejected_reasons[["source_index"]], raw_rows,
+                               rejected_reasons.drop(columns="source_index")], axis=1)
+    if quarantine["file_type"] == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if quarantine["writer"] is None:
+            table = pa.Table.from_pandas(rejected_rows, preserve_index=False)
+            quarantine["writer"] = pq.ParquetWriter(quarantine["path"], table.schema)
+        else:
+            table = pa.Table.from_pandas(rejected_rows, schema=quarantine["writer"].schema, preserve_index=False)
+        quarantine["writer"].write_table(table)
+    else:
+        rejected_rows.to_csv(quarantine["path"], mode="a" if quarantine["rows"] else "w", header=not quarantine["rows"], index=False)
+    quarantine["rows"] += len(rejected_rows)
+
+def source_records(quarantine, csv_path, source_indexes):
+    """
+    The header and the fields of the rows at source_indexes (ascending), as text from the source file.
+    """
+    # the file is read forward once; a row behind the reader opens the file again
+    source = quarantine["source"]
+    records = []
+    for source_index in source_indexes:
+        if source is None or source_index < source["next_index"]:
+            source = open_source(quarantine, csv_path)
+        for record in source["reader"]:
+            if not record:
+                # blank lines are skipped, as pandas skips them
+                continue
+            source["next_index"] += 1
+            if source["next_index"] == source_index + 1:
+                records.append(record)
+                break
+        else:
+            raise ValueError(f"row {source_index} is not in {csv_path}")
+    return source["header"], records
+
+def open_source(quarantine, csv_path):
+    close_source(quarantine)
+    inputs = contextlib.ExitStack()
+    compression = detect_compression(csv_path)
+    source = inputs.enter_context(open_csv(csv_path, compression))
+    if compression is None:
+        text = inputs.enter_context(open(source, "r", encoding="utf-8-sig", newline=""))
+    else:
+        text = inputs.enter_context(io.TextIOWrapper(io.BufferedReader(source), encoding="utf-8-sig", newline=""))
+    reader = csv.reader(text)
+    quarantine["source"] = {"inputs": inputs, "reader": reader, "header": next(reader, []), "next_index": 0}
+    return quarantine["source"]
+
+def close_source(quarantine):
+    if quarantine["source"] is not None:
+        quarantine["source"]["inputs"].close()
+        quarantine["source"] = None
+
+def close_quarantine(runtime_config):
+    """
+    Finish the quarantine file and log how many rows it holds.
+    """
+    quarantine = runtime_config.get("quarantine")
+    if quarantine is None:
+        return
+    close_source(quarantine)
+    if not quarantine["rows"]:
+        return
+    if quarantine["writer"] is not None:
+        quarantine["writer"].close()
+        quarantine["writer"] = None
+    log_event(runtime_config, {
+        "message": f"{quarantine['rows']} rejected rows quarantined to {quarantine['path']}",
+        "log_type": "INGEST",
+        "log_class": "info_general",
+        "called_by": "close_quarantine"
+        })
+    print(f"Quarantine Written: {quarantine['path']} ({quarantine['rows']} rows)")
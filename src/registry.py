@@ -0,0 +1,275 @@
+# registry.py
+
+import os
+import time
+import socket
+import sqlite3
+import contextlib
+import numpy as np
+import pandas as pd
+from src.checkpoint import file_fingerprint
+from src.file_loader import BOOLEAN_STRINGS
+from src.logger import log_event
+
+# ingested_files: one row per (file contents, destination table) with the session that claimed it.
+# ingested_groups: the content hash of every sort_key group written to a table.
+# pending_groups: groups claimed by a running session, moved to ingested_groups once committed.
+REGISTRY_DDL = """
+CREATE TABLE IF NOT EXISTS ingested_files (
+    fingerprint TEXT NOT NULL,
+    dest_table TEXT NOT NULL,
+    csv_path TEXT,
+    file_size INTEGER,
+    file_mtime_ns INTEGER,
+    status TEXT NOT NULL,
+    session_id TEXT,
+    host TEXT,
+    pid INTEGER,
+    rows_written INTEGER,
+    claimed_at REAL,
+    completed_at REAL,
+    PRIMARY KEY (fingerprint, dest_table)
+);
+CREATE INDEX IF NOT EXISTS ingested_files_stat ON ingested_files (csv_path, file_size, file_mtime_ns);
+CREATE TABLE IF NOT EXISTS ingested_groups (
+    dest_table TEXT NOT NULL,
+    sort_key TEXT NOT NULL,
+    group_hash INTEGER NOT NULL,
+    session_id TEXT,
+    PRIMARY KEY (dest_table, sort_key)
+);
+CREATE TABLE IF NOT EXISTS pending_groups (
+    dest_table TEXT NOT NULL,
+    sort_key TEXT NOT NULL,
+    group_hash INTEGER NOT NULL,
+    session_id TEXT NOT NULL,
+    last_source_index INTEGER NOT NULL,
+    PRIMARY KEY (dest_table, sort_key)
+);
+"""
+
+def open_registry(runtime_config, db_config):
+    """
+    Open the SQLite registry at runtime_config["registry_path"], or None when no path is set.
+    """
+    registry_path = runtime_config.get("registry_path")
+    if not registry_path:
+        return None
+    if os.path.dirname(registry_path):
+        os.makedirs(os.path.dirname(registry_path), exist_ok=True)
+    conn = sqlite3.connect(registry_path, timeout=runtime_config.get("registry_busy_timeout", 30),
+                           isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.executescript(REGISTRY_DDL)
+    return {
+        "conn": conn,
+        "dest_table": db_config["table"],
+        "session_id": runtime_config["session_id"],
+        "claim_timeout": runtime_config.get("registry_claim_timeout", 3600),
+        "fingerprint": None,
+        "claimed": False,
+        "replaced_keys": set(),
+        "groups_skipped": 0,
+        "rows_skipped": 0
+    }
+
+def claim_file(runtime_config, registry):
+    """
+    Claim the session's file; returns None, or the reason the file must be skipped.
+    """
+    csv_path = runtime_config["csv_path"]
+    file_stat = os.stat(csv_path)
+    conn = registry["conn"]
+    known = conn.execute("SELECT session_id, completed_at FROM ingested_files WHERE csv_path = ? AND file_size = ? "
+                         "AND file_mtime_ns = ? AND dest_table = ? AND status = 'complete';",
+                         (os.path.abspath(csv_path), file_stat.st_size, file_stat.st_mtime_ns, registry["dest_table"])).fetchone()
+    if known is not None:
+        return f"already ingested into {registry['dest_table']} by session {known[0]} at {_format_time(known[1])}"
+
+    registry["fingerprint"] = file_fingerprint(csv_path)
+    with _immediate(conn):
+        claimed = conn.execute("SELECT status, session_id, host, pid, claimed_at, completed_at FROM ingested_files "
+                               "WHERE fingerprint = ? AND dest_table = ?;",
+                               (registry["fingerprint"], registry["dest_table"])).fetchone()
+        if claimed is not None:
+            status, session_id, host, pid, claimed_at, completed_at = claimed
+            if status == "complete":
+                return (f"identical to a file already ingested into {registry['dest_table']} "
+                        f"by session {session_id} at {_format_time(completed_at)}")
+            if status == "running" and _claim_alive(registry, host, pid, claimed_at):
+                return f"being ingested by session {session_id} (pid {pid} on {host})"
+        conn.execute("INSERT OR REPLACE INTO ingested_files (fingerprint, dest_table, csv_path, file_size, file_mtime_ns, "
+                     "status, session_id, host, pid, rows_written, claimed_at, completed_at) "
+                     "VALUES (?, ?, ?, ?, ?, 'running', ?, ?, ?, 0, ?, NULL);",
+                     (registry["fingerprint"], registry["dest_table"], os.path.abspath(csv_path), file_stat.st_size,
+                      file_stat.st_mtime_ns, registry["session_id"], socket.gethostname(), os.getpid(), time.time()))
+    registry["claimed"] = True
+    return None
+
+def skip_known_groups(runtime_config, registry, raw_rows, schema):
+    """
+    Drop the groups of raw_rows already written unchanged or claimed elsewhere, claiming the rest.
+    """
+    if raw_rows.empty:
+        return raw_rows
+    sort_key = schema.sort_key
+    incoming = group_hashes(raw_rows, schema)
+    conn = registry["conn"]
+    with _immediate(conn):
+        _renew_claim(registry)
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS incoming_groups "
+                     "(sort_key TEXT PRIMARY KEY, group_hash INTEGER, last_source_index INTEGER, skipped INTEGER);")
+        conn.execute("DELETE FROM incoming_groups;")
+        conn.executemany("INSERT INTO incoming_groups VALUES (?, ?, ?, 0);", incoming.itertuples(index=False, name=None))
+        known = pd.DataFrame(conn.execute(
+            "SELECT i.sort_key, i.group_hash = g.group_hash, g.group_hash IS NOT NULL, p.session_id, f.host, f.pid, f.claimed_at "
+            "FROM incoming_groups i "
+            "LEFT JOIN ingested_groups g ON g.dest_table = ? AND g.sort_key = i.sort_key "
+            "LEFT JOIN pending_groups p ON p.dest_table = ? AND p.sort_key = i.sort_key AND p.session_id != ? "
+            "LEFT JOIN ingested_files f ON f.session_id = p.session_id AND f.status = 'running' "
+            "WHERE g.group_hash IS NOT NULL OR p.session_id IS NOT NULL;",
+            (registry["dest_table"], registry["dest_table"], registry["session_id"])).fetchall(),
+            columns=["sort_key", "unchanged", "written", "claimed_by", "host", "pid", "claimed_at"])
+        busy = known["claimed_by"].notna().to_numpy() & np.array(
+            [_claim_alive(registry, *claim) for claim in known[["host", "pid", "claimed_at"]].itertuples(index=False, name=None)], dtype=bool)
+        unchanged = (known["unchanged"] == 1).to_numpy()
+        skipped_keys = set(known.loc[unchanged | busy, "sort_key"])
+        replaced_keys = set(known.loc[(known["written"] == 1).to_numpy() & ~unchanged & ~busy, "sort_key"])
+        conn.executemany("UPDATE incoming_groups SET skipped = 1 WHERE sort_key = ?;", ((key,) for key in skipped_keys))
+        conn.execute("INSERT OR REPLACE INTO pending_groups (dest_table, sort_key, group_hash, session_id, last_source_index) "
+                     "SELECT ?, sort_key, group_hash, ?, last_source_index FROM incoming_groups WHERE skipped = 0;",
+                     (registry["dest_table"], registry["session_id"]))
+
+    # a new set rather than an update: a pipelined writer thread may be reading the old one
+    registry["replaced_keys"] = registry["replaced_keys"] | replaced_keys
+    if not skipped_keys:
+        return raw_rows
+    row_keys = raw_rows[sort_key].astype("string")
+    skipped_rows = row_keys.isin(skipped_keys).to_numpy(dtype=bool, na_value=False)
+    registry["groups_skipped"] += len(skipped_keys)
+    registry["rows_skipped"] += int(skipped_rows.sum())
+    if busy.any():
+        log_event(runtime_config, {
+            "message": f"{int(busy.sum())} {sort_key} groups skipped: claimed by another running session",
+            "log_type": "INGEST",
+            "log_class": "info_general",
+            "called_by": "registry.py"
+            })
+    return raw_rows[~skipped_rows]
+
+def group_hashes(raw_rows, schema):
+    """
+    A content hash and last source_index per sort_key group of raw_rows.
+    """
+    sort_key = schema.sort_key
+    content = canonical_text(raw_rows, schema)
+    content["group_position"] = raw_rows.groupby(sort_key, sort=False, observed=True).cumcount().astype("string")
+    row_hashes = pd.util.hash_pandas_object(content, index=False, categorize=False).astype("int64")
+    grouped = pd.DataFrame({"sort_key": content[sort_key], "group_hash": row_hashes,
+                            "last_source_index": raw_rows["source_index"]}).groupby("sort_key", sort=False)
+    return pd.DataFrame({"group_hash": grouped["group_hash"].sum(),
+                         "last_source_index": grouped["last_source_index"].max()}).reset_index()
+
+def canonical_text(raw_rows, schema):
+    # the cells as text that does not depend on how their column was loaded: a numeric or boolean
+    # column is text in a file or chunk where some value did not convert, so its values that do
+    # convert are rendered as float64 ("12.50" and 12.5 alike as "12.5") or True/False
+    column_dtypes = {column.col_name: column.dtype for column in schema.columns}
+    content = pd.DataFrame(index=raw_rows.index)
+    for col_name in sorted(col for col in raw_rows.columns if col != "source_index"):
+        text = raw_rows[col_name].astype("string")
+        if column_dtypes.get(col_name) in ("Int64", "float64"):
+            numbers = pd.to_numeric(raw_rows[col_name], errors="coerce").astype("float64")
+            text = text.mask(numbers.notna(), numbers.astype("string"))
+        elif column_dtypes.get(col_name) == "boolean":
+            text = text.replace({value: str(flag) for value, flag in BOOLEAN_STRINGS.items()})
+        content[col_name] = text
+    return content
+
+def replace_groups(registry, sort_key):
+    """
+    A write_to_db before_frame hook deleting the earlier rows of changed groups once each.
+    """
+    def delete_replaced(cur, dest_table, frame, transaction):
+        if not registry["replaced_keys"] or frame.empty:
+            return
+        deleted_keys = transaction.setdefault("replaced_groups", set())
+        frame_keys = pd.Series(frame[sort_key].dropna().unique())
+        key_text = frame_keys.astype("string")
+        due = (key_text.isin(registry["replaced_keys"]) & ~key_text.isin(deleted_keys)).to_numpy(dtype=bool, na_value=False)
+        if due.any():
+            cur.execute(f"DELETE FROM {dest_table} WHERE {sort_key} = ANY(%s);", (frame_keys[due].tolist(),))
+            deleted_keys.update(key_text[due])
+    return delete_replaced
+
+def close_registry(runtime_config, registry, status, rows_written=0, committed_before=None):
+    """
+    Record how the session ended, release what it did not commit, and close the registry.
+    """
+    conn = registry["conn"]
+    try:
+        with _immediate(conn):
+            committed_rows = None
+            if status == "complete":
+                committed_rows = (registry["dest_table"], registry["session_id"], float("inf"))
+            elif committed_before:
+                committed_rows = (registry["dest_table"], registry["session_id"], committed_before)
+            if committed_rows is not None:
+                conn.execute("INSERT OR REPLACE INTO ingested_groups (dest_table, sort_key, group_hash, session_id) "
+                             "SELECT dest_table, sort_key, group_hash, session_id FROM pending_groups "
+                             "WHERE dest_table = ? AND session_id = ? AND last_source_index < ?;", committed_rows)
+            conn.execute("DELETE FROM pending_groups WHERE dest_table = ? AND session_id = ?;",
+                         (registry["dest_table"], registry["session_id"]))
+            if registry["claimed"]:
+                conn.execute("UPDATE ingested_files SET status = ?, rows_written = ?, completed_at = ? "
+                             "WHERE fingerprint = ? AND dest_table = ? AND session_id = ?;",
+                             ("complete" if status == "complete" else "failed", rows_written, time.time(),
+                              registry["fingerprint"], registry["dest_table"], registry["session_id"]))
+    finally:
+        conn.close()
+    if registry["groups_skipped"]:
+        log_event(runtime_config, {
+            "message": f"{registry['groups_skipped']} groups ({registry['rows_skipped']} rows) skipped as already ingested or "
+                       f"claimed; {len(registry['replaced_keys'])} changed groups replaced their earlier rows",
+            "log_type": "INGEST",
+            "log_class": "info_general",
+            "called_by": "registry.py"
+            })
+
+def _renew_claim(registry):
+    # long sessions keep their claim fresh each time they consult the registry
+    if registry["claimed"]:
+        registry["conn"].execute("UPDATE ingested_files SET claimed_at = ? WHERE fingerprint = ? AND dest_table = ? "
+                                 "AND session_id = ?;", (time.time(), registry["fingerprint"],
+                                                         registry["dest_table"], registry["session_id"]))
+
+def _claim_alive(registry, host, pid, claimed_at):
+    if claimed_at is None or pd.isna(claimed_at) or time.time() - claimed_at > registry["claim_timeout"]:
+        return False
+    return owner_alive(host, pid)
+
+def owner_alive(host, pid):
+    # a process of another host is taken as alive; only one of this host can be checked
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+@contextlib.contextmanager
+def _immediate(conn):
+    # BEGIN IMMEDIATE takes the write lock up front, so a read-then-write cannot race another process
+    conn.execute("BEGIN IMMEDIATE;")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK;")
+        raise
+    conn.execute("COMMIT;")
+
+def _format_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)) if timestamp else "an unknown time"
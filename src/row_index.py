@@ -0,0 +1,118 @@
+# row_index.py
+
+import os
+import json
+import time
+import psycopg2
+import pandas as pd
+from src.db_pool import get_connection, put_connection
+from src.logger import log_event
+
+def open_row_indexes(runtime_config, schema, db_config, db_pool=None):
+    """
+    The session's indexes of the cross-row rules, by rule_id.
+    """
+    row_indexes = {}
+    column_dtypes = {column.col_name: column.dtype for column in schema.columns}
+    for rule in schema.rules:
+        if rule.rule_name in ("unique", "unique_together"):
+            row_indexes[rule.rule_id] = set()
+        elif rule.rule_name == "references":
+            row_indexes[rule.rule_id] = reference_index(runtime_config, db_config, db_pool, rule.params,
+                                                        column_dtypes[rule.col_name])
+    return row_indexes
+
+def reference_index(runtime_config, db_config, db_pool, reference, dtype=None):
+    """
+    The keys of reference.table.column as a pandas Index, fetched once and cached.
+    """
+    cached_keys = _cached_keys(runtime_config, db_config, db_pool, reference)
+    if dtype not in cached_keys["indexes"]:
+        key_index = pd.Index(cached_keys["keys"], dtype=object)
+        if dtype in ("Int64", "float64"):
+            numeric_keys = pd.to_numeric(key_index, errors="coerce")
+            numeric_keys = numeric_keys[~numeric_keys.isna()]
+            if dtype == "Int64":
+                numeric_keys = numeric_keys[numeric_keys % 1 == 0].astype("int64")
+            key_index = numeric_keys.unique()
+        cached_keys["indexes"][dtype] = key_index
+    return cached_keys["indexes"][dtype]
+
+def _cached_keys(runtime_config, db_config, db_pool, reference):
+    cache_key = (db_config["host"], db_config["port"], db_config["name"], reference.table, reference.column)
+    ttl = runtime_config.get("reference_cache_ttl", 3600)
+    cached_keys = _reference_keys.get(cache_key)
+    if cached_keys is not None and time.time() - cached_keys["fetched_at"] < ttl:
+        return cached_keys
+
+    source = "database"
+    cache_dir = runtime_config.get("reference_cache_path")
+    cache_file = os.path.join(cache_dir, f"{db_config['name']}.{reference.table}.{reference.column}.json") if cache_dir else None
+    cached_keys = _read_cache_file(cache_file, cache_key, ttl)
+    if cached_keys is not None:
+        source = f"{cache_file}, fetched {time.time() - cached_keys['fetched_at']:.0f}s ago"
+    else:
+        cached_keys = {"cache_key": list(cache_key), "fetched_at": time.time(),
+                       "keys": fetch_reference_keys(db_config, db_pool, reference)}
+        if cache_file is not None:
+            _write_cache_file(cache_file, cached_keys)
+    cached_keys["indexes"] = {}
+    _reference_keys[cache_key] = cached_keys
+    log_event(runtime_config, {
+        "message": f"references {reference.table}.{reference.column}: {len(cached_keys['keys'])} keys from {source}",
+        "log_type": "INGEST",
+        "log_class": "info_general",
+        "called_by": "row_index.py"
+        })
+    return cached_keys
+
+def fetch_reference_keys(db_config, db_pool, reference):
+    # the distinct non-null values of the referenced column, as text
+    try:
+        conn = get_connection(db_pool) if db_pool is not None else psycopg2.connect(
+            host=db_config["host"],
+            port=db_config["port"],
+            dbname=db_config["name"],
+            user=db_config["user"],
+            password=db_config["password"],
+            connect_timeout=5
+        )
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"SELECT DISTINCT {reference.column}::text FROM {reference.table} "
+                               f"WHERE {reference.column} IS NOT NULL;")
+                keys = [key for key, in cursor.fetchall()]
+            conn.rollback()
+        finally:
+            if db_pool is not None:
+                put_connection(db_pool, conn)
+            else:
+                conn.close()
+    except psycopg2.Error as e:
+        raise RuntimeError(f"cannot read reference keys from {reference.table}.{reference.column}: {e}")
+    return keys
+
+def _read_cache_file(cache_file, cache_key, ttl):
+    # the cached keys if the file exists, is for the same column of the same database, and is fresh
+    if cache_file is None or not os.path.exists(cache_file):
+        return None
+    try:
+        with open(cache_file, "r") as f:
+            cached_keys = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached_keys.get("cache_key") != list(cache_key) or time.time() - cached_keys.get("fetched_at", 0) >= ttl:
+        return None
+    return cached_keys
+
+def _write_cache_file(cache_file, cached_keys):
+    # written to a temporary file and renamed, so readers in other processes never see half a file
+    os.makedirs(os.path.dirname(cache_file) or ".", exist_ok=True)
+    temp_file = f"{cache_file}.{os.getpid()}.tmp"
+    with open(temp_file, "w") as f:
+        json.dump({key: value for key, value in cached_keys.items() if key != "indexes"}, f)
+    os.replace(temp_file, cache_file)
+
+# per process: the reference keys read so far, keyed on database and column, with the Index
+# built from them for each dtype that asked
+_reference_keys = {}
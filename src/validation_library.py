@@ -1,10 +1,14 @@
 # validation_library.py
 
+import numpy as np
 import pandas as pd
 import psycopg2
 import re
 import sys
+from collections import namedtuple
 from psycopg2.extras import execute_values
+from src.db_pool import get_connection, put_connection
+from src.db_writer import LOAD_POLICIES, policies_in_use
 
 def build_dispatch_table():
     return {
@@ -12,10 +16,99 @@ def build_dispatch_table():
         "format": format_compliance,
         "value_restrictions": value_restrictions,
         "data_type": valid_datatype,
-        "limit": limit_value
+        "limit": limit_value,
+        "unique": unique_value,
+        "unique_together": unique_value,
+        "references": referenced_value
     }
 
+def build_column_dispatch_table():
+    return {
+        "required": column_required,
+        "format": column_format,
+        "value_restrictions": column_value_restrictions,
+        "data_type": column_datatype,
+        "limit": column_limit,
+        "unique": index_unique,
+        "unique_together": index_unique,
+        "references": index_references
+    }
+
+def build_column_warn_table():
+    # column functions marking the valid cells that the scalar rule reports as validation_warn
+    return {
+        "data_type": column_datatype_cast
+    }
+
+def build_compile_table():
+    return {
+        "required": lambda schema_rule: schema_rule,
+        "format": re.compile,
+        "value_restrictions": compile_value_restrictions,
+        "data_type": compile_datatype,
+        "limit": compile_limit,
+        "unique": lambda schema_rule: UniqueRule(()),
+        "unique_together": lambda schema_rule: UniqueRule(tuple(schema_rule)),
+        "references": lambda schema_rule: ReferenceRule(schema_rule["table"], schema_rule["column"])
+    }
+
+# rules whose column functions cast numbers, and take the casts of the column made so far
+# (see cast_numeric_column), since a column's data_type and limit rules cast it alike
+CAST_RULES = frozenset(["data_type", "limit"])
+
+# rules that test a cell against the other rows of the session rather than on its own value;
+# their column functions run on the session's row indexes (see index_unique, index_references)
+INDEX_RULES = frozenset(["unique", "unique_together", "references"])
+
+# The compiled schema plan is defined in this section. compile_schema() turns a validated
+# schema.json into immutable tuples that the validator executes directly: every rule carries
+# its precompiled parameters (params) and the scalar and column functions that test it.
+
+SchemaPlan = namedtuple("SchemaPlan", ["sort_key", "group_reject", "columns", "rules"])
+ColumnPlan = namedtuple("ColumnPlan", ["col_name", "rules", "dtype", "data_type"])
+RulePlan = namedtuple("RulePlan", ["rule_id", "col_name", "rule_name", "params", "validation_func", "column_func"])
+RestrictionRule = namedtuple("RestrictionRule", ["mode", "values"])
+DataTypeRule = namedtuple("DataTypeRule", ["expected_type", "caster"])
+LimitRule = namedtuple("LimitRule", ["min", "max", "min_caster", "max_caster"])
+UniqueRule = namedtuple("UniqueRule", ["together"])
+ReferenceRule = namedtuple("ReferenceRule", ["table", "column"])
+
+def compile_schema(schema):
+    dispatch_table = build_dispatch_table()
+    column_dispatch_table = build_column_dispatch_table()
+    compile_table = build_compile_table()
+    columns = []
+    rules = []
+    for col_name, col_rules in schema["schema_definitions"].items():
+        col_plan = []
+        data_type = col_rules.get("rules", {}).get("data_type")
+        dtype = POSTGRES_PANDAS_DTYPE_MAP.get(data_type.upper()) if data_type is not None else None
+        for rule_name, schema_rule in col_rules.get("rules", {}).items():
+            rule = RulePlan(len(rules), col_name, rule_name, compile_table[rule_name](schema_rule),
+                            dispatch_table[rule_name], column_dispatch_table[rule_name])
+            col_plan.append(rule)
+            rules.append(rule)
+        columns.append(ColumnPlan(col_name, tuple(col_plan), dtype, data_type.upper() if data_type is not None else None))
+    return SchemaPlan(schema["sort_key"], schema["group_reject"], tuple(columns), tuple(rules))
+
+def compile_value_restrictions(schema_rule):
+    restriction_mode = list(schema_rule.keys())[0]
+    return RestrictionRule(restriction_mode, frozenset(schema_rule[restriction_mode]))
+
+def compile_datatype(schema_rule):
+    expected_type = schema_rule.upper()
+    return DataTypeRule(expected_type, POSTGRES_PYTHON_DATA_MAP.get(expected_type))
+
+def compile_limit(schema_rule):
+    min_value = schema_rule.get("min")
+    max_value = schema_rule.get("max")
+    return LimitRule(min_value, max_value,
+                     type(min_value) if min_value is not None else None,
+                     type(max_value) if max_value is not None else None)
+
 # Validation functions to test schema requirements are defined in this section.
+# Each receives the compiled parameters of its rule (see compile_schema) as schema_rule.
+# Messages are str.format templates with message_args, formatted only if the entry is logged.
 # TODO: Refactor all validation functions to return {"valid": bool, "log": bool}
 
 def valid_required(schema_rule, test_value):
@@ -23,110 +116,373 @@ def valid_required(schema_rule, test_value):
     if test_value is None or pd.isnull(test_value):
         return {
             "valid": False, "log_class": "validation_reject", "called_by": "valid_required",
-            "message": f"is missing or null"
+            "message": "is missing or null"
             }
     return {
         "valid": True, "log_class": "validation_accept", "called_by": "valid_required",
-        "message": f"exists and is not null"
+        "message": "exists and is not null"
         }
 
 def format_compliance(schema_rule, test_value):
-# regex format compliance test
-    if not re.match(schema_rule, str(test_value)):
+# regex format compliance test, schema_rule is a compiled pattern
+    if not schema_rule.match(str(test_value)):
         return {
             "valid": False, "log_class": "validation_reject", "called_by": "format_compliance",
-            "message": f"does not comply with format {schema_rule}"
+            "message": "does not comply with format {}", "message_args": (schema_rule.pattern,)
             }
     return {
         "valid": True, "log_class": "validation_accept", "called_by": "format_compliance",
-        "message": f"complies with format {schema_rule}"
+        "message": "complies with format {}", "message_args": (schema_rule.pattern,)
         }
 
 def value_restrictions(schema_rule, test_value):
-# accepted values and forbidden values tests
-    restriction_mode = list(schema_rule.keys())[0]
-    restriction_list = schema_rule[restriction_mode]
-    if restriction_mode == "ALLOW":
-        if test_value in restriction_list:
+# accepted values and forbidden values tests, schema_rule is a RestrictionRule
+    if schema_rule.mode == "ALLOW":
+        if test_value in schema_rule.values:
             return {
                 "valid": True, "log_class": "validation_accept", "called_by": "value_restrictions",
-                "message": f"{test_value} is an accepted value"
+                "message": "{} is an accepted value", "message_args": (test_value,)
                 }
         else:
             return {
                 "valid": False, "log_class": "validation_reject", "called_by": "value_restrictions",
-                "message": f"{test_value} is not an accepted value"
+                "message": "{} is not an accepted value", "message_args": (test_value,)
                 }
-    if restriction_mode == "FORBID":
-        if test_value not in restriction_list:
+    if schema_rule.mode == "FORBID":
+        if test_value not in schema_rule.values:
             return {
                 "valid": True, "log_class": "validation_accept",  "called_by": "value_restrictions",
-                "message": f"{test_value} is not a forbidden value"
+                "message": "{} is not a forbidden value", "message_args": (test_value,)
                 }
         else:
             return {
                 "valid": False, "log_class": "validation_reject", "called_by": "value_restrictions",
-                "message": f"{test_value} is a forbidden value"
+                "message": "{} is a forbidden value", "message_args": (test_value,)
                 }
 
 def valid_datatype(schema_rule, test_value):
-# data type validation test
-    expected_type = schema_rule.upper()
-    if expected_type not in POSTGRES_PYTHON_DATA_MAP:
+# data type validation test, schema_rule is a DataTypeRule
+    expected_type = schema_rule.expected_type
+    if schema_rule.caster is None:
         return {
             "valid": False, "log_class": "validation_reject", "called_by": "valid_datatype",
-            "message": f"Unsupported data type: {expected_type}"
+            "message": "Unsupported data type: {}", "message_args": (expected_type,)
             }
-    if isinstance(test_value, POSTGRES_PYTHON_DATA_MAP[expected_type]):
+    if expected_type in TEMPORAL_TYPES:
+        # date and time text is parsed rather than cast; nulls are left to the required rule
+        try:
+            if not (test_value is None or pd.isnull(test_value)):
+                schema_rule.caster(test_value)
+            return {
+                "valid": True, "log_class": "validation_accept",  "called_by": "valid_datatype",
+                "message": "valid {}", "message_args": (expected_type,)
+                }
+        except Exception:
+            return {
+                "valid": False, "log_class": "validation_reject", "called_by": "valid_datatype",
+                "message": "not a valid {}", "message_args": (expected_type,)
+                }
+    if isinstance(test_value, schema_rule.caster):
         return {
             "valid": True, "log_class": "validation_accept",  "called_by": "valid_datatype",
-            "message": f"valid {expected_type}"
+            "message": "valid {}", "message_args": (expected_type,)
             }
     try:
-        cast_value = POSTGRES_PYTHON_DATA_MAP[expected_type](test_value)
+        cast_value = schema_rule.caster(test_value)
         return {
             "valid": True, "log_class": "validation_warn",  "called_by": "valid_datatype",
-            "message":  f"cast from {type(test_value).__name__.lower()} to {expected_type}"
+            "message": "cast from {} to {}", "message_args": (type(test_value).__name__.lower(), expected_type)
             }
     except Exception as e:
         return {
             "valid": False, "log_class": "validation_reject", "called_by": "valid_datatype",
-            "message": f"not castable to {expected_type} ({type(test_value).__name__.lower()})"
+            "message": "not castable to {} ({})", "message_args": (expected_type, type(test_value).__name__.lower())
             }
 
 def limit_value(schema_rule, test_value):
-# min/max value test
-    if schema_rule.get("min") is not None:
+# min/max value test, schema_rule is a LimitRule
+    if schema_rule.min is not None:
         try:
-            casted_value = type(schema_rule["min"])(test_value)
-            if casted_value < schema_rule["min"]:
+            casted_value = schema_rule.min_caster(test_value)
+            if casted_value < schema_rule.min:
                 return {
                     "valid": False, "log_class": "validation_reject", "called_by": "limit_value",
-                    "message": f"below MIN tolerance {schema_rule['min']}"
+                    "message": "below MIN tolerance {}", "message_args": (schema_rule.min,)
                     }
         except Exception as e:
             return {
                 "valid": False, "log_type": "ERROR", "log_class": "validation_reject", "called_by": "limit_value",
-                "message": f"cannot evaluate MIN rule ({str(e)})"
+                "message": "cannot evaluate MIN rule ({})", "message_args": (e,)
                 }
-    if schema_rule.get("max") is not None:
+    if schema_rule.max is not None:
         try:
-            casted_value = type(schema_rule["max"])(test_value)
-            if casted_value > schema_rule["max"]:
+            casted_value = schema_rule.max_caster(test_value)
+            if casted_value > schema_rule.max:
                 return {
                     "valid": False, "log_class": "validation_reject", "called_by": "limit_value",
-                    "message": f"exceeds MAX tolerance {schema_rule['max']}"
+                    "message": "exceeds MAX tolerance {}", "message_args": (schema_rule.max,)
                     }
         except Exception as e:
             return {
                 "valid": False, "log_type": "ERROR", "log_class": "validation_reject", "called_by": "limit_value",
-                "message": f"cannot evaluate MAX rule ({str(e)})"
+                "message": "cannot evaluate MAX rule ({})", "message_args": (e,)
                 }
     return {
         "valid": True, "log_class": "validation_accept", "called_by": "limit_value",
-        "message": f"within MIN/MAX"
+        "message": "within MIN/MAX"
         }
 
+def unique_value(schema_rule, test_value, indexed):
+# unique and unique_together tests; indexed is the cell's result from index_unique
+    together = " together with {}".format(", ".join(schema_rule.together)) if schema_rule.together else ""
+    if not indexed:
+        return {
+            "valid": False, "log_class": "validation_reject", "called_by": "unique_value",
+            "message": "value {} repeats an earlier row{}", "message_args": (test_value, together)
+            }
+    return {
+        "valid": True, "log_class": "validation_accept", "called_by": "unique_value",
+        "message": "is unique{}", "message_args": (together,)
+        }
+
+def referenced_value(schema_rule, test_value, indexed):
+# references test; indexed is the cell's result from index_references
+    if not indexed:
+        return {
+            "valid": False, "log_class": "validation_reject", "called_by": "referenced_value",
+            "message": "value {} not found in {}.{}", "message_args": (test_value, schema_rule.table, schema_rule.column)
+            }
+    return {
+        "valid": True, "log_class": "validation_accept", "called_by": "referenced_value",
+        "message": "found in {}.{}", "message_args": (schema_rule.table, schema_rule.column)
+        }
+
+# Column-wise counterparts of the validation functions above are defined in this section.
+# Each takes the compiled rule and a whole column, and returns a boolean Series that is True
+# wherever the scalar function would accept the cell. Messages are not built here; the
+# validator asks the scalar functions for them, and only for the cells it logs.
+
+def column_required(schema_rule, test_column):
+# exists-and-not-null test
+    return test_column.notna()
+
+def column_format(schema_rule, test_column):
+# regex format compliance test, str() applied to every cell as in format_compliance
+    return test_column.astype(str).str.match(schema_rule).astype(bool)
+
+def column_value_restrictions(schema_rule, test_column):
+# accepted values and forbidden values tests
+    listed = test_column.isin(schema_rule.values)
+    if schema_rule.mode == "ALLOW":
+        return listed
+    if schema_rule.mode == "FORBID":
+        return ~listed
+    return pd.Series(False, index=test_column.index)
+
+def column_datatype(schema_rule, test_column, casts=None):
+# data type validation test
+    caster = schema_rule.caster
+    if caster is None:
+        return pd.Series(False, index=test_column.index)
+    if schema_rule.expected_type in TEMPORAL_TYPES:
+        parsed = parse_temporal_column(schema_rule.expected_type, test_column)
+        return pd.Series(parsed.notna().to_numpy() | test_column.isna().to_numpy(), index=test_column.index)
+    if caster in (int, float):
+        castable, _ = cast_numeric_column(test_column, caster, casts)
+        return pd.Series(castable, index=test_column.index)
+    if caster is str:
+        return pd.Series(True, index=test_column.index)
+    if test_column.dtype.kind in "iubf":
+        # bool() accepts any number, but not the pd.NA of a nullable column
+        return pd.Series(~_holds_na(test_column), index=test_column.index)
+    return test_column.map(lambda test_value: _castable(caster, test_value)).astype(bool)
+
+def column_datatype_cast(schema_rule, test_column):
+# cells whose value is not already of the expected type, i.e. that valid_datatype would cast
+    caster = schema_rule.caster
+    if caster is None or schema_rule.expected_type in TEMPORAL_TYPES:
+        return pd.Series(False, index=test_column.index)
+    value_type = COLUMN_VALUE_TYPES.get(test_column.dtype.kind)
+    if test_column.dtype == "string":
+        value_type = str
+    if value_type is None:
+        return test_column.map(lambda test_value: not isinstance(test_value, caster)).astype(bool)
+    if issubclass(value_type, caster):
+        return pd.Series(_holds_na(test_column), index=test_column.index)
+    return pd.Series(True, index=test_column.index)
+
+def column_limit(schema_rule, test_column, casts=None):
+# min/max value test
+    valid = np.ones(len(test_column), dtype=bool)
+    for limit, caster, out_of_bounds in ((schema_rule.min, schema_rule.min_caster, np.less),
+                                         (schema_rule.max, schema_rule.max_caster, np.greater)):
+        if limit is None:
+            continue
+        if caster not in (int, float):
+            bound_rule = compile_limit({"min": limit} if out_of_bounds is np.less else {"max": limit})
+            valid &= test_column.map(lambda test_value: limit_value(bound_rule, test_value)["valid"]).to_numpy(dtype=bool)
+            continue
+        castable, cast_values = cast_numeric_column(test_column, caster, casts)
+        with np.errstate(invalid="ignore"):
+            valid &= castable & ~out_of_bounds(cast_values, limit)
+    return pd.Series(valid, index=test_column.index)
+
+# Column functions of the cross-row rules (INDEX_RULES) are defined in this section. Each takes
+# the compiled rule, the rule's key columns (see index_columns) and the rule's index for the
+# session (see row_index.open_row_indexes), and returns a boolean array that is True for the
+# valid rows. They run once over every batch of rows, in file order, before the other rules.
+
+def index_columns(rule):
+    # the columns a cross-row rule reads: its own, then those it is unique together with
+    if rule.rule_name == "unique_together":
+        return [rule.col_name, *rule.params.together]
+    return [rule.col_name]
+
+def index_unique(schema_rule, key_rows, seen_keys):
+# unique and unique_together test: a row repeating the key of an earlier row of the session is
+# invalid, whether or not the earlier row was accepted. Rows with a null key column are valid.
+# seen_keys is the set of keys seen so far, and gains the keys of key_rows.
+    present = key_rows.notna().all(axis=1).to_numpy()
+    keys = key_rows[present]
+    repeated = keys.duplicated(keep="first").to_numpy()
+    if len(key_rows.columns) == 1:
+        key_values = keys.iloc[:, 0].tolist()
+    else:
+        key_values = list(keys.itertuples(index=False, name=None))
+    if seen_keys:
+        repeated |= np.fromiter((key in seen_keys for key in key_values), dtype=bool, count=len(key_values))
+    seen_keys.update(key_values)
+    valid = np.ones(len(key_rows), dtype=bool)
+    valid[present] = ~repeated
+    return valid
+
+def index_references(schema_rule, key_rows, reference_keys):
+# references test: the cell is one of reference_keys, a pandas Index of the referenced column's
+# values (see row_index.reference_index). Null cells are valid, as with a foreign key.
+    test_column = key_rows.iloc[:, 0]
+    missing = test_column.isna().to_numpy()
+    if reference_keys.dtype.kind in "iuf":
+        test_values = test_column
+        if test_column.dtype.kind not in "iuf":
+            # cells left as text because some value in the column did not convert
+            test_values = pd.to_numeric(test_column.astype(object), errors="coerce")
+    else:
+        test_values = test_column.to_numpy(dtype=object)
+    return missing | (reference_keys.get_indexer(test_values) >= 0)
+
+def cast_numeric_column(test_column, caster, casts=None):
+    """
+    Cast a whole column; returns castable cells and float64 values, memoized in casts.
+    """
+    if casts is not None and caster in casts:
+        return casts[caster]
+    cast = _cast_numeric_column(test_column, caster)
+    if casts is not None:
+        casts[caster] = cast
+    return cast
+
+def _cast_numeric_column(test_column, caster):
+    if test_column.dtype.kind in "iubf":
+        cast_values = test_column.to_numpy(dtype="float64", na_value=np.nan)
+        castable = ~_holds_na(test_column)
+        if caster is int:
+            castable &= np.isfinite(cast_values)
+            return castable, np.trunc(cast_values)
+        return castable, cast_values
+
+    cast_values = np.full(len(test_column), np.nan)
+    castable = np.zeros(len(test_column), dtype=bool)
+    for position, test_value in enumerate(test_column.to_numpy(dtype=object)):
+        try:
+            cast_values[position] = caster(test_value)
+            castable[position] = True
+        except Exception:
+            pass
+    return castable, cast_values
+
+# Python type of the values a typed column hands to the scalar rules
+COLUMN_VALUE_TYPES = {"i": int, "u": int, "f": float, "b": bool}
+
+def _holds_na(test_column):
+    # pd.NA cells of nullable (extension) columns; int(), float() and bool() all reject them
+    if isinstance(test_column.dtype, np.dtype):
+        return np.zeros(len(test_column), dtype=bool)
+    return test_column.isna().to_numpy()
+
+def _castable(caster, test_value):
+    if isinstance(test_value, caster):
+        return True
+    try:
+        caster(test_value)
+        return True
+    except Exception:
+        return False
+
+# Date and time parsing is defined in this section. Each type has one fixed format, and a cell
+# passes the scalar parser exactly when the column parser reads it: DATE is YYYY-MM-DD,
+# TIMESTAMP is YYYY-MM-DD with an optional time (T or space, HH:MM[:SS[.ffffff]]) and no UTC
+# offset (PostgreSQL's TIMESTAMP has no time zone), and TIME is HH:MM:SS with an optional
+# fraction. DATE and TIMESTAMP parse to datetime64[us], which holds years 1 to 9999 (so
+# sentinels such as 9999-12-31 pass), and TIME to a timedelta64 since midnight.
+
+DATE_PATTERN = re.compile(r"(?!0000)\d{4}-\d{2}-\d{2}")
+TIMESTAMP_PATTERN = re.compile(r"(?!0000)\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d{1,6})?)?)?")
+TIME_PATTERN = re.compile(r"^([01]?\d|2[0-3]):[0-5]\d:[0-5]\d(\.\d{1,9})?$")
+
+def parse_date(test_value):
+    if not isinstance(test_value, str):
+        raise TypeError(f"expected text, got {type(test_value).__name__.lower()}")
+    if not DATE_PATTERN.fullmatch(test_value):
+        raise ValueError("not YYYY-MM-DD")
+    # numpy rejects a month or day that does not exist
+    return np.datetime64(test_value, "us")
+
+def parse_timestamp(test_value):
+    if not isinstance(test_value, str):
+        raise TypeError(f"expected text, got {type(test_value).__name__.lower()}")
+    if not TIMESTAMP_PATTERN.fullmatch(test_value):
+        raise ValueError("not YYYY-MM-DD[THH:MM[:SS[.ffffff]]]")
+    return np.datetime64(test_value, "us")
+
+def parse_time(test_value):
+    if not isinstance(test_value, str):
+        raise TypeError(f"expected text, got {type(test_value).__name__.lower()}")
+    if not TIME_PATTERN.match(test_value):
+        raise ValueError("not HH:MM:SS")
+    return pd.to_timedelta(test_value)
+
+def parse_temporal_column(expected_type, test_column):
+    # a whole column of DATE, TIMESTAMP or TIME text, parsed; NaT where the cell is missing or
+    # its scalar parser would fail
+    text = test_column.astype(object)
+    if test_column.dtype == object:
+        # only text parses, as in the scalar parsers
+        text = text.where(text.map(lambda test_value: isinstance(test_value, str)).astype(bool))
+    if expected_type == "TIME":
+        matched = text.astype("string").str.match(TIME_PATTERN).fillna(False).astype(bool)
+        return pd.to_timedelta(text.where(matched), errors="coerce")
+    matched = text.astype("string").str.fullmatch(TEMPORAL_PATTERNS[expected_type]).fillna(False).to_numpy(dtype=bool)
+    matched_text = text.to_numpy(dtype=object)[matched]
+    parsed = np.full(len(text), np.datetime64("NaT"), dtype="datetime64[us]")
+    try:
+        parsed[matched] = matched_text.astype("datetime64[us]")
+    except ValueError:
+        # some date in the column does not exist (2024-02-30): parse value by value
+        parsed[matched] = [_parsed_or_nat(TEMPORAL_PARSERS[expected_type], test_value) for test_value in matched_text]
+    return pd.Series(parsed, index=test_column.index)
+
+def _parsed_or_nat(parser, test_value):
+    try:
+        return parser(test_value)
+    except Exception:
+        return np.datetime64("NaT")
+
+TEMPORAL_TYPES = {"DATE", "TIMESTAMP", "TIME"}
+
+TEMPORAL_PATTERNS = {"DATE": DATE_PATTERN, "TIMESTAMP": TIMESTAMP_PATTERN}
+
+TEMPORAL_PARSERS = {"DATE": parse_date, "TIMESTAMP": parse_timestamp, "TIME": parse_time}
+
 # Functions to validate configuration, schema, and database are defined here.
 
 def validate_schema(schema):
@@ -158,9 +514,33 @@ def validate_schema(schema):
                     if not isinstance(rule_params[test_key[0]], list):
                         validation_report.append(f"{fieldname}: 'value_restrictions' key {test_key[0]} must be a list, got {type(rule_params[test_key[0]]).__name__}\n")
                         continue
+
+            if rule_name == "unique" and rule_params is not True:
+                validation_report.append(f"{fieldname}: 'unique' must be true, got {rule_params!r}\n")
+
+            if rule_name == "unique_together":
+                if not isinstance(rule_params, list) or not rule_params:
+                    validation_report.append(f"{fieldname}: 'unique_together' must be a non-empty list of column names\n")
+                    continue
+                for other_name in rule_params:
+                    if not isinstance(other_name, str) or other_name == fieldname or other_name not in schema["schema_definitions"]:
+                        validation_report.append(f"{fieldname}: 'unique_together' column {other_name!r} is not another column of the schema\n")
+                if len(set(map(str, rule_params))) != len(rule_params):
+                    validation_report.append(f"{fieldname}: 'unique_together' lists a column more than once\n")
+
+            if rule_name == "references":
+                if not isinstance(rule_params, dict) or set(rule_params) != {"table", "column"}:
+                    validation_report.append(f"{fieldname}: 'references' must be a dict with exactly the keys 'table' and 'column'\n")
+                    continue
+                for key in ("table", "column"):
+                    if not isinstance(rule_params[key], str) or not SQL_IDENTIFIER.match(rule_params[key]) or (key == "column" and "." in rule_params[key]):
+                        validation_report.append(f"{fieldname}: 'references' {key} {rule_params[key]!r} is not a SQL identifier\n")
     if validation_report:
         raise RuntimeError(f"invalid schema:\n" + "\n".join(validation_report))
 
+# table names, optionally schema-qualified, and column names accepted by the references rule
+SQL_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_$]*(\.[A-Za-z_][A-Za-z0-9_$]*)?$")
+
 def validate_config():
     '''
     Validate config settings
@@ -169,24 +549,66 @@ def validate_config():
     validation_msg = ""
     return config_valid, validation_msg
 
-def validate_database(db_config):
+def validate_database(db_config, db_pool=None, runtime_config=None):
+    # with a pool, the checked connection goes back to the pool for the writer to reuse; with
+    # runtime_config the load_policy's load_key is checked against the table too
     try:
-        conn = psycopg2.connect(
-            host=db_config["host"],
-            port=db_config["port"],
-            dbname=db_config["name"],
-            user=db_config["user"],
-            password=db_config["password"],
-            connect_timeout=5
-        )
-        with conn.cursor() as cursor:
-            cursor.execute(f"SELECT 1 FROM {db_config['table']} LIMIT 1;")
-        conn.close()
+        if db_pool is not None:
+            conn = get_connection(db_pool)
+        else:
+            conn = psycopg2.connect(
+                host=db_config["host"],
+                port=db_config["port"],
+                dbname=db_config["name"],
+                user=db_config["user"],
+                password=db_config["password"],
+                connect_timeout=5
+            )
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"SELECT 1 FROM {db_config['table']} LIMIT 1;")
+                if runtime_config is not None:
+                    validate_load_key(cursor, runtime_config, db_config["table"])
+            conn.rollback()
+        finally:
+            if db_pool is not None:
+                put_connection(db_pool, conn)
+            else:
+                conn.close()
     except psycopg2.OperationalError as e:
         raise RuntimeError(f"Database connection failed: {e}")
     except Exception as e:
         raise RuntimeError(f"database validation failed: {e}")
 
+def validate_load_key(cursor, runtime_config, dest_table):
+    # merge and replace need an explicit load_key of the table's columns, and merge's
+    # ON CONFLICT (load_key) a unique index or constraint on exactly those columns; a
+    # load_policy_column must be a column of the table too
+    policy_column = runtime_config.get("load_policy_column")
+    if policy_column:
+        if not (isinstance(policy_column, str) and SQL_IDENTIFIER.match(policy_column) and "." not in policy_column):
+            raise ValueError(f"load_policy_column {policy_column!r} is not a column name")
+        cursor.execute(f"SELECT {policy_column} FROM {dest_table} LIMIT 0;")
+    load_policies = policies_in_use(runtime_config)
+    unknown_policies = sorted(load_policies - set(LOAD_POLICIES))
+    if unknown_policies:
+        raise ValueError(f"unknown load_policy {unknown_policies[0]!r}")
+    if load_policies == {"append"}:
+        return
+    load_policy = "merge" if "merge" in load_policies else "replace"
+    load_key = runtime_config.get("load_key") or []
+    if not load_key or not all(isinstance(col_name, str) and SQL_IDENTIFIER.match(col_name) and "." not in col_name
+                               for col_name in load_key):
+        raise ValueError(f"load_policy {load_policy!r} needs load_key, the list of columns that identify a row")
+    cursor.execute(f"SELECT {', '.join(load_key)} FROM {dest_table} LIMIT 0;")
+    if "merge" in load_policies:
+        cursor.execute("SELECT array(SELECT a.attname::text FROM unnest((i.indkey::int2[])[0:i.indnkeyatts - 1]) AS k(attnum) "
+                       "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum) "
+                       "FROM pg_index i WHERE i.indrelid = %s::regclass AND i.indisunique "
+                       "AND i.indpred IS NULL AND i.indexprs IS NULL;", (dest_table,))
+        if set(load_key) not in [set(index_columns) for index_columns, in cursor.fetchall()]:
+            raise ValueError(f"load_policy 'merge' needs a unique index or constraint on {dest_table} ({', '.join(load_key)})")
+
 # Data type maps for different database formats are defined in this section.
 
 POSTGRES_PYTHON_DATA_MAP = {
@@ -202,7 +624,29 @@ POSTGRES_PYTHON_DATA_MAP = {
     "DOUBLE PRECISION": float,
     "NUMERIC": float,
     "BOOLEAN": bool,
-    "DATE": str,      # NB: more complex data type validation needs to be built
-    "TIMESTAMP": str,
-    "TIME": str
+    "DATE": parse_date,
+    "TIMESTAMP": parse_timestamp,
+    "TIME": parse_time
+}
+
+# pandas dtypes used to parse each column at load time; NULL stays NaN for the float types, and
+# nullable dtypes hold pd.NA. Date and time types are read as text, so that format and other
+# rules see the text, and are parsed once validation is done (see validator.type_output).
+
+POSTGRES_PANDAS_DTYPE_MAP = {
+    "TEXT": "string",
+    "VARCHAR": "string",
+    "CHAR": "string",
+    "INTEGER": "Int64",
+    "INT": "Int64",
+    "SMALLINT": "Int64",
+    "BIGINT": "Int64",
+    "REAL": "float64",
+    "FLOAT": "float64",
+    "DOUBLE PRECISION": "float64",
+    "NUMERIC": "float64",
+    "BOOLEAN": "boolean",
+    "DATE": "string",
+    "TIMESTAMP": "string",
+    "TIME": "string"
 }
\ No newline at end of file
@@ -0,0 +1,103 @@
+# validation_stats.py
+
+import csv
+import json
+import numpy as np
+
+# outcome columns of the counter array
+OUTCOMES = ["accepted", "warned", "rejected"]
+ACCEPTED, WARNED, REJECTED = range(len(OUTCOMES))
+
+def new_validation_stats(schema, sample_size=10):
+    """
+    Per-rule outcome counters and bottom-k source_index samples for one session.
+    """
+    return {
+        "rules": [(rule.rule_id, rule.col_name, rule.rule_name) for rule in schema.rules],
+        "counts": np.zeros((len(schema.rules), len(OUTCOMES)), dtype=np.int64),
+        "rows": {"checked": 0, "accepted": 0, "rejected": 0, "missing_key": 0},
+        "samples": {},
+        "sample_size": sample_size,
+        "rng": np.random.default_rng()
+    }
+
+def empty_stats_like(stats):
+    return {
+        "rules": stats["rules"],
+        "counts": np.zeros_like(stats["counts"]),
+        "rows": dict.fromkeys(stats["rows"], 0),
+        "samples": {},
+        "sample_size": stats["sample_size"],
+        "rng": np.random.default_rng()
+    }
+
+def count_cells(stats, rule_id, outcomes, source_index):
+    """
+    Add one rule's evaluated cell outcomes, with their source_index values.
+    """
+    stats["counts"][rule_id] += np.bincount(outcomes, minlength=len(OUTCOMES))
+    for outcome in (WARNED, REJECTED):
+        sampled = source_index[outcomes == outcome]
+        if len(sampled):
+            _add_samples(stats, (rule_id, outcome), stats["rng"].random(len(sampled)), sampled)
+
+def count_rows(stats, checked, accepted, missing_key):
+    stats["rows"]["checked"] += checked
+    stats["rows"]["accepted"] += accepted
+    stats["rows"]["rejected"] += checked - accepted
+    stats["rows"]["missing_key"] += missing_key
+
+def merge_stats(stats, other):
+    stats["counts"] += other["counts"]
+    for key, value in other["rows"].items():
+        stats["rows"][key] += value
+    for bucket, (sample_keys, sampled) in other["samples"].items():
+        _add_samples(stats, bucket, sample_keys, sampled)
+
+def _add_samples(stats, bucket, sample_keys, sampled):
+    if bucket in stats["samples"]:
+        kept_keys, kept = stats["samples"][bucket]
+        sample_keys, sampled = np.concatenate([kept_keys, sample_keys]), np.concatenate([kept, sampled])
+    if len(sample_keys) > stats["sample_size"]:
+        lowest = np.argpartition(sample_keys, stats["sample_size"])[:stats["sample_size"]]
+        sample_keys, sampled = sample_keys[lowest], sampled[lowest]
+    stats["samples"][bucket] = (sample_keys, sampled)
+
+def build_summary(stats):
+    rules = []
+    for rule_id, col_name, rule_name in stats["rules"]:
+        rule_summary = {"rule_id": rule_id, "col_name": col_name, "rule_name": rule_name}
+        rule_summary.update(zip(OUTCOMES, stats["counts"][rule_id].tolist()))
+        for outcome in (WARNED, REJECTED):
+            _, sampled = stats["samples"].get((rule_id, outcome), (None, []))
+            rule_summary[f"{OUTCOMES[outcome]}_sample"] = sorted(int(source_index) for source_index in sampled)
+        rules.append(rule_summary)
+    return {"rows": dict(stats["rows"]), "rules": rules}
+
+def write_stats_summary(runtime_config):
+    """
+    Write the session's validation statistics as JSON and CSV; returns the paths.
+    """
+    stats = runtime_config.get("validation_stats")
+    if stats is None:
+        return []
+    log_config = runtime_config["log_config"]
+    stats_filename = log_config.get("stats_filename", "logs/{session_id}_STATS.{file_type}")
+    summary = build_summary(stats)
+    summary = {"session_id": runtime_config["session_id"], "csv_path": runtime_config["csv_path"], **summary}
+
+    json_path = stats_filename.format(session_id=runtime_config["session_id"], file_type="json")
+    with open(json_path, mode="w") as file:
+        json.dump(summary, file, indent=4)
+
+    csv_path = stats_filename.format(session_id=runtime_config["session_id"], file_type="csv")
+    with open(csv_path, mode="w", newline="") as file:
+        fieldnames = ["rule_id", "col_name", "rule_name"] + OUTCOMES + [f"{OUTCOMES[outcome]}_sample" for outcome in (WARNED, REJECTED)]
+        writer = csv.DictWriter(file, fieldnames=fieldnames)
+        writer.writeheader()
+        for rule_summary in summary["rules"]:
+            writer.writerow({**rule_summary, **{f"{OUTCOMES[outcome]}_sample": " ".join(map(str, rule_summary[f"{OUTCOMES[outcome]}_sample"]))
+                                                for outcome in (WARNED, REJECTED)}})
+
+    print(f"Stats Written: {json_path}, {csv_path}")
+    return [json_path, csv_path]
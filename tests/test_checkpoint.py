@@ -0,0 +1,112 @@
+# test_checkpoint.py
+
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import contextlib
+from unittest import mock
+import psycopg2
+import src.checkpoint as checkpoint
+from src.main import main, initialize_config
+from src.db_pool import close_pool
+
+CONFIG_PATH = "config/config.json"
+TEST_TABLE = "test_checkpoint_orders"
+CHECKPOINT_TABLE = "test_checkpoints"
+
+def order_csv(orders):
+    # two lines per order, so a chunk of 25 rows ends inside a group
+    lines = ["order_id,item_id,item_name,quantity,unit_price,order_date,shipping_method,discount_code"]
+    for number in range(1, orders + 1):
+        lines += [f"237-2033-361-{number:014d},ITEM{line:04d},widget,{line + 1},1.5,2024-01-01,UPS," for line in range(2)]
+    return "\n".join(lines) + "\n"
+
+class ResumeTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(CONFIG_PATH, "r") as f:
+            cls.config = json.load(f)
+        db_config = cls.config["db_config"]
+        try:
+            cls.conn = psycopg2.connect(host=db_config["host"], port=db_config["port"], dbname=db_config["name"],
+                                        user=db_config["user"], password=db_config["password"], connect_timeout=5)
+        except psycopg2.OperationalError as e:
+            raise unittest.SkipTest(f"database not available: {e}")
+        cls.conn.autocommit = True
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.query(f"DROP TABLE IF EXISTS {TEST_TABLE}, {CHECKPOINT_TABLE};")
+        cls.conn.close()
+
+    @classmethod
+    def query(cls, statement, params=None):
+        with cls.conn.cursor() as cur:
+            cur.execute(statement, params)
+            return cur.fetchall() if cur.description else None
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.work_dir, "orders.csv")
+        with open(self.csv_path, "w") as f:
+            f.write(order_csv(60))
+        self.query(f"DROP TABLE IF EXISTS {TEST_TABLE}, {CHECKPOINT_TABLE};")
+        self.query(f"CREATE TABLE {TEST_TABLE} (LIKE orders);")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def ingest(self):
+        config = json.loads(json.dumps(self.config))
+        config["db_config"]["table"] = TEST_TABLE
+        config["runtime_config"].update(resumable=True, chunk_size=25, checkpoint_table=CHECKPOINT_TABLE)
+        log_config = config["runtime_config"]["log_config"]
+        for log_file in ("log_filename", "stats_filename", "metrics_filename", "quarantine_filename"):
+            log_config[log_file] = os.path.join(self.work_dir, os.path.basename(log_config[log_file]))
+        config_path = os.path.join(self.work_dir, "config.json")
+        with open(config_path, "w") as f:
+            json.dump(config, f)
+        runtime_context = initialize_config(config_path)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                main(self.csv_path, runtime_context)
+        finally:
+            close_pool(runtime_context["db_pool"])
+        return runtime_context["runtime_config"]["metrics"]["status"]
+
+    def saved_checkpoint(self):
+        return self.query(f"SELECT next_source_index, rows_written, complete FROM {CHECKPOINT_TABLE};")
+
+    def test_resume_after_a_failed_write(self):
+        write_to_db = checkpoint.write_to_db
+        calls = []
+
+        def fail_third_write(*args, **kwargs):
+            calls.append(None)
+            return False if len(calls) == 3 else write_to_db(*args, **kwargs)
+
+        with mock.patch.object(checkpoint, "write_to_db", fail_third_write):
+            self.assertEqual(self.ingest(), "crashed")
+        # two runs of whole groups were committed, each with its checkpoint; the third rolled back
+        [(next_source_index, rows_written, complete)] = self.saved_checkpoint()
+        self.assertFalse(complete)
+        self.assertGreater(next_source_index, 0)
+        self.assertEqual(next_source_index % 2, 0)
+        self.assertEqual(rows_written, next_source_index)
+        self.assertEqual(self.query(f"SELECT count(*) FROM {TEST_TABLE};")[0][0], rows_written)
+
+        self.assertEqual(self.ingest(), "complete")
+        self.assertEqual(self.saved_checkpoint(), [(120, 120, True)])
+        self.assertEqual(self.query(f"SELECT count(*), count(DISTINCT (order_id, item_id)) FROM {TEST_TABLE};"), [(120, 120)])
+
+    def test_a_complete_file_is_not_written_again(self):
+        self.assertEqual(self.ingest(), "complete")
+        self.assertEqual(self.ingest(), "complete")
+        self.assertEqual(self.query(f"SELECT count(*) FROM {TEST_TABLE};")[0][0], 120)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+# test_daemon.py
+
+import io
+import os
+import sys
+import shutil
+import socket
+import tempfile
+import unittest
+import contextlib
+import subprocess
+from src.daemon import claim_inbox_file, release_claims, CLAIMED_DIR
+
+def stopped_pid():
+    # the pid of a process that has exited
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+class InboxClaimTest(unittest.TestCase):
+
+    def setUp(self):
+        self.inbox = tempfile.mkdtemp()
+        self.host_dir = os.path.join(self.inbox, CLAIMED_DIR, socket.gethostname())
+        self.other_host_dir = os.path.join(self.inbox, CLAIMED_DIR, "other-host")
+        for directory in (self.host_dir, self.other_host_dir):
+            os.makedirs(directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.inbox)
+
+    def touch(self, directory, name):
+        path = os.path.join(directory, name)
+        with open(path, "w") as f:
+            f.write("order_id\n")
+        return path
+
+    def test_a_file_is_claimed_once(self):
+        path = self.touch(self.inbox, "orders.csv")
+        claimed_path = claim_inbox_file(self.inbox, path)
+        self.assertEqual(claimed_path, os.path.join(self.host_dir, f"{os.getpid()}-orders.csv"))
+        self.assertTrue(os.path.exists(claimed_path))
+        self.assertIsNone(claim_inbox_file(self.inbox, path))
+
+    def test_release_only_stopped_claims_of_this_host(self):
+        pid = stopped_pid()
+        self.touch(self.host_dir, f"{pid}-stopped.csv")
+        self.touch(self.host_dir, f"{os.getpid()}-running.csv")
+        self.touch(self.other_host_dir, f"{pid}-other-host.csv")
+        with contextlib.redirect_stdout(io.StringIO()):
+            release_claims(self.inbox)
+        self.assertEqual(sorted(entry.name for entry in os.scandir(self.inbox) if entry.is_file()), ["stopped.csv"])
+        self.assertEqual(os.listdir(self.host_dir), [f"{os.getpid()}-running.csv"])
+        self.assertEqual(os.listdir(self.other_host_dir), [f"{pid}-other-host.csv"])
+
+if __name__ == "__main__":
+    unittest.main()
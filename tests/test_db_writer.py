@@ -0,0 +1,176 @@
+# test_db_writer.py
+
+import io
+import os
+import csv
+import json
+import shutil
+import tempfile
+import unittest
+import contextlib
+import psycopg2
+from src.main import main, initialize_config
+from src.db_pool import close_pool
+
+CONFIG_PATH = "config/config.json"
+TEST_TABLE = "test_load_policy"
+
+def order_id(number):
+    return f"237-2033-361-{number:014d}"
+
+def order_lines(number, count, first_item=0, item_name="widget", shipping_method="UPS"):
+    return [f"{order_id(number)},ITEM{first_item + line:04d},{item_name},{line + 1},1.5,2024-01-01,{shipping_method},"
+            for line in range(count)]
+
+def split_order_csv():
+    # order 1 has four lines at the top of the file and four more at the bottom, 58 orders apart
+    lines = ["order_id,item_id,item_name,quantity,unit_price,order_date,shipping_method,discount_code"]
+    lines += order_lines(1, 4)
+    for number in range(2, 60):
+        lines += order_lines(number, 2)
+    lines += order_lines(1, 4, first_item=100)
+    return "\n".join(lines) + "\n"
+
+class DatabaseWriteTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(CONFIG_PATH, "r") as f:
+            cls.config = json.load(f)
+        db_config = cls.config["db_config"]
+        try:
+            cls.conn = psycopg2.connect(host=db_config["host"], port=db_config["port"], dbname=db_config["name"],
+                                        user=db_config["user"], password=db_config["password"], connect_timeout=5)
+        except psycopg2.OperationalError as e:
+            raise unittest.SkipTest(f"database not available: {e}")
+        cls.conn.autocommit = True
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.query(f"DROP TABLE IF EXISTS {TEST_TABLE};")
+        cls.conn.close()
+
+    @classmethod
+    def query(cls, statement, params=None):
+        with cls.conn.cursor() as cur:
+            cur.execute(statement, params)
+            return cur.fetchall() if cur.description else None
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.work_dir, "orders.csv")
+        with open(self.csv_path, "w") as f:
+            f.write(split_order_csv())
+        self.query(f"DROP TABLE IF EXISTS {TEST_TABLE};")
+        self.query(f"CREATE TABLE {TEST_TABLE} (LIKE orders);")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def runtime_context(self, **runtime_config):
+        # a config for TEST_TABLE with its logs in the test's directory; startup checks run here
+        config = json.loads(json.dumps(self.config))
+        config["db_config"]["table"] = TEST_TABLE
+        config["runtime_config"].update(runtime_config)
+        log_config = config["runtime_config"]["log_config"]
+        for log_file in ("log_filename", "stats_filename", "metrics_filename", "quarantine_filename"):
+            log_config[log_file] = os.path.join(self.work_dir, os.path.basename(log_config[log_file]))
+        config_path = os.path.join(self.work_dir, "config.json")
+        with open(config_path, "w") as f:
+            json.dump(config, f)
+        return initialize_config(config_path)
+
+    def ingest(self, runtime_context):
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                main(self.csv_path, runtime_context)
+        finally:
+            close_pool(runtime_context["db_pool"])
+        return runtime_context["runtime_config"]["metrics"]["status"]
+
+    def order_rows(self, number):
+        return self.query(f"SELECT count(*) FROM {TEST_TABLE} WHERE order_id = %s;", (order_id(number),))[0][0]
+
+class LoadPolicyTest(DatabaseWriteTest):
+
+    def test_replace_keeps_a_group_split_across_chunks(self):
+        for runtime_config in ({"chunk_size": 0}, {"chunk_size": 20, "pipeline_depth": 0}, {"chunk_size": 20, "pipeline_depth": 2}):
+            with self.subTest(**runtime_config):
+                self.query(f"TRUNCATE {TEST_TABLE};")
+                self.query(f"INSERT INTO {TEST_TABLE} (order_id, item_id) VALUES (%s, 'ITEM9999'), (%s, 'ITEM9998');",
+                           (order_id(1), order_id(2)))
+                runtime_context = self.runtime_context(load_policy="replace", load_key=["order_id"], **runtime_config)
+                self.assertEqual(self.ingest(runtime_context), "complete")
+                self.assertEqual(self.order_rows(1), 8)
+                self.assertEqual(self.order_rows(2), 2)
+                self.assertEqual(self.query(f"SELECT count(*) FROM {TEST_TABLE} WHERE item_id LIKE 'ITEM999_';")[0][0], 0)
+                self.assertEqual(self.query(f"SELECT count(*) FROM {TEST_TABLE};")[0][0], 124)
+
+    def test_merge_and_replace_need_a_load_key(self):
+        for load_policy in ("merge", "replace"):
+            with self.subTest(load_policy=load_policy):
+                with self.assertRaisesRegex(RuntimeError, "needs load_key"):
+                    self.runtime_context(load_policy=load_policy, load_key=[])
+
+    def test_merge_needs_a_unique_index_on_the_load_key(self):
+        self.query(f"CREATE UNIQUE INDEX ON {TEST_TABLE} (order_id, item_id);")
+        with self.assertRaisesRegex(RuntimeError, "unique index"):
+            self.runtime_context(load_policy="merge", load_key=["order_id"])
+
+    def test_merge_keeps_every_line_of_an_order(self):
+        self.query(f"CREATE UNIQUE INDEX ON {TEST_TABLE} (order_id, item_id);")
+        for run in range(2):
+            with self.subTest(run=run):
+                runtime_context = self.runtime_context(load_policy="merge", load_key=["order_id", "item_id"])
+                self.assertEqual(self.ingest(runtime_context), "complete")
+                self.assertEqual(self.order_rows(1), 8)
+                self.assertEqual(self.query(f"SELECT count(*) FROM {TEST_TABLE};")[0][0], 124)
+
+    def test_load_policy_per_group(self):
+        # UPS orders replace their earlier rows, the others are appended next to theirs
+        lines = ["order_id,item_id,item_name,quantity,unit_price,order_date,shipping_method,discount_code"]
+        for number in range(1, 60):
+            lines += order_lines(number, 2, shipping_method="UPS" if number % 2 else "FEDEX")
+        with open(self.csv_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        for runtime_config in ({"chunk_size": 0}, {"chunk_size": 20, "pipeline_depth": 2}):
+            with self.subTest(**runtime_config):
+                self.query(f"TRUNCATE {TEST_TABLE};")
+                self.query(f"INSERT INTO {TEST_TABLE} (order_id, item_id) VALUES (%s, 'ITEM9999'), (%s, 'ITEM9999');",
+                           (order_id(1), order_id(2)))
+                runtime_context = self.runtime_context(load_key=["order_id"], load_policy_column="shipping_method",
+                                                       load_policies={"UPS": "replace"}, **runtime_config)
+                self.assertEqual(self.ingest(runtime_context), "complete")
+                self.assertEqual(self.order_rows(1), 2)
+                self.assertEqual(self.order_rows(2), 3)
+                self.assertEqual(self.query(f"SELECT count(*) FROM {TEST_TABLE};")[0][0], 119)
+
+    def test_load_policy_column_must_be_a_table_column(self):
+        with self.assertRaisesRegex(RuntimeError, "database validation failed"):
+            self.runtime_context(load_key=["order_id"], load_policy_column="channel", load_policies={"web": "replace"})
+
+class WriteIsolationTest(DatabaseWriteTest):
+
+    def refused_rows_logged(self, runtime_context):
+        log_path = os.path.join(self.work_dir, f"{runtime_context['runtime_config']['session_id']}_ERROR_LOG.csv")
+        with open(log_path, newline="") as f:
+            return sorted(int(entry["source_index"]) for entry in csv.DictReader(f) if "refused by" in entry["message"])
+
+    def test_refused_rows_are_left_out_and_logged(self):
+        # order 1's lines with quantity 3 and 4 (rows 2, 3, 122 and 123) break the table's check constraint
+        self.query(f"ALTER TABLE {TEST_TABLE} ADD CONSTRAINT small_quantity CHECK (quantity < 3);")
+        for write_mode in ("copy", "values"):
+            with self.subTest(write_mode=write_mode):
+                self.query(f"TRUNCATE {TEST_TABLE};")
+                runtime_context = self.runtime_context(isolate_write_errors=True, write_mode=write_mode, write_batch_size=7)
+                self.assertEqual(self.ingest(runtime_context), "complete")
+                self.assertEqual(self.query(f"SELECT count(*), max(quantity) FROM {TEST_TABLE};"), [(120, 2)])
+                self.assertEqual(self.refused_rows_logged(runtime_context), [2, 3, 122, 123])
+
+    def test_without_isolation_a_refused_row_fails_the_write(self):
+        self.query(f"ALTER TABLE {TEST_TABLE} ADD CONSTRAINT small_quantity CHECK (quantity < 3);")
+        self.assertEqual(self.ingest(self.runtime_context()), "crashed")
+        self.assertEqual(self.query(f"SELECT count(*) FROM {TEST_TABLE};")[0][0], 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+# test_decompress.py
+
+import os
+import gzip
+import json
+import copy
+import shutil
+import tempfile
+import unittest
+import importlib.util
+from unittest import mock
+import pandas
+import src.decompress as decompress
+import src.file_loader as file_loader
+from src.main import initialize_schema
+
+CONFIG_PATH = "config/config.json"
+SCHEMA_PATH = "config/schema.json"
+HEADER = "order_id,item_id,item_name,quantity,unit_price,order_date,shipping_method,discount_code"
+
+def order_csv(rows, bad_rows=()):
+    # rows listed in bad_rows get a quantity that does not convert, so the file is read twice
+    lines = [HEADER]
+    for row in range(rows):
+        quantity = "x" if row in bad_rows else str(row % 9 + 1)
+        lines.append(f"237-2033-361-{row // 3 + 1:014d},ITEM{row:04d},widget,{quantity},{row % 97 + 0.5},2024-01-01,UPS,")
+    return "\n".join(lines) + "\n"
+
+class CompressedInputTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(CONFIG_PATH, "r") as f:
+            cls.runtime_config = json.load(f)["runtime_config"]
+        cls.schema = initialize_schema(SCHEMA_PATH)
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        # small blocks, so a file takes many trips through the queue
+        patch = mock.patch.object(decompress, "DECOMPRESS_BLOCK_SIZE", 1 << 10)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def write(self, file_name, data):
+        path = os.path.join(self.work_dir, file_name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def runtime_config_for(self, csv_path, **settings):
+        runtime_config = copy.deepcopy(self.runtime_config)
+        runtime_config.update(session_id="test", log_buffer=[], csv_path=csv_path, **settings)
+        runtime_config["log_config"]["log_profile"] = ["info_general", "error_critical"]
+        return runtime_config
+
+    def load(self, csv_path):
+        return file_loader.load_csv(self.runtime_config_for(csv_path), self.schema)
+
+    def load_chunks(self, csv_path, start_index=0):
+        runtime_config = self.runtime_config_for(csv_path, chunk_size=70)
+        return pandas.concat(list(file_loader.load_csv_chunks(runtime_config, self.schema, start_index)))
+
+    def check_equivalent(self, csv_text, compressed_path):
+        plain_path = self.write("orders.csv", csv_text.encode())
+        self.assertTrue(self.load(compressed_path).equals(self.load(plain_path)))
+        self.assertTrue(self.load_chunks(compressed_path).equals(self.load_chunks(plain_path)))
+        self.assertTrue(self.load_chunks(compressed_path, 100).equals(self.load_chunks(plain_path, 100)))
+
+    def test_gzip(self):
+        for bad_rows in ((), {250}):
+            with self.subTest(bad_rows=bad_rows):
+                csv_text = order_csv(300, bad_rows)
+                self.check_equivalent(csv_text, self.write("orders.csv.gz", gzip.compress(csv_text.encode())))
+
+    def test_multi_member_gzip(self):
+        csv_text = order_csv(300)
+        split = csv_text.index("\n", len(csv_text) // 2) + 1
+        members = gzip.compress(csv_text[:split].encode()) + gzip.compress(csv_text[split:].encode())
+        self.check_equivalent(csv_text, self.write("orders.csv.gz", members))
+
+    @unittest.skipIf(importlib.util.find_spec("zstandard") is None, "zstandard is not installed")
+    def test_zstd(self):
+        import zstandard
+        csv_text = order_csv(300)
+        self.check_equivalent(csv_text, self.write("orders.csv.zst", zstandard.ZstdCompressor().compress(csv_text.encode())))
+
+    def test_zstd_without_zstandard_stops_the_load(self):
+        zstd_path = self.write("orders.csv.zst", decompress.COMPRESSION_MAGIC["zstd"] + b"\x00" * 16)
+        runtime_config = self.runtime_config_for(zstd_path)
+        with mock.patch.object(importlib.util, "find_spec", lambda name: None):
+            self.assertIsNone(file_loader.load_csv(runtime_config, self.schema))
+        errors = [entry["message"] for entry in runtime_config["log_buffer"] if entry["log_type"] == "ERROR"]
+        self.assertEqual(len(errors), 1)
+        self.assertIn("needs the zstandard package", errors[0])
+
+    def test_a_truncated_file_stops_the_load(self):
+        compressed = gzip.compress(order_csv(3000).encode())
+        gzip_path = self.write("orders.csv.gz", compressed[:len(compressed) // 2])
+        runtime_config = self.runtime_config_for(gzip_path)
+        self.assertIsNone(file_loader.load_csv(runtime_config, self.schema))
+        errors = [entry["message"] for entry in runtime_config["log_buffer"] if entry["log_type"] == "ERROR"]
+        self.assertEqual(len(errors), 1)
+        self.assertIn(f"cannot decompress {gzip_path} (gzip)", errors[0])
+
+    def test_closing_early_stops_the_thread(self):
+        gzip_path = self.write("orders.csv.gz", gzip.compress(order_csv(3000).encode()))
+        stream = decompress.DecompressedStream(gzip_path, "gzip", buffer_blocks=1)
+        self.assertEqual(stream.read(len(HEADER)), HEADER.encode())
+        stream.close()
+        self.assertFalse(stream._thread.is_alive())
+
+if __name__ == "__main__":
+    unittest.main()
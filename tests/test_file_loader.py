@@ -0,0 +1,82 @@
+# test_file_loader.py
+
+import os
+import json
+import copy
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import src.file_loader as file_loader
+from src.main import initialize_schema
+
+CONFIG_PATH = "config/config.json"
+SCHEMA_PATH = "config/schema.json"
+HEADER = "order_id,item_id,item_name,quantity,unit_price,order_date,shipping_method,discount_code"
+
+def order_csv(rows, bad_rows=()):
+    # rows listed in bad_rows get a quantity that does not convert; every 7th item name holds a
+    # quoted newline, so some cuts land inside quotes
+    lines = [HEADER]
+    for row in range(rows):
+        quantity = "x" if row in bad_rows else str(row % 9 + 1)
+        item_name = '"wid\nget"' if row % 7 == 0 else "widget"
+        lines.append(f"237-2033-361-{row // 3 + 1:014d},ITEM{row % 10000:04d},{item_name},{quantity},{row % 97 + 0.5},2024-01-01,UPS,")
+    return "\n".join(lines) + "\n"
+
+class ByteRangeParseTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(CONFIG_PATH, "r") as f:
+            cls.runtime_config = json.load(f)["runtime_config"]
+        cls.schema = initialize_schema(SCHEMA_PATH)
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        patches = [mock.patch.object(file_loader, "PARSE_RANGE_MIN_BYTES", 1 << 12),
+                   mock.patch.object(file_loader, "usable_cpus", lambda: 4)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def load(self, csv_text, parse_workers):
+        csv_path = os.path.join(self.work_dir, "orders.csv")
+        with open(csv_path, "w") as f:
+            f.write(csv_text)
+        runtime_config = copy.deepcopy(self.runtime_config)
+        runtime_config.update(session_id="test", log_buffer=[], csv_path=csv_path, parse_workers=parse_workers)
+        runtime_config["log_config"]["log_profile"] = ["info_general"]
+        raw_data = file_loader.load_csv(runtime_config, self.schema)
+        ingest_entries = [entry["message"] for entry in runtime_config["log_buffer"] if entry["log_type"] == "INGEST"]
+        return raw_data, ingest_entries
+
+    def check_equivalent(self, csv_text):
+        serial_data, serial_entries = self.load(csv_text, 1)
+        with mock.patch.object(file_loader, "read_csv_ranges", wraps=file_loader.read_csv_ranges) as read_csv_ranges:
+            range_data, range_entries = self.load(csv_text, 3)
+        self.assertTrue(read_csv_ranges.called)
+        self.assertTrue(range_data.equals(serial_data))
+        self.assertEqual(range_data.dtypes.to_dict(), serial_data.dtypes.to_dict())
+        self.assertEqual(range_entries, serial_entries)
+        return range_data, range_entries
+
+    def test_clean_file(self):
+        raw_data, ingest_entries = self.check_equivalent(order_csv(600))
+        self.assertEqual(str(raw_data["quantity"].dtype), "Int64")
+        self.assertEqual(ingest_entries, [])
+
+    def test_bad_cells_in_one_range(self):
+        raw_data, ingest_entries = self.check_equivalent(order_csv(600, bad_rows={590, 595}))
+        self.assertEqual(raw_data["quantity"].tolist()[589:591], ["5", "x"])
+        self.assertEqual(len(ingest_entries), 1)
+
+    def test_bad_cells_in_every_range(self):
+        _, ingest_entries = self.check_equivalent(order_csv(600, bad_rows=set(range(0, 600, 50))))
+        self.assertEqual(len(ingest_entries), 1)
+
+if __name__ == "__main__":
+    unittest.main()
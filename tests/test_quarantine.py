@@ -0,0 +1,86 @@
+# test_quarantine.py
+
+import io
+import os
+import csv
+import gzip
+import json
+import copy
+import shutil
+import tempfile
+import unittest
+import contextlib
+from src.file_loader import load_csv, load_csv_chunks
+from src.validator import validate_data, validate_chunks
+from src.quarantine import open_quarantine, close_quarantine
+from src.main import initialize_schema
+
+CONFIG_PATH = "config/config.json"
+SCHEMA_PATH = "config/schema.json"
+HEADER = "order_id,item_id,item_name,quantity,unit_price,order_date,shipping_method,discount_code"
+
+def order_csv():
+    # order 3 has a quantity that is not an integer, order 5 a price the limit rejects, order 8
+    # no item name and a blank line before it, and the last line no order_id
+    lines = [HEADER]
+    for number in range(1, 11):
+        quantity = "2.5" if number == 3 else "007"
+        unit_price = "-12.50" if number == 5 else "12.50"
+        item_name = "" if number == 8 else '"wid,get"'
+        if number == 8:
+            lines.append("")
+        lines.append(f"237-2033-361-{number:014d},ITEM0001,{item_name},{quantity},{unit_price},2024-01-01,UPS,")
+    lines.append(",ITEM0001,widget,007,12.50,2024-01-01,UPS,")
+    return "\n".join(lines) + "\n"
+
+class QuarantineTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(CONFIG_PATH, "r") as f:
+            cls.runtime_config = json.load(f)["runtime_config"]
+        cls.schema = initialize_schema(SCHEMA_PATH)
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.work_dir, "orders.csv")
+        with open(self.csv_path, "w") as f:
+            f.write(order_csv())
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def quarantine(self, csv_path, **settings):
+        runtime_config = copy.deepcopy(self.runtime_config)
+        runtime_config.update(session_id="test", log_buffer=[], csv_path=csv_path, **settings)
+        runtime_config["log_config"]["log_profile"] = []
+        runtime_config["log_config"]["quarantine_filename"] = os.path.join(self.work_dir, "{session_id}_QUARANTINE.{file_type}")
+        runtime_config["quarantine"] = open_quarantine(runtime_config)
+        if runtime_config.get("chunk_size"):
+            list(validate_chunks(runtime_config, self.schema, load_csv_chunks(runtime_config, self.schema)))
+        else:
+            validate_data(runtime_config, self.schema, load_csv(runtime_config, self.schema))
+        with contextlib.redirect_stdout(io.StringIO()):
+            close_quarantine(runtime_config)
+        with open(runtime_config["quarantine"]["path"], newline="") as f:
+            return list(csv.DictReader(f))
+
+    def test_rejected_rows_keep_their_source_text(self):
+        gzip_path = os.path.join(self.work_dir, "orders.csv.gz")
+        with open(self.csv_path, "rb") as f, gzip.open(gzip_path, "wb") as gzip_file:
+            shutil.copyfileobj(f, gzip_file)
+        for csv_path, settings in ((self.csv_path, {}), (self.csv_path, {"chunk_size": 4}), (gzip_path, {})):
+            with self.subTest(csv_path=os.path.basename(csv_path), **settings):
+                rejected_rows = self.quarantine(csv_path, **settings)
+                self.assertEqual(list(rejected_rows[0]), ["source_index", *HEADER.split(","),
+                                                          "reject_reason", "reject_col", "reject_rule", "reject_rule_id"])
+                self.assertEqual([(row["source_index"], row["reject_reason"], row["reject_col"]) for row in rejected_rows],
+                                 [("2", "rule", "quantity"), ("4", "rule", "unit_price"), ("7", "rule", "item_name"),
+                                  ("10", "missing_key", "order_id")])
+                self.assertEqual([(row["item_name"], row["quantity"], row["unit_price"]) for row in rejected_rows],
+                                 [("wid,get", "2.5", "12.50"), ("wid,get", "007", "-12.50"), ("", "007", "12.50"),
+                                  ("widget", "007", "12.50")])
+                self.assertEqual(rejected_rows[0]["order_id"], "237-2033-361-00000000000003")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+# test_registry.py
+
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import contextlib
+import psycopg2
+from src.main import main, initialize_config
+from src.db_pool import close_pool
+
+CONFIG_PATH = "config/config.json"
+TEST_TABLE = "test_registry_orders"
+
+def order_id(number):
+    return f"237-2033-361-{number:014d}"
+
+def order_csv(orders, changes=None):
+    # two lines per order; changes maps an order number to item_name or unit_price overrides for its first line
+    changes = changes or {}
+    lines = ["order_id,item_id,item_name,quantity,unit_price,order_date,shipping_method,discount_code"]
+    for number in orders:
+        for line in range(2):
+            change = changes.get(number, {}) if line == 0 else {}
+            lines.append(f"{order_id(number)},ITEM{line:04d},{change.get('item_name', 'widget')},"
+                         f"7,{change.get('unit_price', '12.50')},2024-01-01,UPS,")
+    return "\n".join(lines) + "\n"
+
+class RegistryGroupsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(CONFIG_PATH, "r") as f:
+            cls.config = json.load(f)
+        db_config = cls.config["db_config"]
+        try:
+            cls.conn = psycopg2.connect(host=db_config["host"], port=db_config["port"], dbname=db_config["name"],
+                                        user=db_config["user"], password=db_config["password"], connect_timeout=5)
+        except psycopg2.OperationalError as e:
+            raise unittest.SkipTest(f"database not available: {e}")
+        cls.conn.autocommit = True
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.query(f"DROP TABLE IF EXISTS {TEST_TABLE};")
+        cls.conn.close()
+
+    @classmethod
+    def query(cls, statement, params=None):
+        with cls.conn.cursor() as cur:
+            cur.execute(statement, params)
+            return cur.fetchall() if cur.description else None
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.query(f"DROP TABLE IF EXISTS {TEST_TABLE};")
+        self.query(f"CREATE TABLE {TEST_TABLE} (LIKE orders);")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def ingest(self, file_name, csv_text, **runtime_config):
+        csv_path = os.path.join(self.work_dir, file_name)
+        with open(csv_path, "w") as f:
+            f.write(csv_text)
+        config = json.loads(json.dumps(self.config))
+        config["db_config"]["table"] = TEST_TABLE
+        config["runtime_config"].update(registry_path=os.path.join(self.work_dir, "registry.sqlite"),
+                                        registry_groups=True, **runtime_config)
+        log_config = config["runtime_config"]["log_config"]
+        for log_file in ("log_filename", "stats_filename", "metrics_filename", "quarantine_filename"):
+            log_config[log_file] = os.path.join(self.work_dir, os.path.basename(log_config[log_file]))
+        config_path = os.path.join(self.work_dir, "config.json")
+        with open(config_path, "w") as f:
+            json.dump(config, f)
+        runtime_context = initialize_config(config_path)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                main(csv_path, runtime_context)
+        finally:
+            close_pool(runtime_context["db_pool"])
+        self.assertEqual(runtime_context["runtime_config"]["metrics"]["status"], "complete")
+
+    def row_versions(self):
+        # the transaction that wrote each row: a row deleted and inserted again gets a new one
+        return dict(self.query(f"SELECT order_id || '/' || item_id, xmin::text FROM {TEST_TABLE};"))
+
+    def redeliver(self, changes, **runtime_config):
+        # ingest orders 1-60, then the same orders with changes and order 61 appended, on a new registry
+        registry_path = os.path.join(self.work_dir, "registry.sqlite")
+        if os.path.exists(registry_path):
+            os.remove(registry_path)
+        self.ingest("first.csv", order_csv(range(1, 61)), **runtime_config)
+        first_versions = self.row_versions()
+        self.ingest("second.csv", order_csv(range(1, 62), changes), **runtime_config)
+        second_versions = self.row_versions()
+        rewritten = {row for row, version in first_versions.items() if second_versions.get(row) != version}
+        return {row.split("/")[0] for row in rewritten}
+
+    def test_unchanged_groups_are_skipped_when_a_column_falls_back_to_text(self):
+        # order 30's bad price leaves unit_price as text ("12.50", not 12.5) in the second file, or in its chunk
+        for runtime_config in ({"chunk_size": 0}, {"chunk_size": 25, "pipeline_depth": 0}):
+            with self.subTest(**runtime_config):
+                self.query(f"TRUNCATE {TEST_TABLE};")
+                self.assertEqual(self.redeliver({30: {"unit_price": "x"}}, **runtime_config), {order_id(30)})
+                self.assertEqual(self.query(f"SELECT count(*) FROM {TEST_TABLE} WHERE order_id = %s;", (order_id(30),))[0][0], 1)
+                self.assertEqual(self.query(f"SELECT count(*) FROM {TEST_TABLE} WHERE order_id = %s;", (order_id(61),))[0][0], 2)
+
+    def test_a_changed_group_replaces_its_rows(self):
+        for runtime_config in ({"chunk_size": 0}, {"chunk_size": 25, "pipeline_depth": 0}):
+            with self.subTest(**runtime_config):
+                self.query(f"TRUNCATE {TEST_TABLE};")
+                self.assertEqual(self.redeliver({5: {"item_name": "gadget"}}, **runtime_config), {order_id(5)})
+                self.assertEqual(self.query(f"SELECT item_name FROM {TEST_TABLE} WHERE order_id = %s ORDER BY item_id;",
+                                            (order_id(5),)), [("gadget",), ("widget",)])
+                self.assertEqual(self.query(f"SELECT count(*) FROM {TEST_TABLE};")[0][0], 122)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+# test_row_rules.py
+
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import contextlib
+from unittest import mock
+import psycopg2
+import src.checkpoint as checkpoint
+from src.main import main, initialize_config
+from src.db_pool import close_pool
+
+CONFIG_PATH = "config/config.json"
+SCHEMA_PATH = "config/schema.json"
+TEST_TABLE = "test_row_rules_orders"
+ITEMS_TABLE = "test_row_rules_items"
+CHECKPOINT_TABLE = "test_row_rules_checkpoints"
+
+def order_id(number):
+    return f"237-2033-361-{number:014d}"
+
+def order_csv(extra_lines=None, discount_codes=None):
+    # two lines per order; extra_lines maps an order number to item_ids appended to its group, and
+    # discount_codes an order number to the discount code of its first line
+    extra_lines, discount_codes = extra_lines or {}, discount_codes or {}
+    lines = ["order_id,item_id,item_name,quantity,unit_price,order_date,shipping_method,discount_code"]
+    for number in range(1, 61):
+        item_ids = [f"ITEM{line:04d}" for line in range(2)] + extra_lines.get(number, [])
+        for line, item_id in enumerate(item_ids):
+            discount_code = discount_codes.get(number, "") if line == 0 else ""
+            lines.append(f"{order_id(number)},{item_id},widget,1,1.5,2024-01-01,UPS,{discount_code}")
+    return "\n".join(lines) + "\n"
+
+class CrossRowRulesTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(CONFIG_PATH, "r") as f:
+            cls.config = json.load(f)
+        db_config = cls.config["db_config"]
+        try:
+            cls.conn = psycopg2.connect(host=db_config["host"], port=db_config["port"], dbname=db_config["name"],
+                                        user=db_config["user"], password=db_config["password"], connect_timeout=5)
+        except psycopg2.OperationalError as e:
+            raise unittest.SkipTest(f"database not available: {e}")
+        cls.conn.autocommit = True
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.query(f"DROP TABLE IF EXISTS {TEST_TABLE}, {ITEMS_TABLE}, {CHECKPOINT_TABLE};")
+        cls.conn.close()
+
+    @classmethod
+    def query(cls, statement, params=None):
+        with cls.conn.cursor() as cur:
+            cur.execute(statement, params)
+            return cur.fetchall() if cur.description else None
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.query(f"DROP TABLE IF EXISTS {TEST_TABLE}, {ITEMS_TABLE}, {CHECKPOINT_TABLE};")
+        self.query(f"CREATE TABLE {TEST_TABLE} (LIKE orders);")
+        self.query(f"CREATE TABLE {ITEMS_TABLE} (item_id TEXT);")
+        self.query(f"INSERT INTO {ITEMS_TABLE} VALUES ('ITEM0000'), ('ITEM0001');")
+        with open(SCHEMA_PATH, "r") as f:
+            schema = json.load(f)
+        schema["schema_definitions"]["item_id"]["rules"].update(
+            unique_together=["order_id"], references={"table": ITEMS_TABLE, "column": "item_id"})
+        schema["schema_definitions"]["discount_code"]["rules"]["unique"] = True
+        self.schema_path = os.path.join(self.work_dir, "schema.json")
+        with open(self.schema_path, "w") as f:
+            json.dump(schema, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def ingest(self, csv_text, **runtime_config):
+        csv_path = os.path.join(self.work_dir, "orders.csv")
+        with open(csv_path, "w") as f:
+            f.write(csv_text)
+        config = json.loads(json.dumps(self.config))
+        config["db_config"]["table"] = TEST_TABLE
+        config["schema_path"] = self.schema_path
+        config["runtime_config"].update(reference_cache_path="", checkpoint_table=CHECKPOINT_TABLE, **runtime_config)
+        log_config = config["runtime_config"]["log_config"]
+        for log_file in ("log_filename", "stats_filename", "metrics_filename", "quarantine_filename"):
+            log_config[log_file] = os.path.join(self.work_dir, os.path.basename(log_config[log_file]))
+        config_path = os.path.join(self.work_dir, "config.json")
+        with open(config_path, "w") as f:
+            json.dump(config, f)
+        runtime_context = initialize_config(config_path)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                main(csv_path, runtime_context)
+        finally:
+            close_pool(runtime_context["db_pool"])
+        return runtime_context["runtime_config"]["metrics"]["status"]
+
+    def order_rows(self, number):
+        return self.query(f"SELECT item_id, coalesce(discount_code, '') FROM {TEST_TABLE} WHERE order_id = %s ORDER BY item_id;",
+                          (order_id(number),))
+
+    def test_repeated_and_unknown_keys_are_rejected(self):
+        # order 7 has an item the items table lacks, order 20 its second item twice, and order 55
+        # the discount code order 2 used first
+        csv_text = order_csv(extra_lines={7: ["ITEM0002"], 20: ["ITEM0001"]}, discount_codes={2: "SAVE1", 55: "SAVE1"})
+        for runtime_config in ({"chunk_size": 0}, {"chunk_size": 25, "pipeline_depth": 0}):
+            with self.subTest(**runtime_config):
+                self.query(f"TRUNCATE {TEST_TABLE};")
+                self.assertEqual(self.ingest(csv_text, **runtime_config), "complete")
+                self.assertEqual(self.order_rows(7), [("ITEM0000", ""), ("ITEM0001", "")])
+                self.assertEqual(self.order_rows(20), [("ITEM0000", ""), ("ITEM0001", "")])
+                self.assertEqual(self.order_rows(2), [("ITEM0000", "SAVE1"), ("ITEM0001", "")])
+                self.assertEqual(self.order_rows(55), [("ITEM0001", "")])
+                self.assertEqual(self.query(f"SELECT count(*) FROM {TEST_TABLE};")[0][0], 119)
+
+    def test_a_resumed_run_remembers_the_keys_before_the_resume_point(self):
+        csv_text = order_csv(discount_codes={2: "SAVE1", 55: "SAVE1"})
+        write_to_db = checkpoint.write_to_db
+        calls = []
+
+        def fail_third_write(*args, **kwargs):
+            calls.append(None)
+            return False if len(calls) == 3 else write_to_db(*args, **kwargs)
+
+        with mock.patch.object(checkpoint, "write_to_db", fail_third_write):
+            self.assertEqual(self.ingest(csv_text, resumable=True, chunk_size=25), "crashed")
+        self.assertEqual(self.order_rows(2), [("ITEM0000", "SAVE1"), ("ITEM0001", "")])
+        self.assertEqual(self.order_rows(55), [])
+
+        self.assertEqual(self.ingest(csv_text, resumable=True, chunk_size=25), "complete")
+        self.assertEqual(self.order_rows(55), [("ITEM0001", "")])
+        self.assertEqual(self.query(f"SELECT count(*) FROM {TEST_TABLE};")[0][0], 119)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+# test_validation_library.py
+
+import unittest
+import pandas as pd
+import src.validation_library as vl
+from src.db_writer import copy_text_column
+
+class TemporalParsingTest(unittest.TestCase):
+
+    VALUES = ["9999-12-31", "1500-01-01", "0001-01-01", "2024-06", "20240601", "2024-02-30", "0000-01-01",
+              "2024-06-01T12:30", "2024-06-01 12:30:15.5", "2024-06-01T12:30:15+02:00", "2024-06-01T12", "", None]
+
+    def check_type(self, expected_type, accepted):
+        rule = vl.compile_datatype(expected_type)
+        parsed = vl.parse_temporal_column(expected_type, pd.Series(self.VALUES, dtype=object))
+        for test_value, column_valid in zip(self.VALUES, parsed.notna()):
+            with self.subTest(test_value=test_value):
+                scalar_valid = vl.valid_datatype(rule, test_value)["valid"]
+                # nulls pass data_type and are left to the required rule
+                self.assertEqual(scalar_valid, test_value is None or test_value in accepted)
+                self.assertEqual(column_valid, test_value in accepted)
+        return parsed
+
+    def test_date_years_outside_nanosecond_range(self):
+        parsed = self.check_type("DATE", {"9999-12-31", "1500-01-01", "0001-01-01"})
+        self.assertEqual(copy_text_column(parsed).tolist()[:3], ["9999-12-31", "1500-01-01", "0001-01-01"])
+
+    def test_timestamp_requires_full_date(self):
+        parsed = self.check_type("TIMESTAMP", {"9999-12-31", "1500-01-01", "0001-01-01",
+                                               "2024-06-01T12:30", "2024-06-01 12:30:15.5"})
+        self.assertEqual(copy_text_column(parsed).tolist()[:2], ["9999-12-31T00:00:00.000000", "1500-01-01T00:00:00.000000"])
+
+    def test_reject_message_is_short(self):
+        result = vl.valid_datatype(vl.compile_datatype("DATE"), "2024-06")
+        self.assertEqual(result["message"].format(*result["message_args"]), "not a valid DATE")
+
+if __name__ == "__main__":
+    unittest.main()